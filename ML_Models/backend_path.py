@@ -0,0 +1,15 @@
+"""Locations shared by the ML_Models scripts, resolved from this file rather than the working directory.
+
+Importing it puts backend/scripts on sys.path, so the training scripts and the
+notebook exports can import the serving modules (tree_ensemble, model_registry,
+...) whether they are run from ML_Models, the repository root or elsewhere.
+"""
+import os
+import sys
+
+ML_MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAVED_MODELS_DIR = os.path.join(ML_MODELS_DIR, 'saved_models')
+SCRIPTS_DIR = os.path.join(os.path.dirname(ML_MODELS_DIR), 'backend', 'scripts')
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.append(SCRIPTS_DIR)
@@ -163,6 +163,13 @@ print(f'Mean Squared Error: {mse_rfr}')
 print(f'Root Mean Squared Error: {rmse_rfr}')
 print(f'R-squared: {r2_rfr}')
 
+"""Export flattened ensembles for NumPy-only serving"""
+
+from backend_path import SAVED_MODELS_DIR
+from tree_ensemble import export_checked
+
+export_checked({'carbon_xgb': xgb_model, 'carbon_gbr': gbr_model, 'carbon_rf': rfr_model}, X_test, SAVED_MODELS_DIR)
+
 """Cat Boost Regressor"""
 
 # Commented out IPython magic to ensure Python compatibility.
@@ -1,4 +1,13 @@
 import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import tensorflow as tf
@@ -6,8 +15,12 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 import joblib
 
+from backend_path import ML_MODELS_DIR, SAVED_MODELS_DIR
+from profiling import PROFILER
+from model_registry import MODEL_FILES, models_dir, read_manifest, sha256_file, publish as registry_publish
+
 # Create models directory if it doesn't exist
-os.makedirs('saved_models', exist_ok=True)
+os.makedirs(SAVED_MODELS_DIR, exist_ok=True)
 
 def convert_recommendation_model():
     print("Converting Recommendation Model to TensorFlow Lite...")
@@ -34,8 +47,8 @@ def convert_recommendation_model():
     df["diet_type_encoded"] = le_diet.fit_transform(df["diet_type"])
     
     # Save the label encoders
-    joblib.dump(le_commute, 'saved_models/le_commute.pkl')
-    joblib.dump(le_diet, 'saved_models/le_diet.pkl')
+    joblib.dump(le_commute, os.path.join(SAVED_MODELS_DIR, 'le_commute.pkl'))
+    joblib.dump(le_diet, os.path.join(SAVED_MODELS_DIR, 'le_diet.pkl'))
     
     # Prepare features and target
     X = df[["commute_mode_encoded", "distance_km", "diet_type_encoded", "energy_usage_kWh"]]
@@ -43,7 +56,7 @@ def convert_recommendation_model():
     # Standardize features
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
-    joblib.dump(scaler, 'saved_models/scaler.pkl')
+    joblib.dump(scaler, os.path.join(SAVED_MODELS_DIR, 'scaler.pkl'))
     
     # Create a simple TensorFlow model that mimics the Random Forest
     model = tf.keras.Sequential([
@@ -61,7 +74,7 @@ def convert_recommendation_model():
     model.fit(X_scaled, y, epochs=10, batch_size=32, validation_split=0.2, verbose=1)
     
     # Save the TensorFlow model in Keras format
-    model.save('saved_models/recommendation_model.keras')
+    model.save(os.path.join(SAVED_MODELS_DIR, 'recommendation_model.keras'))
     
     try:
         # Convert to TensorFlow Lite
@@ -69,12 +82,12 @@ def convert_recommendation_model():
         tflite_model = converter.convert()
         
         # Save the TensorFlow Lite model
-        with open('saved_models/recommendation_model.tflite', 'wb') as f:
+        with open(os.path.join(SAVED_MODELS_DIR, 'recommendation_model.tflite'), 'wb') as f:
             f.write(tflite_model)
     except Exception as e:
         print(f"⚠️ Error converting to TFLite: {e}")
         print("Falling back to SavedModel format...")
-        model.save('saved_models/recommendation_model', save_format='tf')
+        model.save(os.path.join(SAVED_MODELS_DIR, 'recommendation_model'), save_format='tf')
     
     print("✅ Recommendation model converted to TensorFlow Lite successfully!")
 
@@ -96,10 +109,71 @@ def _quantize_converter_from_model(model, representative_data):
         print(f"⚠️ Quantization failed, falling back to float: {e}")
         return tf.lite.TFLiteConverter.from_keras_model(model).convert()
 
-def convert_recommendation_model_v2():
+def _dense_stack(n_inputs, hidden):
+    """ReLU MLP with the given hidden widths and one linear output"""
+    return tf.keras.Sequential([tf.keras.layers.Input(shape=(n_inputs,))] +
+                               [tf.keras.layers.Dense(width, activation='relu') for width in hidden] +
+                               [tf.keras.layers.Dense(1)])
+
+def _prune_magnitude(model, X, y, sparsity, epochs):
+    """Zero the smallest ``sparsity`` fraction of each hidden kernel, then fine-tune with the zeros held"""
+    masks = []
+    for layer in model.layers[:-1]:
+        kernel, bias = layer.get_weights()
+        mask = (np.abs(kernel) > np.quantile(np.abs(kernel), sparsity)).astype(kernel.dtype)
+        layer.set_weights([kernel * mask, bias])
+        masks.append((layer, mask))
+
+    class KeepPruned(tf.keras.callbacks.Callback):
+        def on_train_batch_end(self, batch, logs=None):
+            for layer, mask in masks:
+                kernel, bias = layer.get_weights()
+                layer.set_weights([kernel * mask, bias])
+
+    model.fit(X, y, epochs=epochs, batch_size=32, validation_split=0.2, verbose=0, callbacks=[KeepPruned()])
+
+def _evaluate_tflite(tflite_model, X, y, validation_split=0.2, repeats=200, batch_size=256):
+    """Hold-out MAE (the rows fit() validated on), size and CPU invoke latency of a converted model"""
+    import zlib
+    holdout = int(len(X) * (1 - validation_split))
+    X_val = np.asarray(X[holdout:], dtype=np.float32)
+    y_val = np.asarray(y[holdout:], dtype=np.float32).reshape(-1)
+    interpreter = tf.lite.Interpreter(model_content=tflite_model, num_threads=1)
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+
+    def run(features):
+        interpreter.resize_tensor_input(input_index, features.shape)
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(input_index, features)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)[:, 0]
+
+    def per_invoke_us(features):
+        run(features)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            interpreter.invoke()
+            timings.append(time.perf_counter() - started)
+        return float(np.median(timings)) * 1e6
+
+    predictions = run(X_val)
+    batch = X_val[np.arange(batch_size) % len(X_val)]
+    return {
+        'val_mae': float(np.mean(np.abs(predictions - y_val))),
+        'val_rmse': float(np.sqrt(np.mean((predictions - y_val) ** 2))),
+        'size_bytes': len(tflite_model),
+        'gzip_bytes': len(zlib.compress(tflite_model, 9)),
+        'invoke_us': per_invoke_us(X_val[:1]),
+        'batch_row_us': per_invoke_us(batch) / batch_size,
+    }
+
+def convert_recommendation_model_v2(out_dir=SAVED_MODELS_DIR, seed=42, num_samples=2000, epochs=12, hidden=(64, 32),
+                                    sparsity=0.0):
     print("Converting Recommendation Model (v2, real target) to TensorFlow Lite...")
-    np.random.seed(42)
-    num_samples = 2000
+    os.makedirs(out_dir, exist_ok=True)
+    tf.keras.utils.set_random_seed(seed)
     data = {
         "user_id": np.arange(1, num_samples + 1),
         "commute_mode": np.random.choice(["car", "bus", "bike", "walk", "train", "EV"], num_samples,
@@ -126,9 +200,9 @@ def convert_recommendation_model_v2():
     y = df["total_emission"].astype(np.float32).values.reshape(-1, 1)
 
     scaler = StandardScaler(); X_scaled = scaler.fit_transform(X)
-    joblib.dump(le_commute, 'saved_models/le_commute.pkl')
-    joblib.dump(le_diet, 'saved_models/le_diet.pkl')
-    joblib.dump(scaler, 'saved_models/scaler.pkl')
+    joblib.dump(le_commute, os.path.join(out_dir, 'le_commute.pkl'))
+    joblib.dump(le_diet, os.path.join(out_dir, 'le_diet.pkl'))
+    joblib.dump(scaler, os.path.join(out_dir, 'scaler.pkl'))
     # JSON metadata for frontend/backend JS
     import json
     rec_meta = {
@@ -138,29 +212,27 @@ def convert_recommendation_model_v2():
         'scaler_mean': getattr(scaler, 'mean_', [0,0,0,0]).tolist(),
         'scaler_scale': getattr(scaler, 'scale_', [1,1,1,1]).tolist()
     }
-    with open('saved_models/recommendation_v2_meta.json','w') as f:
+    with open(os.path.join(out_dir, 'recommendation_v2_meta.json'),'w') as f:
         json.dump(rec_meta, f)
 
-    model = tf.keras.Sequential([
-        tf.keras.layers.Input(shape=(X_scaled.shape[1],)),
-        tf.keras.layers.Dense(64, activation='relu'),
-        tf.keras.layers.Dense(32, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+    model = _dense_stack(X_scaled.shape[1], hidden)
     model.compile(optimizer='adam', loss='mse')
-    model.fit(X_scaled, y, epochs=12, batch_size=32, validation_split=0.2, verbose=0)
-    model.save('saved_models/recommendation_model_v2.keras')
+    model.fit(X_scaled, y, epochs=epochs, batch_size=32, validation_split=0.2, verbose=0)
+    if sparsity:
+        _prune_magnitude(model, X_scaled, y, sparsity, max(1, epochs // 3))
+    model.save(os.path.join(out_dir, 'recommendation_model_v2.keras'))
 
     tflite_model = _quantize_converter_from_model(model, X_scaled)
-    with open('saved_models/recommendation_model_v2.tflite', 'wb') as f:
+    with open(os.path.join(out_dir, 'recommendation_model_v2.tflite'), 'wb') as f:
         f.write(tflite_model)
-    print("✅ Recommendation v2 exported: saved_models/recommendation_model_v2.tflite")
+    print(f"✅ Recommendation v2 exported: {out_dir}/recommendation_model_v2.tflite")
+    return _evaluate_tflite(tflite_model, X_scaled, y)
 
-def convert_future_prediction_model():
+def convert_future_prediction_model(out_dir=SAVED_MODELS_DIR, seed=7, n=1500, epochs=15, hidden=(128, 64), sparsity=0.0):
     print("Converting Future Prediction surrogate (Keras MLP) to TensorFlow Lite...")
+    os.makedirs(out_dir, exist_ok=True)
     # Synthesize a small tabular dataset similar to future_prediction.py
-    np.random.seed(7)
-    n = 1500
+    tf.keras.utils.set_random_seed(seed)
     cat_cols = ['Body Type','Sex','Diet','How Often Shower','Heating Energy Source','Transport','Vehicle Type',
                 'Social Activity','Frequency of Traveling by Air','Waste Bag Size','Energy efficiency','Recycling','Cooking_With']
     num_cols = ['Monthly Grocery Bill','Vehicle Monthly Distance Km','Waste Bag Weekly Count','How Long TV PC Daily Hour',
@@ -212,10 +284,10 @@ def convert_future_prediction_model():
     ])
     X = pre.fit_transform(df)
     # Persist preprocessing pieces
-    joblib.dump(pre.named_transformers_['onehot'], 'saved_models/future_onehot.pkl')
-    joblib.dump(pre.named_transformers_['scale'], 'saved_models/future_num_scaler.pkl')
-    joblib.dump(cat_cols, 'saved_models/future_cat_cols.pkl')
-    joblib.dump(num_cols, 'saved_models/future_num_cols.pkl')
+    joblib.dump(pre.named_transformers_['onehot'], os.path.join(out_dir, 'future_onehot.pkl'))
+    joblib.dump(pre.named_transformers_['scale'], os.path.join(out_dir, 'future_num_scaler.pkl'))
+    joblib.dump(cat_cols, os.path.join(out_dir, 'future_cat_cols.pkl'))
+    joblib.dump(num_cols, os.path.join(out_dir, 'future_num_cols.pkl'))
     # JSON metadata
     import json
     onehot = pre.named_transformers_['onehot']
@@ -227,28 +299,27 @@ def convert_future_prediction_model():
         'num_scaler_mean': getattr(num_scaler, 'mean_', []).tolist(),
         'num_scaler_scale': getattr(num_scaler, 'scale_', []).tolist()
     }
-    with open('saved_models/future_meta.json','w') as f:
+    with open(os.path.join(out_dir, 'future_meta.json'),'w') as f:
         json.dump(future_meta, f)
 
-    model = tf.keras.Sequential([
-        tf.keras.layers.Input(shape=(X.shape[1],)),
-        tf.keras.layers.Dense(128, activation='relu'),
-        tf.keras.layers.Dense(64, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+    model = _dense_stack(X.shape[1], hidden)
     model.compile(optimizer='adam', loss='mse')
-    model.fit(X, y, epochs=15, batch_size=32, validation_split=0.2, verbose=0)
-    model.save('saved_models/future_prediction.keras')
+    model.fit(X, y, epochs=epochs, batch_size=32, validation_split=0.2, verbose=0)
+    if sparsity:
+        _prune_magnitude(model, X, y, sparsity, max(1, epochs // 3))
+    model.save(os.path.join(out_dir, 'future_prediction.keras'))
     tflite_model = _quantize_converter_from_model(model, X.astype(np.float32))
-    with open('saved_models/future_prediction.tflite', 'wb') as f:
+    with open(os.path.join(out_dir, 'future_prediction.tflite'), 'wb') as f:
         f.write(tflite_model)
-    print("✅ Future prediction exported: saved_models/future_prediction.tflite")
+    print(f"✅ Future prediction exported: {out_dir}/future_prediction.tflite")
+    return _evaluate_tflite(tflite_model, X, y)
 
-def convert_carbonemission_surrogate():
+def convert_carbonemission_surrogate(out_dir=SAVED_MODELS_DIR, seed=21, n=2000, epochs=15, hidden=(128, 64),
+                                     sparsity=0.0):
     print("Converting CarbonEmission surrogate (Keras MLP) to TensorFlow Lite...")
+    os.makedirs(out_dir, exist_ok=True)
     # Create a surrogate model due to CatBoost/Colab dependency
-    np.random.seed(21)
-    n = 2000
+    tf.keras.utils.set_random_seed(seed)
     df = pd.DataFrame({
         'Body Type': np.random.choice(['thin','average','overweight'], n),
         'Sex': np.random.choice(['male','female'], n),
@@ -284,10 +355,10 @@ def convert_carbonemission_surrogate():
         ('scale', SkStandardScaler(), num_cols)
     ])
     X = pre.fit_transform(df)
-    joblib.dump(pre.named_transformers_['onehot'], 'saved_models/carbon_onehot.pkl')
-    joblib.dump(pre.named_transformers_['scale'], 'saved_models/carbon_num_scaler.pkl')
-    joblib.dump(cat_cols, 'saved_models/carbon_cat_cols.pkl')
-    joblib.dump(num_cols, 'saved_models/carbon_num_cols.pkl')
+    joblib.dump(pre.named_transformers_['onehot'], os.path.join(out_dir, 'carbon_onehot.pkl'))
+    joblib.dump(pre.named_transformers_['scale'], os.path.join(out_dir, 'carbon_num_scaler.pkl'))
+    joblib.dump(cat_cols, os.path.join(out_dir, 'carbon_cat_cols.pkl'))
+    joblib.dump(num_cols, os.path.join(out_dir, 'carbon_num_cols.pkl'))
     # JSON metadata
     import json
     onehot = pre.named_transformers_['onehot']
@@ -299,28 +370,257 @@ def convert_carbonemission_surrogate():
         'num_scaler_mean': getattr(num_scaler, 'mean_', []).tolist(),
         'num_scaler_scale': getattr(num_scaler, 'scale_', []).tolist()
     }
-    with open('saved_models/carbon_meta.json','w') as f:
+    with open(os.path.join(out_dir, 'carbon_meta.json'),'w') as f:
         json.dump(carbon_meta, f)
 
-    model = tf.keras.Sequential([
-        tf.keras.layers.Input(shape=(X.shape[1],)),
-        tf.keras.layers.Dense(128, activation='relu'),
-        tf.keras.layers.Dense(64, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+    model = _dense_stack(X.shape[1], hidden)
     model.compile(optimizer='adam', loss='mse')
-    model.fit(X, y, epochs=15, batch_size=32, validation_split=0.2, verbose=0)
-    model.save('saved_models/carbonemission_surrogate.keras')
+    model.fit(X, y, epochs=epochs, batch_size=32, validation_split=0.2, verbose=0)
+    if sparsity:
+        _prune_magnitude(model, X, y, sparsity, max(1, epochs // 3))
+    model.save(os.path.join(out_dir, 'carbonemission_surrogate.keras'))
     tflite_model = _quantize_converter_from_model(model, X.astype(np.float32))
-    with open('saved_models/carbonemission_surrogate.tflite', 'wb') as f:
+    with open(os.path.join(out_dir, 'carbonemission_surrogate.tflite'), 'wb') as f:
         f.write(tflite_model)
-    print("✅ CarbonEmission surrogate exported: saved_models/carbonemission_surrogate.tflite")
+    print(f"✅ CarbonEmission surrogate exported: {out_dir}/carbonemission_surrogate.tflite")
+    return _evaluate_tflite(tflite_model, X, y)
+
+# Incremental build. Each model's artifacts are cached in saved_models/builds/<model>/<key>/, where the
+# key hashes the conversion code, its parameters and seed, and the library versions. Only models with no
+# cached build for their current key are retrained, in parallel processes; then every build is published
+# to the flat target directories (files plus build_manifest.json) and, when asked, to model registries.
+BUILD_DIR = os.path.join(SAVED_MODELS_DIR, 'builds')
+FLAT_MANIFEST = 'build_manifest.json'
+# Key/version prefix of surrogates written by distill_surrogates.py. Publishing keeps them (and the
+# carbon_meta.json the cascade and ensemble tiers were fitted on) unless asked to overwrite.
+DISTILLED_PREFIX = 'distilled-'
+
+# Registry name -> conversion function and the keyword arguments it is built with
+BUILDS = {
+    'recommendation': (convert_recommendation_model_v2,
+                       {'seed': 42, 'num_samples': 2000, 'epochs': 12, 'hidden': [64, 32], 'sparsity': 0.0}),
+    'future': (convert_future_prediction_model,
+               {'seed': 7, 'n': 1500, 'epochs': 15, 'hidden': [128, 64], 'sparsity': 0.0}),
+    'carbon': (convert_carbonemission_surrogate,
+               {'seed': 21, 'n': 2000, 'epochs': 15, 'hidden': [128, 64], 'sparsity': 0.0}),
+}
+# Helpers the conversions call, hashed into every key
+SHARED_CODE = (_quantize_converter_from_model, _dense_stack, _prune_magnitude, _evaluate_tflite)
+# Variants promoted by sweep_surrogates.py: model -> {"params": {...}} overriding BUILDS
+PROMOTED_PATH = os.path.join(ML_MODELS_DIR, 'promoted_variants.json')
+
+
+def build_params(name):
+    """BUILDS parameters of ``name`` with its promoted variant, if any, applied"""
+    params = dict(BUILDS[name][1])
+    if os.path.exists(PROMOTED_PATH):
+        with open(PROMOTED_PATH) as f:
+            params.update(json.load(f).get(name, {}).get('params', {}))
+    return params
+
+
+def build_key(name, params):
+    """Hash of everything that determines a model's artifacts"""
+    import sklearn
+    convert = BUILDS[name][0]
+    digest = hashlib.sha256()
+    for function in (convert,) + SHARED_CODE:
+        digest.update(inspect.getsource(function).encode('utf-8'))
+    versions = {'tensorflow': tf.__version__, 'sklearn': sklearn.__version__, 'numpy': np.__version__,
+                'pandas': pd.__version__}
+    digest.update(json.dumps({'params': params, 'versions': versions}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cached_build(name, key):
+    """The build record of ``name`` for ``key``, or None when it has not been built"""
+    path = os.path.join(BUILD_DIR, name, key, 'build.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _limit_threads(threads):
+    # Parallel conversions share the cores instead of each TensorFlow runtime claiming all of them
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def run_build(name, key, params):
+    """Convert one model into a staging directory, then rename it into the build cache"""
+    convert = BUILDS[name][0]
+    final = os.path.join(BUILD_DIR, name, key)
+    staging = f'{final}.{os.getpid()}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    # With ML_PROFILE set (e.g. ML_PROFILE=all), profile every conversion into ML_PROFILE_DIR
+    PROFILER.configure(every=1)
+    started = time.perf_counter()
+    with PROFILER.request(convert.__name__):
+        evaluation = convert(out_dir=staging, **params)
+    record = {
+        'model': name,
+        'key': key,
+        'function': convert.__name__,
+        'params': params,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'seconds': round(time.perf_counter() - started, 1),
+        'evaluation': evaluation,
+        'files': {file: sha256_file(os.path.join(staging, file)) for file in sorted(os.listdir(staging))},
+    }
+    with open(os.path.join(staging, 'build.json'), 'w') as f:
+        json.dump(record, f, indent=2)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(staging, final)
+    return record
+
+
+def run_builds(builds, jobs):
+    """Run ``{label: (name, key, params)}`` builds, ``jobs`` at a time -> ({label: record}, {label: error})"""
+    records, failed = {}, {}
+    jobs = max(1, min(jobs, len(builds)))
+    if jobs == 1:
+        for label, build in builds.items():
+            try:
+                records[label] = run_build(*build)
+                print(f"✅ {label} built in {records[label]['seconds']}s")
+            except Exception as e:
+                failed[label] = e
+        return records, failed
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(jobs, mp_context=context, initializer=_limit_threads, initargs=(threads,)) as pool:
+        futures = {pool.submit(run_build, *build): label for label, build in builds.items()}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                records[label] = future.result()
+                print(f"✅ {label} built in {records[label]['seconds']}s")
+            except Exception as e:
+                failed[label] = e
+    return records, failed
+
+
+def _replace_file(source, target):
+    tmp = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.{os.getpid()}.tmp')
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+def read_flat_manifest(target):
+    manifest_path = os.path.join(target, FLAT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {'models': {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_flat_manifest(target, manifest):
+    manifest_path = os.path.join(target, FLAT_MANIFEST)
+    tmp = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def _keeps_distilled(where, name, current, overwrite):
+    """True (with a note) when ``current`` is a distilled surrogate that publishing would replace"""
+    if overwrite or not str(current).startswith(DISTILLED_PREFIX):
+        return False
+    print(f"⚠️ {where}: keeping the distilled {name} surrogate ({current}); pass --overwrite to replace it")
+    return True
+
+
+def publish_flat(target, records, overwrite=False):
+    """Copy each build's files into ``target``; the manifest is rewritten last, so it only lists complete files"""
+    os.makedirs(target, exist_ok=True)
+    manifest = read_flat_manifest(target)
+    published = []
+    for name, record in records.items():
+        current = manifest['models'].get(name, {}).get('key')
+        if current == record['key'] or _keeps_distilled(target, name, current, overwrite):
+            continue
+        source = os.path.join(BUILD_DIR, name, record['key'])
+        for file in record['files']:
+            _replace_file(os.path.join(source, file), os.path.join(target, file))
+        manifest['models'][name] = {field: record[field]
+                                    for field in ('key', 'function', 'params', 'built_at', 'files')}
+        published.append(name)
+    if published:
+        write_flat_manifest(target, manifest)
+    return published
+
+
+def publish_registry(base_dir, records, overwrite=False):
+    """Publish each build as version ``build-<key>`` of a model registry (manifest swapped atomically)"""
+    manifest = read_manifest(base_dir) or {'models': {}}
+    published = []
+    for name, record in records.items():
+        version = f"build-{record['key'][:12]}"
+        current = manifest['models'].get(name, {}).get('version')
+        if current == version or _keeps_distilled(base_dir, name, current, overwrite):
+            continue
+        source = os.path.join(BUILD_DIR, name, record['key'])
+        files = MODEL_FILES[name]
+        registry_publish(name, os.path.join(source, files['model']), os.path.join(source, files['meta']),
+                         version=version, base_dir=base_dir)
+        published.append(name)
+    return published
+
 
 def main():
-    convert_recommendation_model_v2()
-    convert_future_prediction_model()
-    convert_carbonemission_surrogate()
-    print("\n🎉 All models converted successfully! See 'saved_models' directory.")
+    parser = argparse.ArgumentParser(description='Build the served TFLite models, retraining only what changed')
+    parser.add_argument('models', nargs='*', help=f"Models to build (default: all of {', '.join(BUILDS)})")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Conversions run in parallel')
+    parser.add_argument('--force', action='store_true', help='Rebuild even when a cached build matches')
+    parser.add_argument('--target', action='append',
+                        help='Flat directory to copy the artifacts into (repeatable; default: saved_models)')
+    parser.add_argument('--registry', action='append',
+                        help=f'Also publish to this model registry (repeatable), e.g. {models_dir}')
+    parser.add_argument('--no-publish', action='store_true', help='Build into the cache only')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Publish over a distilled surrogate (see distill_surrogates.py)')
+    parser.add_argument('--status', action='store_true', help='Show which models are up to date and exit')
+    args = parser.parse_args()
+    names = args.models or list(BUILDS)
+    unknown = [name for name in names if name not in BUILDS]
+    if unknown:
+        parser.error(f"Unknown models: {', '.join(unknown)} (choose from {', '.join(BUILDS)})")
+    targets = args.target or [SAVED_MODELS_DIR]
+    registries = args.registry or []
+
+    params = {name: build_params(name) for name in names}
+    keys = {name: build_key(name, params[name]) for name in names}
+    records = {name: cached_build(name, keys[name]) for name in names}
+    if args.status:
+        for name in names:
+            state = 'built' if records[name] else 'stale'
+            print(f"{name:<15} {keys[name][:12]}  {state}")
+        return
+
+    stale = {name: (name, keys[name], params[name]) for name in names if args.force or records[name] is None}
+    failed = {}
+    if stale:
+        print(f"Building {', '.join(stale)}; up to date: "
+              f"{', '.join(name for name in names if name not in stale) or 'none'}")
+        built, failed = run_builds(stale, args.jobs)
+        records.update(built)
+    else:
+        print(f"All of {', '.join(names)} up to date")
+
+    built = {name: record for name, record in records.items() if name not in failed and record}
+    if not args.no_publish:
+        for target in targets:
+            published = publish_flat(target, built, args.overwrite)
+            print(f"{target}: {'published ' + ', '.join(published) if published else 'up to date'}")
+        for base_dir in registries:
+            published = publish_registry(base_dir, built, args.overwrite)
+            print(f"{base_dir}: {'published ' + ', '.join(published) if published else 'up to date'}")
+    for name, error in failed.items():
+        print(f"⚠️ {name} failed: {error}")
+    if failed:
+        sys.exit(1)
+    print("\n🎉 All models built.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,584 @@
+"""Distill the real tree-ensemble carbon models into the served TFLite surrogate.
+
+The surrogate produced by ``convert_carbonemission_surrogate`` is fit on a
+hand-written heuristic. This script instead trains the tree ensembles from
+``carbonemission1.py`` (the teacher) on the real Carbon.csv, labels real and
+augmented samples with the teacher, and fits the same Dense(128)-Dense(64)
+MLP on those labels. The exported files keep the names and the meta layout
+the backend already reads, so ``carbon_inference.py`` needs no change.
+
+With ``--cascade`` it also fits the tier-2 gradient-boosted ensemble and the
+probe forest that backend/scripts/cascade.py escalates uncertain requests to.
+Both use the served feature layout and the same teacher labels. They are
+exported as flattened ensembles (carbon_cascade.npz, carbon_probe.npz), and
+the report adds the escalation rate and the MAE of the cascade.
+
+With ``--ensemble xgb,catboost,gbr,rf`` it fits those carbonemission1.py model
+families on the real rows in the served feature layout. It exports them for
+backend/scripts/model_ensemble.py and writes carbon_ensemble.json, weighting
+each member, and the surrogate, by its inverse MAE on a validation split of
+the training rows. That split is kept out of the teacher and the transfer set
+too, so the surrogate is weighted out of sample like the other members. The
+reported ensemble MAE is on the hold-out rows.
+
+The files are listed in saved_models/build_manifest.json as carbon version
+``distilled-<sha>``. ``convert_to_tflite.py`` then leaves them in place rather
+than publishing its heuristic carbon build over them (unless run with
+``--overwrite``). ``--registry`` publishes the surrogate to a backend model
+registry under the same version.
+
+Usage:
+    python distill_surrogates.py --data /path/to/Carbon.csv [--teachers xgb,catboost] [--cascade]
+                                 [--ensemble xgb,catboost,gbr,rf] [--registry ../backend/src/ml_models]
+"""
+
+import argparse
+import ast
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.model_selection import train_test_split
+
+from backend_path import SAVED_MODELS_DIR
+from profiling import PROFILER, parse_modes
+
+# Column layout served by backend/scripts/carbon_inference.py (see carbon_meta.json)
+SERVED_CAT_COLS = ['Body Type', 'Sex', 'Diet', 'Shower', 'Heating', 'Transport', 'Vehicle', 'Social', 'Flight',
+                   'Energy Eff', 'Recycling', 'Cooking']
+SERVED_NUM_COLS = ['Grocery', 'Vehicle Distance', 'Waste Weekly', 'TV Daily Hour', 'Clothes Monthly', 'Internet Daily']
+SERVED_SPACES = {
+    'Body Type': ['thin', 'average', 'overweight'],
+    'Sex': ['male', 'female'],
+    'Diet': ['omnivore', 'vegetarian', 'vegan'],
+    'Shower': ['daily', 'weekly'],
+    'Heating': ['gas', 'electric', 'solar', 'none'],
+    'Transport': ['car', 'bus', 'train', 'walk/bicycle', 'none'],
+    'Vehicle': ['none', 'petrol', 'diesel', 'ev'],
+    'Social': ['low', 'medium', 'high'],
+    'Flight': ['never', 'yearly', 'monthly'],
+    'Energy Eff': ['Yes', 'No'],
+    'Recycling': ['None', 'Basic', 'Full'],
+    'Cooking': ['electric', 'gas', 'wood'],
+}
+SERVED_RANGES = {
+    'Grocery': (100, 800),
+    'Vehicle Distance': (0, 2000),
+    'Waste Weekly': (0, 10),
+    'TV Daily Hour': (0, 8),
+    'Clothes Monthly': (0, 15),
+    'Internet Daily': (0, 12),
+}
+
+# Column layout of the teacher, exactly as engineered in carbonemission1.py
+TEACHER_COLUMNS = ['Body Type', 'Sex', 'Diet', 'Shower', 'Heating', 'Transport', 'Vehicle', 'Social', 'Grocery', 'Flight',
+                   'Vehicle Distance', 'Bag Size', 'Waste Weekly', 'TV Daily Hour', 'Clothes Monthly', 'Internet Daily',
+                   'Energy Eff', 'Plastic', 'Glass', 'Metal', 'Paper', 'Microwave', 'Oven', 'Stove', 'Airfryer', 'Grill']
+TEACHER_CAT_COLS = ['Body Type', 'Sex', 'Diet', 'Shower', 'Heating', 'Transport', 'Vehicle', 'Social', 'Flight', 'Bag Size',
+                    'Energy Eff', 'Plastic', 'Glass', 'Metal', 'Paper', 'Microwave', 'Oven', 'Stove', 'Airfryer', 'Grill']
+TEACHER_NUM_COLS = ['Grocery', 'Vehicle Distance', 'Waste Weekly', 'TV Daily Hour', 'Internet Daily', 'Clothes Monthly']
+RECYCLING_ITEMS = ['Plastic', 'Glass', 'Metal', 'Paper']
+COOKING_ITEMS = ['Microwave', 'Oven', 'Stove', 'Airfryer', 'Grill']
+
+# Served vocabulary -> vocabulary of the real dataset. The served schema is coarser,
+# so several entries are nearest-equivalent approximations.
+SERVED_TO_TEACHER = {
+    'Body Type': {'thin': 'underweight', 'average': 'normal', 'overweight': 'overweight'},
+    'Sex': {'male': 'male', 'female': 'female'},
+    'Diet': {'omnivore': 'omnivore', 'vegetarian': 'vegetarian', 'vegan': 'vegan'},
+    'Shower': {'daily': 'daily', 'weekly': 'less frequently'},
+    'Heating': {'gas': 'natural gas', 'electric': 'electricity', 'solar': 'electricity', 'none': 'electricity'},
+    'Transport': {'car': 'private', 'bus': 'public', 'train': 'public', 'walk/bicycle': 'walk/bicycle',
+                  'none': 'walk/bicycle'},
+    'Vehicle': {'none': 'None', 'petrol': 'petrol', 'diesel': 'diesel', 'ev': 'electric'},
+    'Social': {'low': 'never', 'medium': 'sometimes', 'high': 'often'},
+    'Flight': {'never': 'never', 'yearly': 'rarely', 'monthly': 'frequently'},
+    'Energy Eff': {'Yes': 'Yes', 'No': 'No'},
+}
+RECYCLING_TO_TEACHER = {'None': [], 'Basic': ['Paper', 'Plastic'], 'Full': ['Paper', 'Plastic', 'Glass', 'Metal']}
+COOKING_TO_TEACHER = {'electric': ['Stove', 'Microwave'], 'gas': ['Stove', 'Oven'], 'wood': ['Grill']}
+DEFAULT_BAG_SIZE = 'medium'
+
+# Real values that have no served counterpart in SERVED_TO_TEACHER
+TEACHER_TO_SERVED_EXTRA = {
+    'Body Type': {'obese': 'overweight'},
+    'Shower': {'more frequently': 'daily', 'twice a day': 'daily'},
+    'Heating': {'coal': 'gas', 'wood': 'gas'},
+    'Vehicle': {'hybrid': 'petrol', 'lpg': 'petrol'},
+    'Diet': {'pescatarian': 'omnivore'},
+    'Flight': {'very frequently': 'monthly'},
+    'Energy Eff': {'Sometimes': 'No'},
+}
+
+
+def load_real_dataset(csv_path):
+    """Load Carbon.csv with the column names and cleaning used in carbonemission1.py"""
+    df = pd.read_csv(csv_path)
+    df.columns = ['Body Type', 'Sex', 'Diet', 'Shower', 'Heating', 'Transport', 'Vehicle', 'Social', 'Grocery', 'Flight',
+                  'Vehicle Distance', 'Bag Size', 'Waste Weekly', 'TV Daily Hour', 'Clothes Monthly', 'Internet Daily',
+                  'Energy Eff', 'Recycling', 'Cooking', 'CarbonEmission']
+    df = df.replace(np.nan, 'None')
+    df['Recycling'] = df['Recycling'].apply(lambda v: ast.literal_eval(v) if isinstance(v, str) and v.startswith('[') else [])
+    df['Cooking'] = df['Cooking'].apply(lambda v: ast.literal_eval(v) if isinstance(v, str) and v.startswith('[') else [])
+    return df
+
+
+def expand_teacher_frame(df):
+    """Turn Recycling/Cooking lists into the indicator columns the teacher was trained on"""
+    df = df.copy()
+    for item in RECYCLING_ITEMS:
+        df[item] = df['Recycling'].apply(lambda x: 1 if item in x else 0)
+    for item in COOKING_ITEMS:
+        df[item] = df['Cooking'].apply(lambda x: 1 if item in x else 0)
+    return df[TEACHER_COLUMNS]
+
+
+def served_to_teacher_frame(served_df):
+    """Map rows in the served schema onto the raw teacher schema"""
+    out = pd.DataFrame(index=served_df.index)
+    for col, mapping in SERVED_TO_TEACHER.items():
+        out[col] = served_df[col].map(mapping)
+    out['Bag Size'] = DEFAULT_BAG_SIZE
+    out['Recycling'] = served_df['Recycling'].map(RECYCLING_TO_TEACHER)
+    out['Cooking'] = served_df['Cooking'].map(COOKING_TO_TEACHER)
+    for col in SERVED_NUM_COLS:
+        out[col] = served_df[col].astype(float)
+    return expand_teacher_frame(out)
+
+
+def teacher_to_served_frame(real_df):
+    """Project real dataset rows onto the served schema (nearest served category)"""
+    out = pd.DataFrame(index=real_df.index)
+    for col, mapping in SERVED_TO_TEACHER.items():
+        inverse = {}
+        for served_value, teacher_value in mapping.items():
+            inverse.setdefault(teacher_value, served_value)
+        inverse.update(TEACHER_TO_SERVED_EXTRA.get(col, {}))
+        out[col] = real_df[col].map(inverse).fillna(SERVED_SPACES[col][0])
+
+    def recycling_level(items):
+        if len(items) >= 3:
+            return 'Full'
+        return 'Basic' if items else 'None'
+
+    def cooking_kind(items):
+        if 'Grill' in items:
+            return 'wood'
+        return 'gas' if 'Oven' in items else 'electric'
+
+    out['Recycling'] = real_df['Recycling'].apply(recycling_level)
+    out['Cooking'] = real_df['Cooking'].apply(cooking_kind)
+    for col in SERVED_NUM_COLS:
+        out[col] = real_df[col].astype(float)
+    return out[SERVED_CAT_COLS + SERVED_NUM_COLS]
+
+
+class TeacherEnsemble:
+    """Label-encoded / scaled tree ensemble built the way carbonemission1.py builds it"""
+
+    def __init__(self, teachers=('xgb', 'catboost')):
+        self.teacher_names = list(teachers)
+        self.encoders = {}
+        self.scalers = {}
+        self.models = {}
+
+    def _encode(self, teacher_df):
+        X = teacher_df.copy()
+        for col in TEACHER_CAT_COLS:
+            X[col] = self.encoders[col].transform(X[col])
+        for col in TEACHER_NUM_COLS:
+            X[col] = self.scalers[col].transform(X[[col]].astype(float)).ravel()
+        return X
+
+    def fit(self, teacher_df, y):
+        for col in TEACHER_CAT_COLS:
+            self.encoders[col] = LabelEncoder().fit(teacher_df[col])
+        for col in TEACHER_NUM_COLS:
+            self.scalers[col] = StandardScaler().fit(teacher_df[[col]].astype(float))
+        X = self._encode(teacher_df)
+        for name in self.teacher_names:
+            if name == 'xgb':
+                import xgboost as xgb
+                model = xgb.XGBRegressor()
+                model.fit(X, y)
+            elif name == 'catboost':
+                import catboost as cb
+                model = cb.CatBoostRegressor(iterations=1000, learning_rate=0.1, depth=5, eval_metric='RMSE',
+                                             cat_features=[0, 1, 2, 3, 4, 5, 6], verbose=0)
+                model.fit(X, y)
+            elif name == 'gbr':
+                from sklearn.ensemble import GradientBoostingRegressor
+                model = GradientBoostingRegressor().fit(X, y)
+            elif name == 'rf':
+                from sklearn.ensemble import RandomForestRegressor
+                model = RandomForestRegressor().fit(X, y)
+            else:
+                raise ValueError(f"Unknown teacher model: {name}")
+            self.models[name] = model
+        return self
+
+    def predict(self, teacher_df):
+        X = self._encode(teacher_df)
+        preds = [np.asarray(model.predict(X), dtype=np.float64) for model in self.models.values()]
+        return np.mean(preds, axis=0)
+
+
+def random_served_samples(n, rng):
+    """Uniform draws over the served input space (same ranges as convert_carbonemission_surrogate)"""
+    data = {col: rng.choice(values, n) for col, values in SERVED_SPACES.items()}
+    for col, (low, high) in SERVED_RANGES.items():
+        data[col] = rng.uniform(low, high, n)
+    return pd.DataFrame(data)[SERVED_CAT_COLS + SERVED_NUM_COLS]
+
+
+def jittered_samples(served_df, n, rng, numeric_noise=0.1, flip_prob=0.1):
+    """Perturb real rows: relative noise on numerics and random category flips"""
+    picked = served_df.iloc[rng.integers(0, len(served_df), n)].reset_index(drop=True).copy()
+    for col in SERVED_NUM_COLS:
+        noise = rng.normal(1.0, numeric_noise, n)
+        picked[col] = np.clip(picked[col].values * noise, 0, None)
+    for col, values in SERVED_SPACES.items():
+        flip = rng.random(n) < flip_prob
+        picked.loc[flip, col] = rng.choice(values, int(flip.sum()))
+    return picked
+
+
+def build_transfer_set(real_served_df, n_random, n_jitter, seed):
+    rng = np.random.default_rng(seed)
+    parts = [real_served_df.reset_index(drop=True)]
+    if n_random:
+        parts.append(random_served_samples(n_random, rng))
+    if n_jitter:
+        parts.append(jittered_samples(real_served_df, n_jitter, rng))
+    return pd.concat(parts, ignore_index=True)
+
+
+def fit_served_preprocessing(served_df):
+    """Fit the served one-hot + scaler pair and return (transform, carbon_meta)"""
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.compose import ColumnTransformer
+
+    pre = ColumnTransformer([
+        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False), SERVED_CAT_COLS),
+        ('scale', StandardScaler(), SERVED_NUM_COLS)
+    ])
+    pre.fit(served_df)
+    onehot = pre.named_transformers_['onehot']
+    num_scaler = pre.named_transformers_['scale']
+    carbon_meta = {
+        'cat_cols': SERVED_CAT_COLS,
+        'num_cols': SERVED_NUM_COLS,
+        'onehot_categories': [c.tolist() for c in onehot.categories_],
+        'num_scaler_mean': num_scaler.mean_.tolist(),
+        'num_scaler_scale': num_scaler.scale_.tolist()
+    }
+    return pre, carbon_meta
+
+
+def train_student(X_train, y_train, epochs=40):
+    import tensorflow as tf
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(X_train.shape[1],)),
+        tf.keras.layers.Dense(128, activation='relu'),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dense(1)
+    ])
+    model.compile(optimizer='adam', loss='mse')
+    callbacks = [tf.keras.callbacks.EarlyStopping(patience=5, restore_best_weights=True)]
+    model.fit(X_train, y_train, epochs=epochs, batch_size=64, validation_split=0.1, verbose=0, callbacks=callbacks)
+    return model
+
+
+def _tflite_predict(interpreter, X):
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    interpreter.resize_tensor_input(input_details[0]['index'], list(X.shape))
+    interpreter.allocate_tensors()
+    interpreter.set_tensor(input_details[0]['index'], X.astype(np.float32))
+    interpreter.invoke()
+    return interpreter.get_tensor(output_details[0]['index'])[:, 0]
+
+
+def _time_per_call(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def measure_speedup(teacher, tflite_model, holdout_served, holdout_X, repeats=50, batch_size=256):
+    """Per-row and batched latency of teacher vs. distilled TFLite student"""
+    import tensorflow as tf
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    one_served = holdout_served.iloc[:1]
+    one_teacher = served_to_teacher_frame(one_served)
+    batch_served = holdout_served.iloc[:batch_size]
+    batch_teacher = served_to_teacher_frame(batch_served)
+    one_X = holdout_X[:1]
+    batch_X = holdout_X[:batch_size]
+
+    teacher_row = _time_per_call(lambda: teacher.predict(one_teacher), repeats)
+    teacher_batch = _time_per_call(lambda: teacher.predict(batch_teacher), max(1, repeats // 10))
+    student_row = _time_per_call(lambda: _tflite_predict(interpreter, one_X), repeats)
+    student_batch = _time_per_call(lambda: _tflite_predict(interpreter, batch_X), max(1, repeats // 10))
+    return {
+        'teacher_row_ms': teacher_row * 1000,
+        'student_row_ms': student_row * 1000,
+        'row_speedup': teacher_row / student_row,
+        'batch_size': int(len(batch_X)),
+        'teacher_batch_ms': teacher_batch * 1000,
+        'student_batch_ms': student_batch * 1000,
+        'batch_speedup': teacher_batch / student_batch,
+    }
+
+
+def fit_cascade_tiers(X_train, y_train, seed, n_estimators=300, max_depth=5):
+    """Tier-2 ensemble and probe forest for cascade.py, fitted on the served feature layout"""
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+    from tree_ensemble import export_ensemble
+    ensemble = GradientBoostingRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=seed)
+    probe = RandomForestRegressor(n_estimators=8, max_depth=6, random_state=seed)
+    return export_ensemble(ensemble.fit(X_train, y_train)), export_ensemble(probe.fit(X_train, y_train))
+
+
+def cascade_predict(ensemble, probe, X, surrogate):
+    """What cascade.py serves for X given the surrogate's predictions: (predictions, escalated, signal masks)"""
+    from cascade import uncertain_rows
+    escalate, signals = uncertain_rows(X, X.shape[1] - len(SERVED_NUM_COLS), surrogate, probe)
+    predictions = np.asarray(surrogate, dtype=np.float64).copy()
+    if escalate.any():
+        predictions[escalate] = ensemble.predict(X[escalate])
+    return predictions, escalate, signals
+
+
+# model_ensemble.py member name -> exported file (in the output directory)
+ENSEMBLE_MEMBER_FILES = {
+    'xgb': 'carbon_ens_xgb.json',
+    'catboost': 'carbon_ens_catboost.cbm',
+    'gbr': 'carbon_ens_gbr.npz',
+    'rf': 'carbon_ens_rf.npz',
+}
+
+
+def export_ensemble_members(members, X_fit, y_fit, X_val, y_val, X_hold, y_hold, surrogate_predict,
+                            out_dir=SAVED_MODELS_DIR, meta_sha256=None):
+    """Fit the members on the served layout, export them and write carbon_ensemble.json -> hold-out MAEs.
+
+    The weights come from the MAEs on ``X_val``, rows that neither the members nor the
+    surrogate (or its teacher) were fitted on, so every member, the surrogate included,
+    is weighted out of sample. The hold-out MAEs are on rows nothing was chosen on.
+    """
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+    from tree_ensemble import export_ensemble
+    validation = {'surrogate': np.asarray(surrogate_predict(X_val), dtype=np.float64)}
+    predictions = {'surrogate': np.asarray(surrogate_predict(X_hold), dtype=np.float64)}
+    for name in members:
+        path = os.path.join(out_dir, ENSEMBLE_MEMBER_FILES[name])
+        if name == 'xgb':
+            import xgboost as xgb
+            model = xgb.XGBRegressor().fit(X_fit, y_fit)
+            model.save_model(path)
+        elif name == 'catboost':
+            import catboost as cb
+            model = cb.CatBoostRegressor(iterations=1000, learning_rate=0.1, depth=5, verbose=0).fit(X_fit, y_fit)
+            model.save_model(path)
+        elif name in ('gbr', 'rf'):
+            # Depth-capped forest: the NumPy evaluator walks max_depth levels per batch
+            model = (GradientBoostingRegressor() if name == 'gbr' else RandomForestRegressor(max_depth=16))
+            model.fit(X_fit, y_fit)
+            export_ensemble(model).save(path)
+        else:
+            raise ValueError(f"Unknown ensemble member: {name}")
+        validation[name] = np.asarray(model.predict(X_val), dtype=np.float64)
+        predictions[name] = np.asarray(model.predict(X_hold), dtype=np.float64)
+    inverse = {name: 1.0 / max(float(np.mean(np.abs(p - y_val))), 1e-9) for name, p in validation.items()}
+    total = sum(inverse.values())
+    spec = {'members': [dict({'name': name, 'weight': round(inverse[name] / total, 4)},
+                             **({'path': ENSEMBLE_MEMBER_FILES[name]} if name != 'surrogate' else {}))
+                        for name in predictions]}
+    if meta_sha256 is not None:
+        spec['meta_sha256'] = meta_sha256
+    with open(os.path.join(out_dir, 'carbon_ensemble.json'), 'w') as f:
+        json.dump(spec, f, indent=2)
+    maes = {name: float(np.mean(np.abs(p - y_hold))) for name, p in predictions.items()}
+    combined = sum(inverse[name] / total * p for name, p in predictions.items())
+    maes['ensemble'] = float(np.mean(np.abs(combined - y_hold)))
+    return maes
+
+
+def record_distilled(out_dir, files, params):
+    """List the distilled carbon files in out_dir's build_manifest.json -> their ``distilled-<sha>`` version.
+
+    convert_to_tflite.py leaves a model recorded under that prefix alone (in flat
+    directories and registries) unless run with --overwrite, so a later build does
+    not replace the surrogate or the carbon_meta.json the other tiers were fitted on.
+    """
+    from convert_to_tflite import DISTILLED_PREFIX, read_flat_manifest, write_flat_manifest
+    from model_registry import sha256_file
+    hashes = {file: sha256_file(os.path.join(out_dir, file)) for file in sorted(files)
+              if os.path.isfile(os.path.join(out_dir, file))}
+    version = DISTILLED_PREFIX + hashes['carbonemission_surrogate.tflite'][:12]
+    manifest = read_flat_manifest(out_dir)
+    manifest['models']['carbon'] = {
+        'key': version,
+        'function': 'distill_carbonemission_surrogate',
+        'params': params,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': hashes,
+    }
+    write_flat_manifest(out_dir, manifest)
+    return version
+
+
+def distill_carbonemission_surrogate(csv_path, teachers=('xgb', 'catboost'), n_random=4000, n_jitter=4000,
+                                     epochs=40, seed=21, cascade=False, ensemble_members=(), out_dir=SAVED_MODELS_DIR,
+                                     registries=()):
+    print("Distilling CarbonEmission teacher ensemble into the TFLite surrogate...")
+    from convert_to_tflite import _quantize_converter_from_model
+    import tensorflow as tf
+    os.makedirs(out_dir, exist_ok=True)
+
+    real_df = load_real_dataset(csv_path)
+    y_real = real_df['CarbonEmission'].astype(float).values
+    teacher_df = expand_teacher_frame(real_df)
+    X_tr, X_te, y_tr, y_te = train_test_split(teacher_df, y_real, test_size=0.2, random_state=42)
+    if ensemble_members:
+        # Rows for the ensemble weights, kept out of the teacher, the transfer set and the members
+        X_tr, X_val, y_tr, y_val = train_test_split(X_tr, y_tr, test_size=0.2, random_state=seed)
+    teacher = TeacherEnsemble(teachers).fit(X_tr, y_tr)
+    teacher_mae = float(np.mean(np.abs(teacher.predict(X_te) - y_te)))
+    print(f"Teacher ({'+'.join(teacher.teacher_names)}) MAE vs. ground truth: {teacher_mae:.2f}")
+
+    # Transfer set: the teacher's training rows projected onto the served schema plus
+    # augmentations of them, all labelled by the teacher through the served -> teacher
+    # mapping. The X_te rows stay out so the ground-truth MAE below is on unseen rows.
+    real_served = teacher_to_served_frame(real_df)
+    real_train = real_served.loc[X_tr.index]
+    transfer = build_transfer_set(real_train, n_random, n_jitter, seed)
+    soft_labels = teacher.predict(served_to_teacher_frame(transfer)).astype(np.float32)
+
+    pre, carbon_meta = fit_served_preprocessing(transfer)
+    X = pre.transform(transfer).astype(np.float32)
+    idx_train, idx_hold = train_test_split(np.arange(len(X)), test_size=0.1, random_state=seed)
+    model = train_student(X[idx_train], soft_labels[idx_train].reshape(-1, 1), epochs=epochs)
+
+    tflite_model = _quantize_converter_from_model(model, X[idx_train])
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    student_hold = _tflite_predict(interpreter, X[idx_hold])
+    fidelity_mae = float(np.mean(np.abs(student_hold - soft_labels[idx_hold])))
+
+    # Accuracy of the student against ground truth on real rows it never saw
+    real_hold = real_served.loc[X_te.index]
+    X_real_hold = pre.transform(real_hold).astype(np.float32)
+    student_real = _tflite_predict(interpreter, X_real_hold)
+    student_mae = float(np.mean(np.abs(student_real - y_te)))
+
+    speed = measure_speedup(teacher, tflite_model, transfer.iloc[idx_hold].reset_index(drop=True), X[idx_hold])
+
+    written = ['carbonemission_surrogate.keras', 'carbonemission_surrogate.tflite', 'carbon_meta.json']
+    model.save(os.path.join(out_dir, 'carbonemission_surrogate.keras'))
+    with open(os.path.join(out_dir, 'carbonemission_surrogate.tflite'), 'wb') as f:
+        f.write(tflite_model)
+    with open(os.path.join(out_dir, 'carbon_meta.json'), 'w') as f:
+        json.dump(carbon_meta, f)
+
+    report = {
+        'teachers': teacher.teacher_names,
+        'transfer_rows': {'real': int(len(real_train)), 'random': int(n_random), 'jitter': int(n_jitter)},
+        'teacher_mae_vs_truth': teacher_mae,
+        'student_mae_vs_teacher': fidelity_mae,
+        'student_mae_vs_truth': student_mae,
+        'speed': speed,
+    }
+    # Binds the tiers and ensemble members to this carbon_meta.json (as the backend will parse
+    # it); cascade.py and model_ensemble.py fall back to the surrogate when the served meta differs
+    from model_registry import metadata_sha256
+    meta_sha256 = metadata_sha256(json.loads(json.dumps(carbon_meta)))
+    if cascade:
+        ensemble, probe = fit_cascade_tiers(X[idx_train], soft_labels[idx_train], seed)
+        ensemble.meta_sha256 = probe.meta_sha256 = meta_sha256
+        ensemble.save(os.path.join(out_dir, 'carbon_cascade.npz'))
+        probe.save(os.path.join(out_dir, 'carbon_probe.npz'))
+        written += ['carbon_cascade.npz', 'carbon_probe.npz']
+        hold_predictions, hold_escalated, signals = cascade_predict(ensemble, probe, X[idx_hold], student_hold)
+        real_predictions, real_escalated, _ = cascade_predict(ensemble, probe, X_real_hold, student_real)
+        report['cascade'] = {
+            'ensemble_trees': ensemble.n_trees,
+            'ensemble_mae_vs_teacher': float(np.mean(np.abs(ensemble.predict(X[idx_hold]) - soft_labels[idx_hold]))),
+            'cascade_mae_vs_teacher': float(np.mean(np.abs(hold_predictions - soft_labels[idx_hold]))),
+            'cascade_mae_vs_truth': float(np.mean(np.abs(real_predictions - y_te))),
+            'escalation_rate': float(hold_escalated.mean()),
+            'escalation_rate_real': float(real_escalated.mean()),
+            'reasons': {reason: int(mask.sum()) for reason, mask in signals.items()},
+        }
+    if ensemble_members:
+        X_real_train = pre.transform(real_train).astype(np.float32)
+        X_real_val = pre.transform(real_served.loc[X_val.index]).astype(np.float32)
+        report['ensemble_mae_vs_truth'] = export_ensemble_members(
+            ensemble_members, X_real_train, y_tr, X_real_val, y_val, X_real_hold, y_te,
+            lambda features: _tflite_predict(interpreter, features), out_dir, meta_sha256)
+        written += [ENSEMBLE_MEMBER_FILES[name] for name in ensemble_members] + ['carbon_ensemble.json']
+    with open(os.path.join(out_dir, 'carbon_distill_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    version = record_distilled(out_dir, written, {'teachers': teacher.teacher_names, 'n_random': n_random,
+                                                  'n_jitter': n_jitter, 'epochs': epochs, 'seed': seed})
+    for base_dir in registries:
+        from model_registry import publish
+        publish('carbon', os.path.join(out_dir, 'carbonemission_surrogate.tflite'),
+                os.path.join(out_dir, 'carbon_meta.json'), version=version, base_dir=base_dir)
+        print(f"✅ Published {version} to {base_dir}")
+
+    print(f"Fidelity (student MAE vs. teacher): {fidelity_mae:.2f}")
+    print(f"Student MAE vs. ground truth: {student_mae:.2f} (teacher {teacher_mae:.2f})")
+    print(f"Per-row speedup: {speed['row_speedup']:.1f}x "
+          f"({speed['teacher_row_ms']:.3f} ms -> {speed['student_row_ms']:.3f} ms)")
+    print(f"Batch({speed['batch_size']}) speedup: {speed['batch_speedup']:.1f}x")
+    if cascade:
+        tiers = report['cascade']
+        print(f"Cascade: {tiers['escalation_rate']:.1%} of rows escalated, MAE vs. teacher "
+              f"{tiers['cascade_mae_vs_teacher']:.2f} (surrogate {fidelity_mae:.2f}, "
+              f"ensemble {tiers['ensemble_mae_vs_teacher']:.2f})")
+        print(f"✅ Cascade tiers exported: {out_dir}/carbon_cascade.npz, {out_dir}/carbon_probe.npz")
+    if ensemble_members:
+        maes = report['ensemble_mae_vs_truth']
+        print("Ensemble MAE vs. ground truth: " + ', '.join(f"{name} {mae:.2f}" for name, mae in maes.items()))
+        print(f"✅ Ensemble members exported: {out_dir}/carbon_ensemble.json")
+    print(f"✅ Distilled surrogate exported: {out_dir}/carbonemission_surrogate.tflite ({version})")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', required=True, help='Path to the real Carbon.csv')
+    parser.add_argument('--teachers', default='xgb,catboost', help='Comma-separated: xgb, catboost, gbr, rf')
+    parser.add_argument('--random-samples', type=int, default=4000)
+    parser.add_argument('--jitter-samples', type=int, default=4000)
+    parser.add_argument('--epochs', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=21)
+    parser.add_argument('--cascade', action='store_true',
+                        help='Also export the tier-2 ensemble and probe for backend/scripts/cascade.py')
+    parser.add_argument('--ensemble', default='',
+                        help='Also export these served-layout members for backend/scripts/model_ensemble.py, '
+                             'e.g. xgb,catboost,gbr,rf')
+    parser.add_argument('--out-dir', default=SAVED_MODELS_DIR, help='Where the files are written')
+    parser.add_argument('--registry', action='append',
+                        help='Also publish the surrogate to this model registry (repeatable), '
+                             'e.g. ../backend/src/ml_models')
+    parser.add_argument('--profile', help='Profile the run: cpu,memory,rss or all (default: ML_PROFILE)')
+    parser.add_argument('--profile-dir', help='Where profiles are written (default: ML_PROFILE_DIR)')
+    args = parser.parse_args()
+    PROFILER.configure(parse_modes(args.profile) if args.profile else None, 1, args.profile_dir)
+    with PROFILER.request('distill_carbonemission_surrogate'):
+        distill_carbonemission_surrogate(args.data, teachers=args.teachers.split(','), n_random=args.random_samples,
+                                         n_jitter=args.jitter_samples, epochs=args.epochs, seed=args.seed,
+                                         cascade=args.cascade,
+                                         ensemble_members=[name for name in args.ensemble.split(',') if name],
+                                         out_dir=args.out_dir, registries=args.registry or [])
+
+
+if __name__ == "__main__":
+    main()
@@ -125,6 +125,23 @@ plt.ylabel("Predicted Emission")
 plt.title("XGBoost Prediction vs Actual")
 plt.show()
 
+"""Export flattened ensembles for NumPy-only serving"""
+
+from backend_path import SAVED_MODELS_DIR
+from tree_ensemble import export_checked
+from tree_shap import TreeExplainer
+
+feature_names = list(encoder.get_feature_names_out(cat_cols)) + num_cols
+exported = export_checked({'future_rf': rf, 'future_xgb': xgb}, X_test, SAVED_MODELS_DIR, feature_names)
+
+# Exact per-feature attributions for the boosted model, folded back into the original columns
+explainer = TreeExplainer(exported['future_xgb'])
+phi = explainer.shap_values(X_test[:5])
+folded, columns = explainer.fold(phi, cat_cols, num_cols)
+for row in folded:
+    top = np.argsort(-np.abs(row))[:3]
+    print({columns[i]: round(float(row[i]), 3) for i in top})
+
 """Simulate Lifestyle Change"""
 
 # Pick a sample user
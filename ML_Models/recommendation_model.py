@@ -72,6 +72,13 @@ y_pred = model.predict(X_test)
 
 print(f"✅ Model trained successfully! MAE: {mean_absolute_error(y_test, y_pred):.2f} kg CO₂\n")
 
+# Step 5b: Export flattened ensemble for NumPy-only serving
+
+from backend_path import SAVED_MODELS_DIR
+from tree_ensemble import export_checked
+
+export_checked({'recommendation_rf': model}, X_test, SAVED_MODELS_DIR)
+
 # Step 6: Manual User Input
 
 print("🌍 Enter your daily lifestyle details:\n")
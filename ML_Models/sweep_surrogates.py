@@ -0,0 +1,216 @@
+"""Sweep narrower, shallower and pruned variants of the served TFLite surrogates.
+
+Every variant is an ordinary ``convert_to_tflite.py`` build with its ``hidden``
+widths and ``sparsity`` overridden, so it is cached under saved_models/builds/
+like any other build and only retrained when its key changes. Each build
+records the hold-out MAE, the .tflite size (raw and gzipped) and the single-row
+and per-row batched invoke latency of the converted model; ``run`` tabulates
+them and marks the Pareto front over (val_mae, gzip_bytes, invoke_us).
+
+Pruning zeroes the smallest-magnitude weights of each hidden kernel and
+fine-tunes with the zeros held. The dense TFLite kernels do not skip zeros, so
+a pruned variant is no faster; its gain shows in the gzipped (shipped) size.
+
+``promote`` records the chosen variant in promoted_variants.json, which
+``convert_to_tflite.py`` applies on every later build, and publishes it.
+
+Usage:
+    python sweep_surrogates.py run carbon [--hidden 128x64,64x32,32x16,32,16] [--sparsity 0,0.5,0.8]
+    python sweep_surrogates.py promote carbon --max-mae-increase 0.05 [--by gzip]
+    python sweep_surrogates.py promote carbon --variant 64x32@0.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from backend_path import SAVED_MODELS_DIR
+from model_registry import models_dir
+from convert_to_tflite import (BUILDS, PROMOTED_PATH, build_key, build_params, cached_build, publish_flat,
+                               publish_registry, run_builds)
+
+SORT_FIELDS = {'size': 'size_bytes', 'gzip': 'gzip_bytes', 'latency': 'invoke_us'}
+PARETO_FIELDS = ('val_mae', 'gzip_bytes', 'invoke_us')
+
+
+def sweep_path(name):
+    return os.path.join(SAVED_MODELS_DIR, f'{name}_sweep.json')
+
+
+def variant_label(params):
+    """``64x32@0.5`` for hidden widths [64, 32] pruned to 50% sparsity"""
+    return 'x'.join(str(width) for width in params['hidden']) + f"@{params['sparsity']:g}"
+
+
+def parse_hidden(text):
+    return [[int(width) for width in spec.split('x')] for spec in text.split(',') if spec.strip()]
+
+
+def pareto_front(evaluations):
+    """Labels of the variants no other variant beats on every PARETO_FIELDS metric"""
+    front = set()
+    for label, evaluation in evaluations.items():
+        scores = [evaluation[field] for field in PARETO_FIELDS]
+        dominated = False
+        for other_label, other in evaluations.items():
+            others = [other[field] for field in PARETO_FIELDS]
+            if other_label != label and all(o <= s for o, s in zip(others, scores)) and others != scores:
+                dominated = True
+                break
+        if not dominated:
+            front.add(label)
+    return front
+
+
+def sweep(name, hiddens, sparsities, jobs=1, force=False):
+    """Build (or reuse) every hidden x sparsity variant of ``name`` and write its sweep report"""
+    variants = {}
+    for hidden in hiddens:
+        for sparsity in sparsities:
+            params = dict(build_params(name), hidden=hidden, sparsity=sparsity)
+            variants[variant_label(params)] = (params, build_key(name, params))
+    current = variant_label(build_params(name))
+    records = {label: cached_build(name, key) for label, (params, key) in variants.items()}
+    stale = {label: (name, key, params) for label, (params, key) in variants.items()
+             if force or records[label] is None or 'evaluation' not in records[label]}
+    failed = {}
+    if stale:
+        print(f"Building {len(stale)} of {len(variants)} {name} variants")
+        built, failed = run_builds(stale, jobs)
+        records.update(built)
+    for label, error in failed.items():
+        print(f"⚠️ {label} failed: {error}")
+
+    evaluations = {label: record['evaluation'] for label, record in records.items()
+                   if label not in failed and record and record.get('evaluation')}
+    front = pareto_front(evaluations)
+    report = {
+        'model': name,
+        'current': current,
+        'swept_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'pareto_fields': list(PARETO_FIELDS),
+        'variants': {label: {'key': records[label]['key'], 'params': records[label]['params'],
+                             'evaluation': evaluation, 'pareto': label in front}
+                     for label, evaluation in evaluations.items()},
+    }
+    with open(sweep_path(name), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report, failed
+
+
+def print_table(report):
+    print(f"{'variant':<16} {'size':>8} {'gzip':>8} {'invoke_us':>10} {'row_us':>8} {'val_mae':>9}  pareto")
+    rows = sorted(report['variants'].items(), key=lambda item: item[1]['evaluation']['val_mae'])
+    for label, variant in rows:
+        evaluation = variant['evaluation']
+        marker = ' (current)' if label == report['current'] else ''
+        print(f"{label:<16} {evaluation['size_bytes']:>8} {evaluation['gzip_bytes']:>8} "
+              f"{evaluation['invoke_us']:>10.1f} {evaluation['batch_row_us']:>8.2f} "
+              f"{evaluation['val_mae']:>9.4f}  {'*' if variant['pareto'] else ' '}{marker}")
+
+
+def choose_variant(report, variant=None, max_mae=None, max_mae_increase=None, by='gzip'):
+    """The named variant, or the smallest one (by ``by``) whose val_mae is within budget"""
+    variants = report['variants']
+    if variant is not None:
+        if variant not in variants:
+            raise KeyError(f"No variant {variant} in the sweep (have {', '.join(sorted(variants))})")
+        return variant
+    if max_mae is None:
+        if report['current'] not in variants:
+            raise KeyError(f"The current variant {report['current']} is not in the sweep; use --max-mae")
+        max_mae = variants[report['current']]['evaluation']['val_mae'] * (1 + max_mae_increase)
+    within = [label for label, entry in variants.items() if entry['evaluation']['val_mae'] <= max_mae]
+    if not within:
+        raise ValueError(f"No variant has val_mae <= {max_mae:.4f}")
+    field = SORT_FIELDS[by]
+    return min(within, key=lambda label: (variants[label]['evaluation'][field],
+                                          variants[label]['evaluation']['val_mae']))
+
+
+def promote(name, label, report, publish=True, targets=(SAVED_MODELS_DIR,), registries=(), overwrite=False):
+    """Record ``label`` as the variant ``convert_to_tflite.py`` builds for ``name``, and publish its build"""
+    variant = report['variants'][label]
+    promoted = {}
+    if os.path.exists(PROMOTED_PATH):
+        with open(PROMOTED_PATH) as f:
+            promoted = json.load(f)
+    promoted[name] = {
+        'variant': label,
+        'params': {'hidden': variant['params']['hidden'], 'sparsity': variant['params']['sparsity']},
+        'evaluation': variant['evaluation'],
+        'promoted_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    tmp = f'{PROMOTED_PATH}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(promoted, f, indent=2)
+    os.replace(tmp, PROMOTED_PATH)
+    if not publish:
+        return
+    record = cached_build(name, variant['key'])
+    if record is None:
+        raise FileNotFoundError(f"Build {variant['key'][:12]} of {label} is no longer cached; rerun the sweep")
+    for target in targets:
+        published = publish_flat(target, {name: record}, overwrite)
+        print(f"{target}: {'published' if published else 'did not publish'} {label}")
+    for base_dir in registries:
+        published = publish_registry(base_dir, {name: record}, overwrite)
+        print(f"{base_dir}: {'published' if published else 'did not publish'} {label}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Size/latency/accuracy sweep of the TFLite surrogates')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='Build every variant and print the Pareto table')
+    run.add_argument('model', choices=list(BUILDS))
+    run.add_argument('--hidden', default='128x64,64x32,32x16,32,16',
+                     help='Comma-separated hidden widths, layers joined by x')
+    run.add_argument('--sparsity', default='0,0.5,0.8', help='Comma-separated fractions of hidden weights to prune')
+    run.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Conversions run in parallel')
+    run.add_argument('--force', action='store_true', help='Rebuild even when a cached build matches')
+
+    prom = sub.add_parser('promote', help='Make a swept variant the one convert_to_tflite.py builds')
+    prom.add_argument('model', choices=list(BUILDS))
+    choice = prom.add_mutually_exclusive_group(required=True)
+    choice.add_argument('--variant', help='Label from the sweep table, e.g. 64x32@0.5')
+    choice.add_argument('--max-mae', type=float, help='Smallest variant with val_mae at most this')
+    choice.add_argument('--max-mae-increase', type=float,
+                        help='Smallest variant within this fraction of the current val_mae, e.g. 0.05')
+    prom.add_argument('--by', choices=list(SORT_FIELDS), default='gzip', help='What "smallest" means')
+    prom.add_argument('--target', action='append', help='Flat directory to publish to (default: saved_models)')
+    prom.add_argument('--registry', action='append',
+                      help=f'Also publish to this model registry (repeatable), e.g. {models_dir}')
+    prom.add_argument('--no-publish', action='store_true', help='Only record the promotion')
+    prom.add_argument('--overwrite', action='store_true', help='Publish over a distilled surrogate')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report, failed = sweep(args.model, parse_hidden(args.hidden),
+                               [float(s) for s in args.sparsity.split(',')], args.jobs, args.force)
+        print_table(report)
+        print(f"\nSaved {sweep_path(args.model)}")
+        if failed:
+            sys.exit(1)
+        return
+
+    path = sweep_path(args.model)
+    if not os.path.exists(path):
+        parser.error(f"No sweep for {args.model}; run 'sweep_surrogates.py run {args.model}' first")
+    with open(path) as f:
+        report = json.load(f)
+    try:
+        label = choose_variant(report, args.variant, args.max_mae, args.max_mae_increase, args.by)
+    except (KeyError, ValueError) as e:
+        parser.error(e.args[0])
+    evaluation = report['variants'][label]['evaluation']
+    print(f"Promoting {args.model} {label}: val_mae {evaluation['val_mae']:.4f}, "
+          f"{evaluation['gzip_bytes']} bytes gzipped, {evaluation['invoke_us']:.1f}us per invoke")
+    promote(args.model, label, report, not args.no_publish, args.target or [SAVED_MODELS_DIR],
+            args.registry or [], args.overwrite)
+
+
+if __name__ == '__main__':
+    main()
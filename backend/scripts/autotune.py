@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Tune TFLite interpreter threads and batch buckets for the current machine.
+
+``run`` times one interpreter per model at every thread count (default 1, 2,
+4, ... up to the usable cores) and every batch size (default 1, 8, 32, 128,
+512), invoking a batch of real preprocessed rows. For each batch size it takes
+the fastest thread count. A count within ``--tolerance`` (default 5%) of the
+fastest counts as a tie, and the tie goes to fewer threads. Neighbouring batch
+sizes with the same answer are merged into ranges:
+
+    {"hosts": {"8": {"tuned_at": "...", "models": {"carbon": {
+        "buckets": [1, 8, 32, 128, 512],
+        "ranges": [{"max_batch": 32, "num_threads": 1}, {"max_batch": 512, "num_threads": 2}],
+        "pool_size": 4,
+        "us_per_row": {"1": {"1": 19.2, "2": 25.0}, ...}}}}}}
+
+The profile is keyed by the number of usable cores, so one file
+(backend/src/ml_models/tuning_profile.json) can carry a profile for each
+host shape. A run adds or replaces the entry for the machine it runs on. The
+inference core loads the entry for its own core count at startup, or the
+closest smaller one. Each model then gets a bucketed interpreter per batch
+size with that range's thread count, and a pool of ``pool_size`` runners, so
+pool size x threads stays within the cores. Explicit ML_NUM_THREADS,
+ML_BATCH_BUCKETS or ML_POOL_SIZE settings still win.
+
+CLI:
+    python autotune.py run [--models carbon,future] [--threads 1,2,4] [--batch-sizes 1,8,32,128,512]
+    python autotune.py show
+
+Environment:
+    ML_TUNING_PROFILE   profile path, or off to ignore it (default: backend/src/ml_models/tuning_profile.json)
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+from model_registry import models_dir
+
+DEFAULT_PROFILE = models_dir / 'tuning_profile.json'
+DEFAULT_BATCH_SIZES = (1, 8, 32, 128, 512)
+
+
+def usable_cpus():
+    """Cores this process may run on (the affinity mask, which containers restrict)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def profile_path():
+    setting = os.environ.get('ML_TUNING_PROFILE', '').strip()
+    if setting.lower() in ('0', 'false', 'off'):
+        return None
+    return setting or str(DEFAULT_PROFILE)
+
+
+def read_profile(path):
+    if not path or not os.path.exists(path):
+        return {'hosts': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def host_profile(profile, cpus=None):
+    """Entry for ``cpus`` cores, else the one for the closest smaller core count, else None"""
+    cpus = cpus or usable_cpus()
+    fitting = [int(key) for key in profile.get('hosts', {}) if int(key) <= cpus]
+    return profile['hosts'][str(max(fitting))] if fitting else None
+
+
+def tuned_runner_settings(tuned):
+    """(buckets, num_threads per bucket, pool_size) from one model's tuned entry"""
+    buckets = list(tuned['buckets'])
+    threads = []
+    for size in buckets:
+        match = next((r for r in tuned['ranges'] if r['max_batch'] >= size), tuned['ranges'][-1])
+        threads.append(int(match['num_threads']))
+    return buckets, threads, int(tuned['pool_size'])
+
+
+def load_tuned_models():
+    """model -> tuned entry for this machine, or {} when there is no usable profile"""
+    entry = host_profile(read_profile(profile_path()))
+    return entry['models'] if entry else {}
+
+
+def best_threads(timings, tolerance):
+    """Fewest threads whose time is within ``tolerance`` of the fastest"""
+    fastest = min(timings.values())
+    return min(threads for threads, seconds in timings.items() if seconds <= fastest * (1 + tolerance))
+
+
+def merge_ranges(batch_sizes, choices):
+    """Per-batch-size thread choices -> [{"max_batch", "num_threads"}] with equal neighbours merged"""
+    ranges = []
+    for size, threads in zip(batch_sizes, choices):
+        if ranges and ranges[-1]['num_threads'] == threads:
+            ranges[-1]['max_batch'] = size
+        else:
+            ranges.append({'max_batch': size, 'num_threads': threads})
+    return ranges
+
+
+def tune_model(model, thread_counts, batch_sizes, min_seconds=0.3, tolerance=0.05):
+    """Time every (threads, batch size) pair for ``model`` and pick the threads per batch range"""
+    from pathlib import Path
+    from benchmark import best_median
+    from model_registry import resolve_model_files, sha256_file
+    from inference_core import ModelRunner, scoring_module
+    from sample_inputs import synthetic_rows
+
+    model_path, _ = resolve_model_files(model)
+    module = scoring_module(model)
+    features = module.preprocess_batch(synthetic_rows(model, max(batch_sizes), seed=11), module.load_metadata())
+    content = Path(model_path).read_bytes()
+    seconds = {size: {} for size in batch_sizes}
+    for threads in thread_counts:
+        runner = ModelRunner(content, num_threads=threads).warm_up()
+        for size in batch_sizes:
+            batch = features[:size]
+            runner.predict(batch)  # resize once, outside the timed calls
+            seconds[size][threads] = best_median(lambda: runner.predict(batch), min_seconds)
+    choices = [best_threads(seconds[size], tolerance) for size in batch_sizes]
+    return {
+        'model_sha256': sha256_file(model_path),
+        'buckets': list(batch_sizes),
+        'ranges': merge_ranges(batch_sizes, choices),
+        'pool_size': max(1, usable_cpus() // max(choices)),
+        'us_per_row': {str(size): {str(threads): round(value / size * 1e6, 3)
+                                   for threads, value in seconds[size].items()}
+                       for size in batch_sizes},
+    }
+
+
+def write_profile(path, profile):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp, path)
+
+
+def default_thread_counts(cpus):
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def print_entry(cpus, entry, used=False):
+    from model_registry import resolve_model_files, sha256_file
+    print(f"{cpus} cores, tuned {entry['tuned_at']} on {entry.get('machine', '?')}{' (used here)' if used else ''}")
+    for model, tuned in sorted(entry['models'].items()):
+        ranges = ', '.join(f"<= {r['max_batch']} rows: {r['num_threads']} threads" for r in tuned['ranges'])
+        model_path, _ = resolve_model_files(model)
+        stale = model_path.exists() and sha256_file(model_path) != tuned['model_sha256']
+        print(f"  {model:<15} pool {tuned['pool_size']:<3} {ranges}{'  (model changed since)' if stale else ''}")
+
+
+def main():
+    from inference_core import SCORING_MODULES
+    parser = argparse.ArgumentParser(description='Tune interpreter threads and batch buckets for this machine')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Benchmark and save the profile for this core count')
+    run_parser.add_argument('--models', default=','.join(SCORING_MODULES))
+    run_parser.add_argument('--threads', help='Comma-separated thread counts (default: 1, 2, 4, ... cores)')
+    run_parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)))
+    run_parser.add_argument('--min-seconds', type=float, default=0.3, help='Timing window per measurement')
+    run_parser.add_argument('--tolerance', type=float, default=0.05,
+                            help='Fewer threads win when within this fraction of the fastest')
+    run_parser.add_argument('--profile', default=profile_path() or str(DEFAULT_PROFILE))
+    show_parser = commands.add_parser('show', help='Print the saved profiles')
+    show_parser.add_argument('--profile', default=profile_path() or str(DEFAULT_PROFILE))
+    args = parser.parse_args()
+
+    profile = read_profile(args.profile)
+    if args.command == 'show':
+        if not profile['hosts']:
+            print(f"No tuning profile in {args.profile}")
+        used = host_profile(profile)
+        for cpus, entry in sorted(profile['hosts'].items(), key=lambda item: int(item[0])):
+            print_entry(cpus, entry, entry is used)
+        return
+
+    cpus = usable_cpus()
+    thread_counts = [int(t) for t in args.threads.split(',')] if args.threads else default_thread_counts(cpus)
+    batch_sizes = sorted(int(b) for b in args.batch_sizes.split(','))
+    models = {}
+    for model in args.models.split(','):
+        started = time.perf_counter()
+        models[model] = tune_model(model, thread_counts, batch_sizes, args.min_seconds, args.tolerance)
+        print(f"{model}: tuned in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    entry = profile['hosts'].get(str(cpus), {'models': {}})
+    entry['models'].update(models)
+    entry.update(tuned_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                 machine=f"{platform.machine()} {platform.processor() or platform.node()}".strip(),
+                 thread_counts=thread_counts)
+    profile['hosts'][str(cpus)] = entry
+    write_profile(args.profile, profile)
+    print_entry(str(cpus), entry)
+    print(f"Saved {args.profile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Adaptive micro-batching scheduler for online inference.
+
+Concurrent single-row requests for the same model are collected into one batch
+and scored with a single invoke. A batch is dispatched when it reaches
+``max_batch_size`` or its oldest request has waited ``max_wait_ms``. In adaptive
+mode (the default) the window only applies while earlier batches are still
+running; an idle model dispatches immediately, so light traffic pays no added
+latency and batching kicks in as load grows.
+
+A batch that fails with ``ValueError`` (an invalid input) is scored again one
+row at a time, so only the callers whose rows are invalid get the error.
+
+Queue-wait and batch-size histograms are kept per model to tune the trade-off.
+
+Environment:
+    ML_BATCH_MAX_SIZE     largest batch per invoke (default: 32)
+    ML_BATCH_MAX_WAIT_MS  longest a request lingers for company (default: 2)
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from inference_core import InferenceCore, SCORING_MODULES
+from inference_metrics import Histogram, BATCH_SIZE_BUCKETS
+
+
+class MicroBatcher:
+    """Collects rows for one model and scores them in batches"""
+
+    def __init__(self, score_batch, max_batch_size=32, max_wait_ms=2.0, max_in_flight=1, executor=None,
+                 adaptive=True):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max_in_flight
+        self.executor = executor
+        self.adaptive = adaptive
+        self.queue_wait = Histogram()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self._pending = []
+        self._in_flight = 0
+        self._has_work = None
+        self._slots = None
+        self._collector = None
+
+    async def submit(self, row):
+        """Score one input dict; resolves once its batch has run"""
+        loop = asyncio.get_running_loop()
+        if self._collector is None:
+            self._has_work = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._collector = loop.create_task(self._collect())
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+        self._has_work.set()
+        return await future
+
+    async def _collect(self):
+        while True:
+            if not self._pending:
+                self._has_work.clear()
+                await self._has_work.wait()
+            await self._slots.acquire()
+            if (self._in_flight > 0 or not self.adaptive) and len(self._pending) < self.max_batch_size:
+                await self._linger()
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            self._in_flight += 1
+            asyncio.get_running_loop().create_task(self._dispatch(batch))
+
+    async def _linger(self):
+        deadline = self._pending[0][2] + self.max_wait
+        while len(self._pending) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            self._has_work.clear()
+            try:
+                await asyncio.wait_for(self._has_work.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _dispatch(self, batch):
+        dispatched = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.queue_wait.observe(dispatched - enqueued)
+        self.batch_size.observe(len(batch))
+        try:
+            await self._score(batch)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_batch, [row for row, _, _ in batch])
+        except ValueError as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            # An invalid input fails the whole batch; score the rows alone so only its caller gets the error
+            for entry in batch:
+                await self._score([entry])
+            return
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'in_flight': self._in_flight,
+            'queue_wait_seconds': self.queue_wait.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+        }
+
+    def close(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+
+
+def batch_settings():
+    return {
+        'max_batch_size': int(os.environ.get('ML_BATCH_MAX_SIZE', 32)),
+        'max_wait_ms': float(os.environ.get('ML_BATCH_MAX_WAIT_MS', 2.0)),
+    }
+
+
+class BatchScheduler:
+    """One MicroBatcher per served model, all scoring through a shared InferenceCore"""
+
+    def __init__(self, core=None, names=None, **settings):
+        self.core = core or InferenceCore()
+        config = batch_settings()
+        config.update(settings)
+        workers = self.core.settings['size']
+        self.executor = ThreadPoolExecutor(max_workers=workers * len(names or SCORING_MODULES),
+                                           thread_name_prefix='ml-batch')
+        self.batchers = {
+            name: MicroBatcher(lambda rows, name=name: self.core.score(name, rows), max_in_flight=workers,
+                               executor=self.executor, **config)
+            for name in (names or SCORING_MODULES)
+        }
+
+    async def submit(self, name, row):
+        try:
+            batcher = self.batchers[name]
+        except KeyError:
+            raise ValueError(f"Unknown model: {name}")
+        return await batcher.submit(row)
+
+    def stats(self):
+        return {name: batcher.stats() for name, batcher in self.batchers.items()}
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        self.executor.shutdown(wait=False)
+        self.core.close()
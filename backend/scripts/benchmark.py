@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Microbenchmarks for the ML inference scripts.
+
+For each of carbon_inference, future_inference, recommendation_inference and
+enhanced_recommendation_inference this measures:
+
+    cold_start_seconds       ``python3 <script>.py`` end to end, imports included,
+                             as mlService runs it (median of --cold-runs)
+    peak_rss_kb              peak RSS of those cold-start processes
+    warm_single_row_seconds  preprocess + invoke + format for one row on a loaded model
+    batch_rows_per_second    the same path over batches of --batch-sizes rows
+    preprocess_seconds_per_row  preprocess_batch alone, at the same batch sizes
+
+Each run is appended to a JSON history file, so runs can be compared over time:
+
+    python benchmark.py run [--scripts carbon_inference,...] [--label before-change]
+    python benchmark.py compare [--baseline -2] [--candidate -1] [--threshold 0.1]
+
+``compare`` exits with status 1 when any metric is worse than the baseline by
+more than the threshold (latencies and memory up, throughput down).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import importlib
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import resolve_model_files
+from inference_core import ModelRunner
+from sample_inputs import default_row, synthetic_rows
+
+script_dir = Path(__file__).parent
+DEFAULT_HISTORY = Path(os.environ.get('ML_BENCH_HISTORY', script_dir.parent / 'benchmarks' / 'history.json'))
+
+# Benchmarked script -> served model it runs
+SCRIPTS = {
+    'carbon_inference': 'carbon',
+    'future_inference': 'future',
+    'recommendation_inference': 'recommendation',
+    'enhanced_recommendation_inference': 'recommendation',
+}
+
+DEFAULT_BATCH_SIZES = (1, 8, 32, 128, 512)
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) if len(samples) else 0.0
+
+
+def time_calls(fn, min_seconds=0.2, min_calls=20, max_calls=100000):
+    """Per-call wall times of ``fn()``, repeated until both minimums are met"""
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < max_calls and (len(samples) < min_calls or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def best_median(fn, min_seconds, rounds=3):
+    """Lowest median over several timing windows, which filters out bursts of background load"""
+    return min(percentile(time_calls(fn, min_seconds / rounds), 50) for _ in range(rounds))
+
+
+def cold_start(script, row, runs):
+    """Wall time and peak RSS of fresh ``python3 <script>.py`` processes"""
+    path = script_dir / f'{script}.py'
+    payload = json.dumps(row).encode('utf-8')
+    seconds, peak_rss = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, str(path)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        process.stdin.write(payload)
+        process.stdin.close()
+        output = process.stdout.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        seconds.append(time.perf_counter() - started)
+        peak_rss.append(usage.ru_maxrss)
+        if process.returncode != 0:
+            raise RuntimeError(f"{script} exited with {process.returncode}: {output.decode('utf-8')[:200]}")
+    return {
+        'cold_start_seconds': {'median': percentile(seconds, 50), 'min': min(seconds)},
+        'peak_rss_kb': max(peak_rss),
+    }
+
+
+class WarmScript:
+    """A script's preprocessing and formatting plus a loaded interpreter, as the long-running modes use them"""
+
+    def __init__(self, script):
+        self.module = importlib.import_module(script)
+        self.metadata = self.module.load_metadata()
+        model_path, _ = resolve_model_files(SCRIPTS[script])
+        self.runner = ModelRunner(Path(model_path).read_bytes()).warm_up()
+
+    def preprocess(self, rows):
+        return self.module.preprocess_batch(rows, self.metadata)
+
+    def score(self, rows):
+        predictions = self.runner.predict(self.preprocess(rows))[:, 0]
+        return [self.module.format_result(p, row, self.metadata) for p, row in zip(predictions, rows)]
+
+
+def benchmark_script(script, batch_sizes, cold_runs, min_seconds):
+    model = SCRIPTS[script]
+    results = cold_start(script, default_row(model), cold_runs) if cold_runs else {}
+    warm = WarmScript(script)
+    rows = synthetic_rows(model, max(batch_sizes), seed=7)
+
+    single = [[row] for row in rows[:64]]
+    position = iter(range(10 ** 9))
+    samples = time_calls(lambda: warm.score(single[next(position) % len(single)]), min_seconds, min_calls=50)
+    results['warm_single_row_seconds'] = {'p50': percentile(samples, 50), 'p99': percentile(samples, 99),
+                                          'mean': float(np.mean(samples))}
+
+    results['batch_rows_per_second'] = {}
+    results['preprocess_seconds_per_row'] = {}
+    for size in batch_sizes:
+        batch = rows[:size]
+        results['batch_rows_per_second'][str(size)] = size / best_median(lambda: warm.score(batch), min_seconds)
+        results['preprocess_seconds_per_row'][str(size)] = best_median(lambda: warm.preprocess(batch),
+                                                                       min_seconds) / size
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    if not Path(path).exists():
+        return {'runs': []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_history(path, history):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run(args):
+    scripts = args.scripts.split(',') if args.scripts else list(SCRIPTS)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    entry = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'label': args.label,
+        'git_commit': git_commit(),
+        'host': {'hostname': socket.gethostname(), 'platform': platform.platform(),
+                 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'settings': {'batch_sizes': batch_sizes, 'cold_runs': args.cold_runs, 'min_seconds': args.min_seconds},
+        'results': {},
+    }
+    for script in scripts:
+        print(f"benchmarking {script}...", file=sys.stderr)
+        entry['results'][script] = benchmark_script(script, batch_sizes, args.cold_runs, args.min_seconds)
+
+    history = read_history(args.history)
+    entry['id'] = len(history['runs'])
+    history['runs'].append(entry)
+    write_history(args.history, history)
+    print_run(entry)
+    print(f"\nSaved as run {entry['id']} in {args.history}")
+
+
+def flatten(results):
+    """{script: {metric: value | {key: value}}} -> {'script metric[key]': value}"""
+    flat = {}
+    for script, metrics in results.items():
+        for metric, value in metrics.items():
+            if isinstance(value, dict):
+                for key, inner in value.items():
+                    flat[f'{script} {metric}[{key}]'] = inner
+            else:
+                flat[f'{script} {metric}'] = value
+    return flat
+
+
+def higher_is_better(name):
+    return 'per_second' in name
+
+
+def print_run(entry):
+    print(f"run {entry.get('id', '-')} {entry['timestamp']} commit={entry['git_commit']} label={entry['label']}")
+    for name, value in flatten(entry['results']).items():
+        print(f"  {name:<72} {value:.6g}")
+
+
+def select_run(history, ref):
+    """A run by index (negative counts from the end) or by label"""
+    runs = history['runs']
+    try:
+        return runs[int(ref)]
+    except ValueError:
+        matches = [entry for entry in runs if entry['label'] == ref]
+        if not matches:
+            raise ValueError(f"No run labelled {ref!r}")
+        return matches[-1]
+
+
+def compare(args):
+    history = read_history(args.history)
+    if len(history['runs']) < 2 and args.baseline is None:
+        raise SystemExit("Need at least two runs in the history to compare")
+    baseline = select_run(history, args.baseline if args.baseline is not None else -2)
+    candidate = select_run(history, args.candidate)
+    base, cand = flatten(baseline['results']), flatten(candidate['results'])
+
+    print(f"baseline  run {baseline['id']} ({baseline['git_commit']}, {baseline['label']})")
+    print(f"candidate run {candidate['id']} ({candidate['git_commit']}, {candidate['label']})")
+    print(f"threshold {args.threshold:.0%}\n")
+    regressions = []
+    for name in sorted(set(base) & set(cand)):
+        if not base[name]:
+            continue
+        change = cand[name] / base[name] - 1
+        worse = -change if higher_is_better(name) else change
+        flag = 'REGRESSION' if worse > args.threshold else ('improved' if worse < -args.threshold else '')
+        if flag == 'REGRESSION':
+            regressions.append(name)
+        print(f"  {name:<72} {base[name]:>12.6g} -> {cand[name]:>12.6g} {change:+8.1%} {flag}")
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ML inference scripts')
+    parser.add_argument('--history', default=str(DEFAULT_HISTORY), help='JSON history file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Benchmark and append the results to the history')
+    run_parser.add_argument('--scripts', help=f"Comma-separated subset of: {', '.join(SCRIPTS)}")
+    run_parser.add_argument('--batch-sizes', default=','.join(str(size) for size in DEFAULT_BATCH_SIZES))
+    run_parser.add_argument('--cold-runs', type=int, default=5, help='Cold-start processes per script (0 skips)')
+    run_parser.add_argument('--min-seconds', type=float, default=0.5, help='Minimum timing window per measurement')
+    run_parser.add_argument('--label', help='Name for this run, usable in compare')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='Flag regressions between two runs')
+    compare_parser.add_argument('--baseline', help='Run index or label (default: second-to-last run)')
+    compare_parser.add_argument('--candidate', default='-1', help='Run index or label (default: last run)')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Allowed relative slowdown')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""Stream a CSV, JSON-lines or Parquet file through a model in constant memory.
+
+The input is read in chunks of ``--chunk-size`` rows. Each chunk is encoded with
+the meta-driven ``preprocess_batch`` of the model's script, scored in invokes
+of ``--batch-size`` rows and appended to the output file, whose format comes
+from its extension (otherwise the input's). After every chunk a checkpoint is
+written atomically to ``<output>.ckpt``. It records rows done, the input position and the output
+size, so an interrupted run continues where it stopped with ``--resume``. A checkpoint
+of another model version is refused rather than mixing two versions in one output.
+
+Output rows are the input columns (or ``--columns``) plus the fields of the
+script's JSON result (``emission``, ``future_emission``, ...). With ``--raw``
+they get the bare model output as ``prediction`` instead. Nested result values
+are JSON-encoded in CSV and Parquet.
+
+Parquet needs pyarrow. Parquet output is written as one part file per chunk
+next to the output and merged into the final file when the input is done.
+
+Usage:
+    python bulk_score.py carbon users.csv scored.csv [--chunk-size 10000] [--resume]
+    python bulk_score.py future profiles.parquet future.parquet --columns user_id --raw
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from inference_core import InferenceCore, scoring_module
+from wire_format import RecordLayout
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet', '.pq': 'parquet'}
+CHECKPOINT_VERSION = 1
+
+
+def detect_format(path, override=None):
+    if override:
+        return override
+    try:
+        return FORMATS[Path(path).suffix.lower()]
+    except KeyError:
+        raise ValueError(f"Cannot tell the format of {path}; pass --format csv|jsonl|parquet")
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise SystemExit("Parquet support needs pyarrow (pip install pyarrow)")
+
+
+def _tracked_lines(f):
+    """Lines of a text file, each paired with the file position right after it"""
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        yield line, f.tell()
+
+
+class TextReader:
+    """Chunks of rows from a CSV or JSON-lines file, resumable from a byte position"""
+
+    def __init__(self, path, kind, chunk_size, position=None):
+        self.f = open(path, 'r', newline='' if kind == 'csv' else None, encoding='utf-8')
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(path)
+        self.fieldnames = None
+        self.position = 0
+        if kind == 'csv':
+            self.fieldnames = next(csv.reader([self.f.readline()]))
+        if position is not None:
+            self.f.seek(position)
+        self.position = self.f.tell()
+
+    def chunks(self):
+        # Rows are parsed one physical line at a time, so after each row the last
+        # seen position is exactly where the next row starts
+        positions = []
+
+        def physical_lines():
+            for line, position in _tracked_lines(self.f):
+                positions.append(position)
+                yield line
+
+        if self.kind == 'csv':
+            rows = csv.DictReader(physical_lines(), fieldnames=self.fieldnames)
+        else:
+            rows = (json.loads(line) for line in physical_lines() if line.strip())
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                self.position = positions[-1]
+                positions.clear()
+                yield chunk
+                chunk = []
+        if chunk:
+            self.position = positions[-1] if positions else self.position
+            yield chunk
+
+    def progress(self):
+        return self.position / self.total_bytes if self.total_bytes else 1.0
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetReader:
+    """Chunks of rows from a Parquet file, resumable from a row count"""
+
+    def __init__(self, path, chunk_size, rows_done=0):
+        pa = require_pyarrow()
+        self.file = pa.parquet.ParquetFile(path)
+        self.chunk_size = chunk_size
+        self.total_rows = self.file.metadata.num_rows
+        self.fieldnames = self.file.schema_arrow.names
+        self.rows_done = rows_done
+        self.position = rows_done
+
+    def chunks(self):
+        # Skip whole row groups before the resume point, then the remainder of the first one
+        metadata = self.file.metadata
+        start_group, skip = 0, self.rows_done
+        while start_group < metadata.num_row_groups and skip >= metadata.row_group(start_group).num_rows:
+            skip -= metadata.row_group(start_group).num_rows
+            start_group += 1
+        groups = list(range(start_group, metadata.num_row_groups))
+        if not groups:
+            return
+        chunk = []
+        for batch in self.file.iter_batches(batch_size=self.chunk_size, row_groups=groups):
+            rows = batch.to_pylist()
+            if skip:
+                rows, skip = rows[skip:], max(0, skip - len(rows))
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    self.position += len(chunk)
+                    yield chunk
+                    chunk = []
+        if chunk:
+            self.position += len(chunk)
+            yield chunk
+
+    def progress(self):
+        return self.position / self.total_rows if self.total_rows else 1.0
+
+    def close(self):
+        pass
+
+
+def _flat(value):
+    return value if value is None or isinstance(value, (str, int, float, bool)) else json.dumps(value)
+
+
+class TextWriter:
+    """Appends scored rows to a CSV or JSON-lines file; ``size`` is what a checkpoint records"""
+
+    def __init__(self, path, kind, truncate_to=None):
+        self.path = path
+        self.kind = kind
+        mode = 'r+' if truncate_to is not None else 'w'
+        self.f = open(path, mode, newline='' if kind == 'csv' else None, encoding='utf-8')
+        if truncate_to is not None:
+            # Drop anything written after the last checkpoint
+            self.f.seek(truncate_to)
+            self.f.truncate()
+        self.writer = None
+        self.fieldnames = None
+
+    def write(self, rows):
+        if self.kind == 'jsonl':
+            self.f.writelines(json.dumps(row) + '\n' for row in rows)
+            return
+        if self.writer is None:
+            self.fieldnames = list(rows[0].keys())
+            self.writer = csv.DictWriter(self.f, fieldnames=self.fieldnames, extrasaction='ignore')
+            if self.f.tell() == 0:
+                self.writer.writeheader()
+        self.writer.writerows({key: _flat(value) for key, value in row.items()} for row in rows)
+
+    def commit(self):
+        """Make the chunk durable and return the file size to checkpoint"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+    def finish(self):
+        self.f.close()
+
+
+class ParquetWriter:
+    """One part file per chunk, merged row group by row group into the output at the end"""
+
+    def __init__(self, path, truncate_to=None):
+        self.pa = require_pyarrow()
+        self.path = Path(path)
+        self.parts_dir = self.path.with_name(self.path.name + '.parts')
+        self.parts_dir.mkdir(exist_ok=True)
+        self.parts = sorted(self.parts_dir.glob('part-*.parquet'))
+        if truncate_to is not None:
+            # Parts beyond the checkpoint belong to a chunk that was not committed
+            for part in self.parts[truncate_to:]:
+                part.unlink()
+            self.parts = self.parts[:truncate_to]
+        else:
+            for part in self.parts:
+                part.unlink()
+            self.parts = []
+        self.pending = None
+
+    def write(self, rows):
+        table = self.pa.Table.from_pylist([{key: _flat(value) for key, value in row.items()} for row in rows])
+        part = self.parts_dir / f'part-{len(self.parts):06d}.parquet'
+        self.pa.parquet.write_table(table, str(part) + '.tmp')
+        self.pending = part
+
+    def commit(self):
+        os.replace(str(self.pending) + '.tmp', self.pending)
+        self.parts.append(self.pending)
+        self.pending = None
+        return len(self.parts)
+
+    def finish(self):
+        if not self.parts:
+            return
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        writer = None
+        for part in self.parts:
+            table = self.pa.parquet.read_table(part)
+            if writer is None:
+                writer = self.pa.parquet.ParquetWriter(str(tmp_path), table.schema)
+            writer.write_table(table.cast(writer.schema))
+        writer.close()
+        os.replace(tmp_path, self.path)
+        for part in self.parts:
+            part.unlink()
+        self.parts_dir.rmdir()
+
+
+class BulkScorer:
+    """Preprocess, score and format chunks of input dicts for one model"""
+
+    def __init__(self, model, batch_size=512, raw=False, columns=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.raw = raw
+        self.columns = columns
+        self.core = InferenceCore(names=[model], watch=False, size=1)
+        self.module = scoring_module(model)
+        self.snapshot = self.core.model(model)
+        self.numeric_fields = [field for field, _ in RecordLayout(model, self.snapshot.metadata).numerical]
+
+    def _typed(self, row):
+        """CSV gives strings: convert numeric inputs, and treat empty cells as missing"""
+        typed = {key: value for key, value in row.items() if value != '' and value is not None}
+        for field in self.numeric_fields:
+            if isinstance(typed.get(field), str):
+                typed[field] = float(typed[field])
+        return typed
+
+    def predict(self, rows):
+        """(typed inputs, raw model outputs) for a chunk of rows"""
+        inputs = [self._typed(row) for row in rows]
+        features = self.module.preprocess_batch(inputs, self.snapshot.metadata)
+        predictions = np.concatenate([self.snapshot.handle.predict(features[start:start + self.batch_size])[:, 0]
+                                      for start in range(0, len(features), self.batch_size)])
+        return inputs, predictions
+
+    def score(self, rows):
+        inputs, predictions = self.predict(rows)
+        scored = []
+        for row, data, prediction in zip(rows, inputs, predictions):
+            out = {key: row.get(key) for key in self.columns} if self.columns else dict(row)
+            if self.raw:
+                out['prediction'] = float(prediction)
+            else:
+                out.update(self.module.format_result(prediction, data, self.snapshot.metadata))
+            scored.append(out)
+        return scored
+
+    def close(self):
+        self.core.close()
+
+
+def read_checkpoint(path):
+    if not Path(path).exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, state):
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run(args):
+    in_kind = detect_format(args.input, args.format)
+    # The output follows its own extension, or the input's format when it has none we know
+    out_kind = args.format or FORMATS.get(Path(args.output).suffix.lower(), in_kind)
+    checkpoint_path = args.checkpoint or args.output + '.ckpt'
+    state = read_checkpoint(checkpoint_path) if args.resume else None
+    if state is not None:
+        if state['version'] != CHECKPOINT_VERSION or state['input'] != os.path.abspath(args.input) or \
+                state['model'] != args.model:
+            raise SystemExit(f"{checkpoint_path} belongs to a different run; remove it or drop --resume")
+        if state.get('done'):
+            print(f"{args.output} is already complete ({state['rows_done']} rows)", file=sys.stderr)
+            return
+    rows_done = state['rows_done'] if state else 0
+    scorer = BulkScorer(args.model, args.batch_size, args.raw, args.columns.split(',') if args.columns else None)
+    if state is not None and scorer.snapshot.version != state['model_version']:
+        # Checked before the output is reopened, which would truncate it to the checkpoint
+        scorer.close()
+        raise SystemExit(f"{checkpoint_path} was scored with {args.model} {state['model_version']}, now "
+                         f"{scorer.snapshot.version}; remove it and rerun, or drop --resume")
+
+    if in_kind == 'parquet':
+        reader = ParquetReader(args.input, args.chunk_size, rows_done)
+    else:
+        reader = TextReader(args.input, in_kind, args.chunk_size, state['input_position'] if state else None)
+    if out_kind == 'parquet':
+        writer = ParquetWriter(args.output, state['output_position'] if state else None)
+    else:
+        writer = TextWriter(args.output, out_kind, state['output_position'] if state else None)
+
+    started = time.perf_counter()
+    resumed_at = rows_done
+    last_report = 0.0
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'model': args.model,
+        'model_version': scorer.snapshot.version,
+        'input': os.path.abspath(args.input),
+        'output': os.path.abspath(args.output),
+    }
+    if state:
+        print(f"resuming after {rows_done} rows", file=sys.stderr)
+    try:
+        for chunk in reader.chunks():
+            writer.write(scorer.score(chunk))
+            rows_done += len(chunk)
+            output_position = writer.commit()
+            input_position = reader.position if in_kind != 'parquet' else rows_done
+            write_checkpoint(checkpoint_path, dict(checkpoint, rows_done=rows_done, input_position=input_position,
+                                                   output_position=output_position))
+            elapsed = time.perf_counter() - started
+            if elapsed - last_report >= args.progress_interval:
+                last_report = elapsed
+                print(f"{rows_done} rows  {(rows_done - resumed_at) / elapsed:,.0f} rows/s  "
+                      f"{reader.progress():.1%}  {elapsed:.1f}s", file=sys.stderr)
+        writer.finish()
+        write_checkpoint(checkpoint_path, dict(checkpoint, rows_done=rows_done, input_position=None,
+                                               output_position=None, done=True))
+    finally:
+        reader.close()
+        scorer.close()
+    elapsed = time.perf_counter() - started
+    print(f"done: {rows_done} rows ({rows_done - resumed_at} this run) in {elapsed:.1f}s, "
+          f"{(rows_done - resumed_at) / elapsed if elapsed else 0:,.0f} rows/s -> {args.output}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a CSV/JSONL/Parquet file in streaming chunks')
+    parser.add_argument('model', choices=['carbon', 'future', 'recommendation'])
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='Override extension-based detection')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows read, scored and written at a time')
+    parser.add_argument('--batch-size', type=int, default=512, help='Rows per interpreter invoke')
+    parser.add_argument('--columns', help='Input columns to copy to the output (default: all)')
+    parser.add_argument('--raw', action='store_true', help='Write the bare model output as "prediction"')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.ckpt)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint')
+    parser.add_argument('--progress-interval', type=float, default=2.0, help='Seconds between progress lines')
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Tiered scoring: the TFLite surrogate answers, a tree ensemble takes the rows it is unsure of.
+
+For a model listed in ``ML_CASCADE`` the inference core scores every batch with
+the pooled surrogate (tier 1) as usual, then re-scores only the uncertain rows
+with a flattened tree ensemble fitted on the same feature layout (tier 2,
+``<model>_cascade.npz``, see tree_ensemble.py). A row is uncertain when
+
+    out_of_range   a numeric input is more than ``ML_CASCADE_Z`` training standard
+                   deviations from the training mean (the meta scalers), where the
+                   surrogate extrapolates
+    unknown        a categorical value is not one of the training categories (it
+                   was scored as the first one); needs the raw input dicts, so the
+                   binary protocol skips it
+    disagreement   the surrogate and a small probe forest (``<model>_probe.npz``,
+                   optional) differ by more than ``ML_CASCADE_DISAGREEMENT`` of the
+                   probe's prediction; checked only for rows the other signals kept
+
+The signals come from the feature matrix tier 1 already built, so a request that
+is not escalated only pays for a few vectorized comparisons, plus the probe walk
+when there is one (about 100us per batch for 8 trees of depth 6, so the probe
+suits batched traffic best). Every row tier 1 keeps is a tier 1 hit; the report gives the
+hit rate of each tier, how often each signal fired and the latency of each tier,
+per row and per batch:
+
+    python cascade.py eval carbon [--input rows.jsonl | --rows 2000] [--batch-size 32]
+
+scores a sample both ways and also reports how far the cascade is from scoring
+everything with the ensemble. The inference server returns the live report from
+its ``stats`` and ``cascade`` ops. ``distill_surrogates.py --cascade`` fits and
+exports the carbon ensemble and probe.
+
+The ensemble files are looked up again whenever the registry serves a new
+version of the model; a model without one is served by tier 1 alone. So is a
+model whose files were fitted on another feature layout: a different width, or
+a ``meta_sha256`` that does not match the served meta file (logged once per
+version). Files exported without ``meta_sha256`` are only checked for width.
+
+Environment:
+    ML_CASCADE               comma-separated models to cascade, e.g. carbon (default: unset, off)
+    ML_CASCADE_DIR           directory with the <model>_cascade.npz / <model>_probe.npz files
+                             (default: backend/src/ml_models)
+    ML_CASCADE_Z             |z| above which a numeric input is out of range (default: 3)
+    ML_CASCADE_DISAGREEMENT  relative surrogate/probe gap that escalates a row (default: 0.15)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from model_registry import models_dir, metadata_sha256
+from inference_metrics import StageStats
+from tree_ensemble import TreeEnsemble
+
+REASONS = ('out_of_range', 'unknown', 'disagreement')
+# Keeps the relative disagreement finite for predictions near zero
+DISAGREEMENT_FLOOR = 1e-6
+
+
+def uncertain_rows(features, n_onehot, surrogate, probe=None, z_limit=3.0, disagreement=0.15, unknown=None):
+    """Boolean escalation mask over the rows of ``features`` and the mask of each signal.
+
+    The probe ensemble only walks the rows the cheaper signals did not already escalate.
+    """
+    signals = {'out_of_range': np.abs(features[:, n_onehot:]).max(axis=1) > z_limit}
+    if unknown is not None:
+        signals['unknown'] = np.asarray(unknown, dtype=bool)
+    escalate = np.zeros(len(features), dtype=bool)
+    for mask in signals.values():
+        escalate |= mask
+    if probe is not None and not escalate.all():
+        rest = np.flatnonzero(~escalate)
+        predicted = probe.predict(features[rest])
+        gap = np.abs(surrogate[rest] - predicted) > disagreement * np.maximum(np.abs(predicted), DISAGREEMENT_FLOOR)
+        signals['disagreement'] = np.zeros(len(features), dtype=bool)
+        signals['disagreement'][rest[gap]] = True
+        escalate |= signals['disagreement']
+    return escalate, signals
+
+
+class ModelCascade:
+    """Tier-2 ensemble, optional probe and counters for one served model version"""
+
+    def __init__(self, model, snapshot, directory):
+        from wire_format import RecordLayout
+        self.model = model
+        self.version = snapshot.version
+        self.layout = RecordLayout(model, snapshot.metadata)
+        self.n_onehot = self.layout.n_onehot if self.layout.one_hot else 0
+        self.known = [(field, default, frozenset(categories)) for field, categories, default in self.layout.categorical]
+        self.meta_sha256 = metadata_sha256(snapshot.metadata)
+        self.problem = None  # why a present ensemble is not used
+        try:
+            self.ensemble = self._load(os.path.join(directory, f'{model}_cascade.npz'))
+            self.probe = self._load(os.path.join(directory, f'{model}_probe.npz')) if self.ensemble else None
+        except ValueError as e:
+            self.ensemble = self.probe = None
+            self.problem = str(e)
+        self.batches = 0
+        self.reasons = dict.fromkeys(REASONS, 0)
+        self.surrogate = StageStats()  # every row passes tier 1; its hits are the rows it keeps
+        self.escalated = StageStats()
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        ensemble = TreeEnsemble.load(path)
+        if ensemble.n_features != self.layout.n_features:
+            raise ValueError(f"{path} expects {ensemble.n_features} features; {self.model} "
+                             f"{self.version} has {self.layout.n_features}")
+        if ensemble.meta_sha256 is not None and ensemble.meta_sha256 != self.meta_sha256:
+            raise ValueError(f"{path} was fitted on different {self.model} metadata than {self.version}")
+        return ensemble
+
+    def unknown(self, rows):
+        # Plain Python: micro-batches are mostly a row or two, too few for NumPy to pay off
+        return np.array([any(row.get(field, default) not in known for field, default, known in self.known)
+                         for row in rows], dtype=bool)
+
+    def report(self):
+        rows = self.surrogate.rows
+        surrogate = self.surrogate.report(rows)
+        surrogate['hit_rate'] = round(1 - self.escalated.rows / rows, 4) if rows else 0.0
+        return {
+            'version': self.version,
+            'rows': rows,
+            'batches': self.batches,
+            'tiers': {'surrogate': surrogate, 'ensemble': self.escalated.report(rows)},
+            'reasons': dict(self.reasons),
+            'problem': self.problem,
+            'ensemble': None if self.ensemble is None else {
+                'trees': self.ensemble.n_trees, 'source': self.ensemble.source,
+                'probe_trees': self.probe.n_trees if self.probe is not None else 0},
+        }
+
+
+class Cascade:
+    """ModelCascade per cascaded model; one per process (``CASCADE``)"""
+
+    def __init__(self, models=(), directory=models_dir, z_limit=3.0, disagreement=0.15):
+        self.models = set(models)
+        self.directory = str(directory)
+        self.z_limit = z_limit
+        self.disagreement = disagreement
+        self.cascades = {}  # model -> ModelCascade of the version being served
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        models = [name.strip() for name in os.environ.get('ML_CASCADE', '').split(',') if name.strip()]
+        return cls(models, directory=os.environ.get('ML_CASCADE_DIR') or models_dir,
+                   z_limit=float(os.environ.get('ML_CASCADE_Z', 3.0)),
+                   disagreement=float(os.environ.get('ML_CASCADE_DISAGREEMENT', 0.15)))
+
+    @property
+    def enabled(self):
+        return bool(self.models)
+
+    def covers(self, model):
+        return model in self.models
+
+    def _cascade(self, model, snapshot):
+        cascade = self.cascades.get(model)
+        if cascade is None or cascade.version != snapshot.version:
+            with self._lock:
+                cascade = self.cascades.get(model)
+                if cascade is None or cascade.version != snapshot.version:
+                    cascade = self.cascades[model] = ModelCascade(model, snapshot, self.directory)
+                    if cascade.ensemble is None:
+                        reason = cascade.problem or f"no {model}_cascade.npz in {self.directory}"
+                        print(f"cascade: {reason}; serving {model} from tier 1", file=sys.stderr)
+        return cascade
+
+    def predict(self, model, snapshot, features, rows=None, timeout=None, timer=None):
+        """Tier-1 predictions for ``features`` with the uncertain rows replaced by the ensemble's, shape (N,)"""
+        cascade = self._cascade(model, snapshot)
+        started = time.perf_counter()
+        predictions = snapshot.handle.predict(features, timeout)[:, 0]
+        if cascade.ensemble is None:
+            cascade.surrogate.record(len(features), time.perf_counter() - started)
+            return predictions
+        unknown = cascade.unknown(rows) if rows is not None else None
+        escalate, signals = uncertain_rows(features, cascade.n_onehot, predictions, cascade.probe, self.z_limit,
+                                           self.disagreement, unknown)
+        checked = time.perf_counter()
+        count = int(escalate.sum())
+        if count:
+            predictions = predictions.astype(np.float64)
+            predictions[escalate] = cascade.ensemble.predict(features[escalate])
+        finished = time.perf_counter()
+        if timer is not None:
+            timer.record('invoke', checked - started)
+            timer.record('escalate', finished - checked)
+        with self._lock:
+            cascade.batches += 1
+            for reason, mask in signals.items():
+                cascade.reasons[reason] += int(mask.sum())
+            cascade.surrogate.record(len(features), checked - started)
+            if count:
+                cascade.escalated.record(count, finished - checked)
+        return predictions
+
+    def report(self):
+        with self._lock:
+            cascades = sorted(self.cascades.items())
+        return {model: dict(cascade.report(), z_limit=self.z_limit, disagreement=self.disagreement)
+                for model, cascade in cascades}
+
+
+CASCADE = Cascade.from_env()
+
+
+def _read_rows(path):
+    with open(path) as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(model, rows, batch_size=32, directory=None):
+    """Score ``rows`` with tier 1 only, the ensemble only and the cascade; latency and agreement of each"""
+    from inference_core import InferenceCore, scoring_module
+    core = InferenceCore(names=[model], watch=False, size=1)
+    try:
+        snapshot = core.model(model)
+        module = scoring_module(model)
+        cascade = Cascade([model], directory or CASCADE.directory, CASCADE.z_limit, CASCADE.disagreement)
+        tiers = cascade._cascade(model, snapshot)
+        ensemble = tiers.ensemble
+        if ensemble is None:
+            raise FileNotFoundError(tiers.problem or f"No {model}_cascade.npz in {cascade.directory}")
+        batches = [(rows[start:start + batch_size], module.preprocess_batch(rows[start:start + batch_size],
+                                                                            snapshot.metadata))
+                   for start in range(0, len(rows), batch_size)]
+        strategies = {
+            'surrogate': lambda batch, features: snapshot.handle.predict(features)[:, 0],
+            'ensemble': lambda batch, features: ensemble.predict(features),
+            'cascade': lambda batch, features: cascade.predict(model, snapshot, features, batch),
+        }
+        results = {}
+        for name, score in strategies.items():
+            started = time.perf_counter()
+            predictions = np.concatenate([score(batch, features) for batch, features in batches])
+            results[name] = (predictions, time.perf_counter() - started)
+        reference = results['ensemble'][0]
+        report = {name: {'us_per_row': round(seconds / len(rows) * 1e6, 2),
+                         'mean_abs_diff_vs_ensemble': float(np.mean(np.abs(predictions - reference)))}
+                  for name, (predictions, seconds) in results.items()}
+        return {'model': model, 'rows': len(rows), 'batch_size': batch_size, 'strategies': report,
+                'cascade': cascade.report()[model]}
+    finally:
+        core.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Surrogate -> tree ensemble scoring cascade')
+    commands = parser.add_subparsers(dest='command', required=True)
+    eval_parser = commands.add_parser('eval', help='Hit rates, latency and agreement of the cascade on a sample')
+    eval_parser.add_argument('model')
+    eval_parser.add_argument('--input', help='JSON list or JSONL of request inputs (default: synthetic rows)')
+    eval_parser.add_argument('--rows', type=int, default=2000, help='Synthetic rows when there is no --input')
+    eval_parser.add_argument('--batch-size', type=int, default=32)
+    eval_parser.add_argument('--dir', help=f'Directory with the ensemble files (default: {CASCADE.directory})')
+    args = parser.parse_args()
+
+    if args.input:
+        rows = _read_rows(args.input)
+    else:
+        from sample_inputs import synthetic_rows
+        rows = synthetic_rows(args.model, args.rows)
+    print(json.dumps(evaluate(args.model, rows, args.batch_size, args.dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""Streaming drift statistics on live inference inputs, in fixed memory.
+
+The carbon and future scalers were fit on synthetic data, so every batch the
+inference core scores is also folded into per-model accumulators that measure
+how far the live inputs are from that training reference. Nothing per request
+is kept beyond the last ``FOLD_ROWS`` feature rows, which are folded in
+together; the state per model is a few tens of kB whatever the traffic.
+
+The statistics are collected from the feature matrix the model sees, so the
+numerics are already standardized with the training scalers (z = (x - mean) / scale):
+
+    numerics      count, mean, variance (batched Welford, merged with Chan's
+                  formula), min/max, and a histogram on a fixed z grid
+                  (``BIN_WIDTH`` from -``Z_LIMIT`` to +``Z_LIMIT`` plus two
+                  overflow buckets) for quantiles. Quantiles are within half a
+                  bucket (0.025 training standard deviations) inside the grid.
+    categoricals  count per training category, and the number of values that
+                  were not one of them (scored as the first category)
+
+All of it merges by addition, so worker processes can be combined into one
+report. Per feature the report gives:
+
+    numerics      mean_shift  (live mean - training mean) / training scale
+                  std_ratio   live std / training scale
+                  beyond_3sd  fraction of values more than 3 training std from the mean
+                  score       |mean_shift| + |log std_ratio|
+    categoricals  frequencies, unknown_rate, and as score the population
+                  stability index against the training frequencies (uniform:
+                  the synthetic generators draw every category equally often)
+
+Features whose score is above ``ML_DRIFT_THRESHOLD`` (default 0.25, the usual
+"significant shift" level for PSI; a quarter standard deviation for a mean) are
+listed under ``flagged`` once ``MIN_ROWS`` rows have been seen.
+
+The inference server returns the report from its ``stats`` and ``drift`` ops.
+Statistics are kept for the version being served. After a hot reload, batches
+still scored with the previous snapshot are left out rather than starting its
+statistics over.
+
+With ``ML_DRIFT_DIR`` set, each process also saves its state there every
+``ML_DRIFT_FLUSH_SECONDS`` (from a background thread; a failed save is logged
+to stderr) and on shutdown, and
+
+    python drift_monitor.py report [--dir /tmp/ml-drift]
+
+merges the saved states of all processes into one report.
+
+Environment:
+    ML_DRIFT                off/0/false disables collection (default: on)
+    ML_DRIFT_THRESHOLD      score above which a feature is flagged (default: 0.25)
+    ML_DRIFT_DIR            directory for per-process state files (default: unset, not saved)
+    ML_DRIFT_FLUSH_SECONDS  seconds between saves (default: 60)
+"""
+import os
+import sys
+import glob
+import json
+import math
+import time
+import argparse
+import threading
+
+import numpy as np
+
+Z_LIMIT = 8.0
+BIN_WIDTH = 0.05
+# Bucket 0 is z < -Z_LIMIT, the last z >= Z_LIMIT; the rest are BIN_WIDTH wide in between
+N_BINS = int(round(2 * Z_LIMIT / BIN_WIDTH)) + 2
+DEFAULT_QUANTILES = (1, 50, 99)
+PSI_FLOOR = 1e-4
+# Features are only flagged once this many rows have been seen
+MIN_ROWS = 100
+# Rows buffered (as feature-matrix rows) before they are folded into the statistics
+FOLD_ROWS = 256
+
+
+class Moments:
+    """Column-wise count, mean, sum of squared deviations, min and max"""
+
+    def __init__(self, width):
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+
+    def update(self, values):
+        """Fold in a (rows, width) batch"""
+        n = values.shape[0]
+        if not n:
+            return
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        self._combine(n, batch_mean, batch_m2)
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        np.maximum(self.max, values.max(axis=0), out=self.max)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+            np.minimum(self.min, other.min, out=self.min)
+            np.maximum(self.max, other.max, out=self.max)
+
+    def _combine(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (n / total)
+        self.m2 += m2 + delta * delta * (self.count * n / total)
+        self.count = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.m2)
+
+
+class ModelDrift:
+    """Accumulators for one model version, laid out by its RecordLayout"""
+
+    def __init__(self, layout, version=None):
+        self.model = layout.model
+        self.version = version
+        self.numerical = [field for field, _ in layout.numerical]
+        self.categorical = [(field, categories) for field, categories, _ in layout.categorical]
+        self.known = [frozenset(categories) for _, categories in self.categorical]
+        self.defaults = [default for _, _, default in layout.categorical]
+        if layout.one_hot:
+            self.reference_mean, self.reference_scale = layout.mean, layout.scale
+            self.numeric_columns = layout.n_onehot + np.arange(len(self.numerical))
+            self.code_columns = None
+            self.offsets = np.asarray(layout.offsets)
+            self.n_onehot = layout.n_onehot
+        else:
+            # Scaled label codes and numerics alternate (see RecordLayout.matrix)
+            self.numeric_columns = np.array([1, 3])
+            self.code_columns = np.array([0, 2])
+            self.reference_mean = layout.mean[self.numeric_columns].astype(np.float64)
+            self.reference_scale = layout.scale[self.numeric_columns].astype(np.float64)
+            self.code_mean = layout.mean[self.code_columns].astype(np.float64)
+            self.code_scale = layout.scale[self.code_columns].astype(np.float64)
+            self.offsets = np.cumsum([0] + [len(categories) for _, categories in self.categorical])[:-1]
+            self.n_onehot = int(sum(len(categories) for _, categories in self.categorical))
+        self._reset()
+
+    def _reset(self):
+        self.moments = Moments(len(self.numerical))
+        self.hist = np.zeros((len(self.numerical), N_BINS), dtype=np.int64)
+        self.category_counts = np.zeros(self.n_onehot, dtype=np.int64)
+        self.unknown = np.zeros(len(self.categorical), dtype=np.int64)
+        self._bin_offsets = np.arange(len(self.numerical)) * N_BINS
+        self._pending, self._pending_rows = [], 0
+
+    @classmethod
+    def from_json(cls, state):
+        """Statistics saved by to_json, for merging and reporting (not for observing)"""
+        drift = cls.__new__(cls)
+        drift.model, drift.version = state['model'], state['version']
+        drift.numerical = state['numerical']
+        drift.categorical = [(field, categories) for field, categories in state['categorical']]
+        drift.reference_mean = np.array(state['reference_mean'])
+        drift.reference_scale = np.array(state['reference_scale'])
+        drift.offsets = np.cumsum([0] + [len(categories) for _, categories in drift.categorical])[:-1]
+        drift.n_onehot = int(sum(len(categories) for _, categories in drift.categorical))
+        drift._reset()
+        drift.moments.count = state['count']
+        drift.moments.mean, drift.moments.m2 = np.array(state['mean']), np.array(state['m2'])
+        drift.moments.min, drift.moments.max = np.array(state['min']), np.array(state['max'])
+        drift.hist += np.array(state['hist'], dtype=np.int64).reshape(drift.hist.shape)
+        drift.category_counts += np.array(state['category_counts'], dtype=np.int64)
+        drift.unknown += np.array(state['unknown'], dtype=np.int64)
+        return drift
+
+    def observe(self, features, rows=None):
+        """Add one scored batch: its feature matrix and, when there is one, the raw input dicts"""
+        if rows is not None:
+            for i, (field, _) in enumerate(self.categorical):
+                contains, default = self.known[i].__contains__, self.defaults[i]
+                self.unknown[i] += len(rows) - sum(map(contains, [row.get(field, default) for row in rows]))
+        # Micro-batches are often a single row, so they are folded in FOLD_ROWS at a time
+        self._pending.append(features)
+        self._pending_rows += len(features)
+        if self._pending_rows >= FOLD_ROWS:
+            self._fold()
+
+    def _fold(self):
+        if not self._pending:
+            return
+        features = np.concatenate(self._pending) if len(self._pending) > 1 else np.asarray(self._pending[0])
+        self._pending, self._pending_rows = [], 0
+        z = features[:, self.numeric_columns].astype(np.float64)
+        self.moments.update(z)
+        bins = np.clip(np.floor((z + Z_LIMIT) / BIN_WIDTH).astype(np.int64) + 1, 0, N_BINS - 1)
+        self.hist += np.bincount((bins + self._bin_offsets).ravel(),
+                                 minlength=self.hist.size).reshape(self.hist.shape)
+        if self.code_columns is None:
+            self.category_counts += features[:, :self.n_onehot].sum(axis=0).astype(np.int64)
+        else:
+            codes = np.rint(features[:, self.code_columns] * self.code_scale + self.code_mean).astype(np.int64)
+            for i, (_, categories) in enumerate(self.categorical):
+                codes[(codes[:, i] < 0) | (codes[:, i] >= len(categories)), i] = 0
+            self.category_counts += np.bincount((codes + self.offsets).ravel(), minlength=self.n_onehot)
+
+    def merge(self, other):
+        self._fold()
+        other._fold()
+        self.moments.merge(other.moments)
+        self.hist += other.hist
+        self.category_counts += other.category_counts
+        self.unknown += other.unknown
+
+    def quantiles(self, qs):
+        """(len(qs), numerics) quantiles in z units, interpolated inside the grid buckets"""
+        count = self.moments.count
+        result = np.zeros((len(qs), len(self.numerical)))
+        if not count:
+            return result
+        cumulative = np.cumsum(self.hist, axis=1)
+        lower = -Z_LIMIT + (np.arange(N_BINS) - 1) * BIN_WIDTH
+        columns = np.arange(len(self.numerical))
+        for j, q in enumerate(qs):
+            target = q / 100.0 * count
+            bucket = np.minimum((cumulative < target).sum(axis=1), N_BINS - 1)
+            before = np.where(bucket > 0, cumulative[columns, np.maximum(bucket - 1, 0)], 0)
+            fraction = np.clip((target - before) / np.maximum(self.hist[columns, bucket], 1), 0.0, 1.0)
+            # The overflow buckets are bounded by the observed min and max
+            low = np.maximum(lower[bucket], self.moments.min)
+            high = np.minimum(lower[bucket] + BIN_WIDTH, self.moments.max)
+            low = np.where(bucket == 0, self.moments.min, low)
+            high = np.where(bucket == N_BINS - 1, self.moments.max, high)
+            result[j] = np.clip(low + (high - low) * fraction, self.moments.min, self.moments.max)
+        return result
+
+    def report(self, threshold, qs=DEFAULT_QUANTILES):
+        """Drift per feature against the training scalers and categories"""
+        self._fold()
+        mean, scale = self.reference_mean, self.reference_scale
+        count = self.moments.count
+        numerical = {}
+        if count:
+            z_mean, z_std = self.moments.mean, self.moments.std
+            # Buckets entirely outside +-3 (the grid has whole buckets on either side of it)
+            edge = int(round((Z_LIMIT - 3.0) / BIN_WIDTH)) + 1
+            beyond = (self.hist[:, :edge].sum(axis=1) + self.hist[:, N_BINS - edge:].sum(axis=1)) / count
+            quantiles = self.quantiles(qs)
+            for i, field in enumerate(self.numerical):
+                std_ratio = float(z_std[i])
+                score = abs(float(z_mean[i])) + (abs(math.log(std_ratio)) if std_ratio > 0 else float('inf'))
+                numerical[field] = {
+                    'mean': round(float(mean[i] + z_mean[i] * scale[i]), 4),
+                    'std': round(float(z_std[i] * scale[i]), 4),
+                    'min': round(float(mean[i] + self.moments.min[i] * scale[i]), 4),
+                    'max': round(float(mean[i] + self.moments.max[i] * scale[i]), 4),
+                    **{f'p{q:g}': round(float(mean[i] + quantiles[j, i] * scale[i]), 4) for j, q in enumerate(qs)},
+                    'mean_shift': round(float(z_mean[i]), 4),
+                    'std_ratio': round(std_ratio, 4),
+                    'beyond_3sd': round(float(beyond[i]), 6),
+                    'score': round(score, 4),
+                }
+        categorical = {}
+        for i, (field, categories) in enumerate(self.categorical):
+            counts = self.category_counts[self.offsets[i]:self.offsets[i] + len(categories)]
+            total = int(counts.sum())
+            if not total:
+                continue
+            observed = np.maximum(counts / total, PSI_FLOOR)
+            expected = np.full(len(categories), 1.0 / len(categories))
+            psi = float(np.sum((observed - expected) * np.log(observed / expected)))
+            categorical[field] = {
+                'frequencies': {category: round(float(c) / total, 4) for category, c in zip(categories, counts)},
+                'unknown_rate': round(float(self.unknown[i]) / total, 6),
+                'score': round(psi, 4),
+            }
+        scores = {field: entry['score'] for field, entry in list(numerical.items()) + list(categorical.items())}
+        return {
+            'version': self.version,
+            'rows': int(count),
+            'threshold': threshold,
+            'flagged': sorted((field for field, score in scores.items() if score > threshold and count >= MIN_ROWS),
+                              key=lambda field: -scores[field]),
+            'numerical': numerical,
+            'categorical': categorical,
+        }
+
+    def to_json(self):
+        self._fold()
+        return {
+            'model': self.model, 'version': self.version,
+            'numerical': self.numerical, 'categorical': self.categorical,
+            'reference_mean': np.asarray(self.reference_mean).tolist(),
+            'reference_scale': np.asarray(self.reference_scale).tolist(),
+            'count': self.moments.count, 'mean': self.moments.mean.tolist(), 'm2': self.moments.m2.tolist(),
+            'min': self.moments.min.tolist(), 'max': self.moments.max.tolist(),
+            'hist': self.hist.tolist(), 'category_counts': self.category_counts.tolist(),
+            'unknown': self.unknown.tolist(),
+        }
+
+
+class DriftMonitor:
+    """Per-model ModelDrift for the versions being served; one per process (``DRIFT``)"""
+
+    def __init__(self, enabled=True, threshold=0.25, directory=None, flush_seconds=60.0):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.models = {}  # model -> ModelDrift of the version being served
+        self.replaced = {}  # model -> versions whose statistics were replaced by a newer one
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self._flushing = False
+
+    @classmethod
+    def from_env(cls):
+        setting = os.environ.get('ML_DRIFT', '').strip().lower()
+        return cls(enabled=setting not in ('0', 'false', 'off'),
+                   threshold=float(os.environ.get('ML_DRIFT_THRESHOLD', 0.25)),
+                   directory=os.environ.get('ML_DRIFT_DIR') or None,
+                   flush_seconds=float(os.environ.get('ML_DRIFT_FLUSH_SECONDS', 60)))
+
+    def observe(self, model, snapshot, features, rows=None):
+        """Fold a scored batch into the statistics of ``snapshot``'s model version"""
+        if not self.enabled:
+            return
+        with self._lock:
+            drift = self.models.get(model)
+            if drift is None or drift.version != snapshot.version:
+                if snapshot.version in self.replaced.get(model, ()):
+                    # Scored with the previous snapshot during a hot reload; not the served version's inputs
+                    return
+                # A new version brings its own scalers and categories, so its statistics start over
+                from wire_format import RecordLayout
+                if drift is not None:
+                    self.replaced.setdefault(model, set()).add(drift.version)
+                drift = self.models[model] = ModelDrift(RecordLayout(model, snapshot.metadata), snapshot.version)
+            drift.observe(features, rows)
+            due = (self.directory and not self._flushing and
+                   time.monotonic() - self._flushed >= self.flush_seconds)
+            if due:
+                self._flushing = True
+        if due:
+            # Saved by a background thread, so the request neither waits for nor fails on the write
+            threading.Thread(target=self._flush_logged, name='drift-flush', daemon=True).start()
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"drift_monitor: saving state to {self.directory} failed: {e}", file=sys.stderr)
+        finally:
+            self._flushing = False
+
+    def report(self):
+        with self._lock:
+            return {model: drift.report(self.threshold) for model, drift in sorted(self.models.items())}
+
+    def flush(self):
+        """Save this process's state to ``directory`` (replacing its previous save)"""
+        if not self.directory:
+            return
+        with self._lock:
+            self._flushed = time.monotonic()
+            states = [drift.to_json() for drift in self.models.values()]
+        if not states:
+            return
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'drift-{os.getpid()}.json')
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump({'saved_at': time.time(), 'models': states}, f)
+            os.replace(f'{path}.tmp', path)
+
+
+def merged_report(directory, threshold=0.25):
+    """One report per model version from every state file in ``directory``"""
+    combined = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'drift-*.json'))):
+        with open(path) as f:
+            for state in json.load(f)['models']:
+                drift = ModelDrift.from_json(state)
+                key = f"{state['model']}@{state['version']}"
+                if key in combined:
+                    combined[key].merge(drift)
+                else:
+                    combined[key] = drift
+    return {key: drift.report(threshold) for key, drift in sorted(combined.items())}
+
+
+DRIFT = DriftMonitor.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Input drift of the served models')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help='Merge the saved per-process states into one report')
+    report_parser.add_argument('--dir', default=os.environ.get('ML_DRIFT_DIR', '/tmp/ml-drift'))
+    report_parser.add_argument('--threshold', type=float, default=DRIFT.threshold)
+    args = parser.parse_args()
+    print(json.dumps(merged_report(args.dir, args.threshold), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 import sys
 import json
+from inference_metrics import METRICS, process_uptime
 import numpy as np
 import tensorflow as tf
 from pathlib import Path
+from model_registry import resolve_model_files
+from profiling import PROFILER
+import input_fields
 
 # Get the directory of this script
 script_dir = Path(__file__).parent
@@ -11,108 +15,124 @@ models_dir = script_dir.parent / 'src' / 'ml_models'
 
 def load_metadata():
     """Load preprocessing metadata"""
-    meta_path = models_dir / 'future_meta.json'
+    _, meta_path = resolve_model_files('future')
     with open(meta_path, 'r') as f:
         return json.load(f)
 
-def preprocess_input(data, metadata):
-    """Preprocess input data for the model"""
+CATEGORICAL_INPUTS = input_fields.CATEGORICAL_INPUTS['future']
+NUMERICAL_INPUTS = input_fields.NUMERICAL_INPUTS['future']
+
+def preprocess_batch(rows, metadata):
+    """Preprocess a list of input dicts into one (N, features) matrix"""
     cat_cols = metadata['cat_cols']
-    num_cols = metadata['num_cols']
     onehot_categories = metadata['onehot_categories']
     num_scaler_mean = np.array(metadata['num_scaler_mean'])
     num_scaler_scale = np.array(metadata['num_scaler_scale'])
-    
-    # Map input data to expected format
-    input_mapping = {
-        'Body Type': data.get('body_type', 'average'),
-        'Sex': data.get('sex', 'male'),
-        'Diet': data.get('diet', 'omnivore'),
-        'How Often Shower': data.get('shower', 'daily'),
-        'Heating Energy Source': data.get('heating', 'gas'),
-        'Transport': data.get('transport', 'car'),
-        'Vehicle Type': data.get('vehicle_type', 'petrol'),
-        'Social Activity': data.get('social_activity', 'medium'),
-        'Frequency of Traveling by Air': data.get('air_travel_frequency', 'never'),
-        'Waste Bag Size': data.get('waste_bag_size', 'medium'),
-        'Energy efficiency': data.get('energy_efficiency', 'No'),
-        'Recycling': data.get('recycling', 'None'),
-        'Cooking_With': data.get('cooking_with', 'gas')
-    }
-    
-    # One-hot encode categorical features
-    onehot_features = []
+    n_onehot = sum(len(categories) for categories in onehot_categories)
+
+    features = np.zeros((len(rows), n_onehot + len(NUMERICAL_INPUTS)), dtype=np.float32)
+    row_ids = np.arange(len(rows))
+
+    # One-hot encode categorical features; unknown values fall back to the first category
+    offset = 0
     for i, col in enumerate(cat_cols):
         categories = onehot_categories[i]
-        value = input_mapping.get(col, categories[0])  # Default to first category
-        
-        # Create one-hot vector
-        onehot_vector = [0.0] * len(categories)
-        if value in categories:
-            onehot_vector[categories.index(value)] = 1.0
-        else:
-            onehot_vector[0] = 1.0  # Default to first category
-        
-        onehot_features.extend(onehot_vector)
-    
+        lookup = {value: j for j, value in enumerate(categories)}
+        field, default = CATEGORICAL_INPUTS.get(col, (None, categories[0]))
+        codes = [lookup.get(row.get(field, default), 0) for row in rows]
+        features[row_ids, offset + np.array(codes, dtype=np.int64)] = 1.0
+        offset += len(categories)
+
     # Scale numerical features
-    numerical_values = [
-        data.get('monthly_grocery_bill', 400.0),
-        data.get('vehicle_monthly_distance', 500.0),
-        data.get('waste_bag_weekly_count', 3.0),
-        data.get('tv_pc_daily_hour', 2.0),
-        data.get('new_clothes_monthly', 5.0),
-        data.get('internet_daily_hour', 4.0)
-    ]
-    
-    numerical_scaled = (np.array(numerical_values) - num_scaler_mean) / num_scaler_scale
-    
-    # Combine features
-    all_features = np.concatenate([onehot_features, numerical_scaled])
-    return all_features.reshape(1, -1).astype(np.float32)
+    numerical_values = np.array([[row.get(field, default) for field, default in NUMERICAL_INPUTS] for row in rows],
+                                dtype=np.float64).reshape(len(rows), len(NUMERICAL_INPUTS))
+    finite = np.isfinite(numerical_values)
+    if not finite.all():
+        field = NUMERICAL_INPUTS[int(np.argwhere(~finite)[0][1])][0]
+        raise ValueError(f"Numeric input '{field}' must be a finite number")
+    features[:, offset:] = (numerical_values - num_scaler_mean) / num_scaler_scale
+    return features
+
+def preprocess_input(data, metadata):
+    """Preprocess input data for the model"""
+    return preprocess_batch([data], metadata)
+
+def format_result(prediction, data, metadata):
+    """Turn one raw model output into the response dict"""
+    return {
+        'future_emission': round(max(0, float(prediction)), 2)  # Ensure non-negative
+    }
 
 def main():
+    if '--binary' in sys.argv[1:]:
+        # Length-prefixed binary frames instead of one JSON object (see wire_format.py)
+        from wire_format import serve_stdio
+        serve_stdio('future', load_metadata())
+        return
+
+    explain_mode = '--explain' in sys.argv[1:]
+    timer = METRICS.timer('future')
+    timer.record('startup', process_uptime())
     try:
         # Read input from stdin
-        input_data = json.loads(sys.stdin.read())
+        with timer.stage('parse'):
+            input_data = json.loads(sys.stdin.read())
         
         # Load metadata
-        metadata = load_metadata()
+        with timer.stage('load_metadata'):
+            metadata = load_metadata()
         
         # Load TFLite model
-        model_path = models_dir / 'future_prediction.tflite'
-        interpreter = tf.lite.Interpreter(model_path=str(model_path))
-        interpreter.allocate_tensors()
+        with timer.stage('load_model'):
+            model_path, _ = resolve_model_files('future')
+            interpreter = tf.lite.Interpreter(model_path=str(model_path))
+            interpreter.allocate_tensors()
         
-        # Get input and output tensors
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+            # Get input and output tensors
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
         
         # Preprocess input
-        features = preprocess_input(input_data, metadata)
+        with timer.stage('preprocess'):
+            features = preprocess_input(input_data, metadata)
+            if explain_mode:
+                # Every single-feature perturbation goes into the same invoke (see explain.py)
+                from explain import Explainer
+                explainer = Explainer('future', metadata)
+                row, features = features, explainer.perturb(features)
         
         # Run inference
-        interpreter.set_tensor(input_details[0]['index'], features)
-        interpreter.invoke()
+        with timer.stage('invoke'):
+            if len(features) != input_details[0]['shape'][0]:
+                interpreter.resize_tensor_input(input_details[0]['index'], features.shape)
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(input_details[0]['index'], features)
+            interpreter.invoke()
         
-        # Get prediction
-        prediction = interpreter.get_tensor(output_details[0]['index'])
-        future_emission = float(prediction[0][0])
+            # Get prediction
+            prediction = interpreter.get_tensor(output_details[0]['index'])
         
         # Prepare output
-        result = {
-            'future_emission': round(max(0, future_emission), 2)  # Ensure non-negative
-        }
+        with timer.stage('format'):
+            result = format_result(prediction[0][0], input_data, metadata)
+            if explain_mode:
+                result['explanation'] = explainer.explain(input_data, row, prediction[:, 0])
         
-        print(json.dumps(result))
+        with timer.stage('serialize'):
+            print(json.dumps(result))
+        timer.finish()
         
     except Exception as e:
+        timer.finish(error=True)
         error_result = {
             'error': str(e),
             'future_emission': 0
         }
         print(json.dumps(error_result))
         sys.exit(1)
+    finally:
+        METRICS.dump()
 
 if __name__ == "__main__":
-    main()
+    with PROFILER.request('future'):
+        main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""In-process inference core with a pool of pre-allocated interpreters per model.
+
+A ``tf.lite.Interpreter`` must not be used by two threads at once, so each model
+gets an ``InterpreterPool`` of independent ``ModelRunner`` objects. Worker
+threads check a runner out, invoke it and return it; the interpreters are built
+once and reused across requests. A pool is the handle of a ``ModelRegistry``
+snapshot, so a hot-reloaded model version arrives with its own fresh pool.
+
+Environment:
+    ML_POOL_SIZE          runners per model (default: number of CPUs)
+    ML_NUM_THREADS        TFLite intra-op threads per runner (default: 1)
+    ML_POOL_MAX_WAITING   threads allowed to queue for a runner before rejecting (default: 4 x pool size)
+    ML_POOL_TIMEOUT       seconds to wait for a runner before giving up (default: 5)
+    ML_BATCH_BUCKETS      comma-separated batch sizes to preallocate interpreters for, e.g.
+                          1,8,32,128,512 (default: unset, one interpreter resized on demand)
+    ML_TUNING_PROFILE     autotune profile to load, or off (default: backend/src/ml_models/tuning_profile.json)
+
+When ``autotune.py run`` has saved a profile for this machine's core count (or
+a smaller one), each tuned model gets bucketed interpreters with the tuned
+threads per batch range and the tuned pool size. An explicit ML_NUM_THREADS or
+ML_BATCH_BUCKETS disables the profile; an explicit ML_POOL_SIZE keeps its
+threads and buckets but not its pool size. A tuned entry only applies to the
+model file it was timed on: a version with a different hash is loaded with the
+untuned settings, with a warning.
+
+Every scored batch is also folded into the input drift statistics (drift_monitor.py).
+Models listed in ML_CASCADE are scored through the surrogate -> tree ensemble cascade (cascade.py),
+and models listed in ML_ENSEMBLE by a weighted ensemble of several exported models (model_ensemble.py).
+With ML_PREDICTION_LOG_DIR set, scored batches are also appended to the columnar prediction log
+(prediction_log.py).
+"""
+import os
+import sys
+import bisect
+import queue
+import importlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from model_registry import ModelRegistry, content_sha256, interpreter_source, models_dir
+from inference_metrics import METRICS
+from profiling import PROFILER
+from drift_monitor import DRIFT
+from cascade import CASCADE
+from model_ensemble import ENSEMBLE
+from prediction_log import PREDICTION_LOG
+from autotune import load_tuned_models, tuned_runner_settings
+
+
+# Served model name -> script module providing preprocess_batch() and format_result()
+SCORING_MODULES = {
+    'carbon': 'carbon_inference',
+    'future': 'future_inference',
+    'recommendation': 'enhanced_recommendation_inference',
+}
+
+
+def scoring_module(name):
+    return importlib.import_module(SCORING_MODULES[name])
+
+
+class PoolSaturated(Exception):
+    """Too many threads are already waiting for a runner"""
+
+
+class PoolTimeout(Exception):
+    """No runner became free within the checkout timeout"""
+
+
+class ModelRunner:
+    """One interpreter plus its tensor details; resizes the batch dimension on demand"""
+
+    def __init__(self, model_content, num_threads=1):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(**interpreter_source(model_content), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.n_features = int(self.interpreter.get_input_details()[0]['shape'][1])
+        self.batch_size = int(self.interpreter.get_input_details()[0]['shape'][0])
+
+    def predict(self, features):
+        """Run one invoke over a (N, n_features) float32 matrix and return (N, outputs)"""
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        rows = features.shape[0]
+        if rows != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, [rows, self.n_features])
+            self.interpreter.allocate_tensors()
+            self.batch_size = rows
+        self.interpreter.set_tensor(self.input_index, features)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+    def warm_up(self):
+        self.predict(np.zeros((1, self.n_features), dtype=np.float32))
+        return self
+
+
+class BucketedRunner:
+    """Interpreters preallocated for a fixed set of batch sizes.
+
+    A batch is padded into the smallest bucket that holds it, so there is no
+    resize_tensor_input/allocate_tensors on the request path. Rows are written
+    straight into the bucket's input buffer through an ``interpreter.tensor()``
+    view and results are read back through the output view. Batches larger
+    than the biggest bucket are split across buckets.
+    """
+
+    def __init__(self, model_content, buckets=(1, 8, 32, 128, 512), num_threads=1):
+        """``num_threads`` is one count for every bucket or a list aligned with the sorted buckets"""
+        import tensorflow as tf
+        self.buckets = sorted(buckets)
+        threads = num_threads if isinstance(num_threads, (list, tuple)) else [num_threads] * len(self.buckets)
+        self.interpreters = []
+        for size, count in zip(self.buckets, threads):
+            interpreter = tf.lite.Interpreter(**interpreter_source(model_content), num_threads=count)
+            input_details = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(input_details['index'], [size, int(input_details['shape'][1])])
+            interpreter.allocate_tensors()
+            self.interpreters.append(interpreter)
+        self.input_index = self.interpreters[0].get_input_details()[0]['index']
+        self.output_index = self.interpreters[0].get_output_details()[0]['index']
+        self.n_features = int(self.interpreters[0].get_input_details()[0]['shape'][1])
+        self.n_outputs = int(self.interpreters[0].get_output_details()[0]['shape'][-1])
+        # The accessors returned by tensor() are safe to keep; only the arrays they return are not
+        slots = []
+        for interpreter in self.interpreters:
+            interpreter.tensor(self.input_index)().fill(0)
+            slots.append((interpreter, interpreter.tensor(self.input_index), interpreter.tensor(self.output_index)))
+        self.largest = self.buckets[-1]
+        # slot_for[n] is the smallest bucket holding n rows, precomputed so a request does no searching
+        self.slot_for = [slots[0]] + [slots[bisect.bisect_left(self.buckets, n)] for n in range(1, self.largest + 1)]
+
+    def _run(self, slot, features):
+        interpreter, input_view, output_view = slot
+        count = features.shape[0]
+        # Views are re-fetched per call and dropped before invoke(), which refuses to run while one is held
+        input_view()[:count] = features
+        interpreter.invoke()
+        return output_view()[:count].copy()
+
+    def predict(self, features):
+        """Same contract as ModelRunner.predict: (N, n_features) -> (N, outputs)"""
+        features = np.asarray(features, dtype=np.float32)
+        rows = features.shape[0]
+        if rows <= self.largest:
+            return self._run(self.slot_for[rows], features)
+        return np.concatenate([self._run(self.slot_for[min(self.largest, rows - start)],
+                                         features[start:start + self.largest])
+                               for start in range(0, rows, self.largest)])
+
+    def warm_up(self):
+        for interpreter in self.interpreters:
+            interpreter.invoke()
+        return self
+
+
+class InterpreterPool:
+    """Fixed set of runners handed out with checkout/return semantics"""
+
+    def __init__(self, factory, size, max_waiting=None, timeout=5.0):
+        self.size = size
+        self.max_waiting = max_waiting if max_waiting is not None else 4 * size
+        self.timeout = timeout
+        # LIFO keeps the most recently used (cache-warm) runner in rotation
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(factory())
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        runner = self._acquire(self.timeout if timeout is None else timeout)
+        try:
+            yield runner
+        finally:
+            self._idle.put(runner)
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                raise PoolSaturated(f"{self._waiting} threads already waiting for a runner")
+            self._waiting += 1
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No runner free after {timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def predict(self, features, timeout=None):
+        with self.checkout(timeout) as runner:
+            return runner.predict(features)
+
+    def stats(self):
+        return {'size': self.size, 'idle': self._idle.qsize(), 'waiting': self._waiting,
+                'max_waiting': self.max_waiting}
+
+
+def tuned_settings(explicit=()):
+    """Per-model runner settings from the autotune profile, minus the ones in ``explicit``"""
+    if {'num_threads', 'buckets'} & set(explicit):
+        return {}
+    tuned = {}
+    for name, entry in load_tuned_models().items():
+        buckets, threads, size = tuned_runner_settings(entry)
+        tuned[name] = {'buckets': buckets, 'num_threads': threads, 'model_sha256': entry.get('model_sha256')}
+        if 'size' not in explicit:
+            tuned[name]['size'] = size
+    return tuned
+
+
+def pool_settings(**overrides):
+    """Pool configuration from the environment, with ``overrides`` taking precedence"""
+    size = int(os.environ.get('ML_POOL_SIZE', os.cpu_count() or 1))
+    max_waiting = os.environ.get('ML_POOL_MAX_WAITING')
+    buckets = os.environ.get('ML_BATCH_BUCKETS', '')
+    config = {
+        'size': size,
+        'num_threads': int(os.environ.get('ML_NUM_THREADS', 1)),
+        'max_waiting': int(max_waiting) if max_waiting else None,
+        'timeout': float(os.environ.get('ML_POOL_TIMEOUT', 5.0)),
+        'buckets': tuple(int(b) for b in buckets.split(',')) if buckets.strip() else None,
+    }
+    explicit = {key for key, var in (('size', 'ML_POOL_SIZE'), ('num_threads', 'ML_NUM_THREADS'),
+                                     ('buckets', 'ML_BATCH_BUCKETS')) if os.environ.get(var, '').strip()}
+    config.update(overrides)
+    if 'tuned' not in overrides:
+        config['tuned'] = tuned_settings(explicit | set(overrides))
+    return config
+
+
+def pool_loader(size, num_threads=1, max_waiting=None, timeout=5.0, buckets=None, tuned=None):
+    """ModelRegistry loader that builds a warmed-up pool for each model version.
+
+    ``tuned`` maps a model to the buckets, num_threads and size to use for it instead,
+    for the model file with hash ``model_sha256``.
+    """
+    def load(name, model_content, metadata):
+        settings = (tuned or {}).get(name, {})
+        if settings.get('model_sha256') and settings['model_sha256'] != content_sha256(model_content):
+            print(f"autotune: the tuned settings for {name} were timed on another model file; "
+                  f"run autotune.py again (using the defaults)", file=sys.stderr)
+            settings = {}
+        model_buckets = settings.get('buckets', buckets)
+        threads = settings.get('num_threads', num_threads)
+        if model_buckets:
+            factory = lambda: BucketedRunner(model_content, model_buckets, threads).warm_up()
+        else:
+            factory = lambda: ModelRunner(model_content, threads).warm_up()
+        return InterpreterPool(factory, settings.get('size', size), max_waiting=max_waiting, timeout=timeout)
+    return load
+
+
+class InferenceCore:
+    """Registry-backed pools for every served model"""
+
+    def __init__(self, base_dir=models_dir, names=None, watch=True, poll_interval=2.0, registry=None, **settings):
+        config = pool_settings(**settings)
+        self.settings = config
+        if registry is None:
+            self.registry = ModelRegistry(base_dir, names, loader=pool_loader(**config), poll_interval=poll_interval)
+            self.registry.load_all()
+        else:
+            # Snapshots loaded elsewhere (e.g. by a pre-fork parent); build this process's pools on top
+            self.registry = registry.rebuild(pool_loader(**config))
+        if watch:
+            self.registry.start()
+
+    def model(self, name):
+        """Snapshot (version, metadata, pool) to use for one request"""
+        return self.registry.get(name)
+
+    def predict(self, name, features, timeout=None):
+        model = self.model(name)
+        if ENSEMBLE.covers(name):
+            predictions = ENSEMBLE.predict(name, model, features, timeout, current=self.model(name))[:, None]
+        elif CASCADE.covers(name):
+            predictions = CASCADE.predict(name, model, features, timeout=timeout)[:, None]
+        else:
+            predictions = model.handle.predict(features, timeout)
+        DRIFT.observe(name, model, features)
+        PREDICTION_LOG.record(name, model, features, predictions)
+        return predictions
+
+    def score(self, name, rows, timeout=None):
+        """Preprocess, invoke and format a list of input dicts in one batch"""
+        with PROFILER.request(name):
+            return self._score(name, rows, timeout)
+
+    def _score(self, name, rows, timeout):
+        timer = METRICS.timer(name)
+        try:
+            model = self.model(name)
+            module = scoring_module(name)
+            with timer.stage('preprocess'):
+                features = module.preprocess_batch(rows, model.metadata)
+            if ENSEMBLE.covers(name):
+                predictions = ENSEMBLE.predict(name, model, features, timeout, timer, self.model(name))
+            elif CASCADE.covers(name):
+                # Records the tier-1 invoke and the escalation as their own stages
+                predictions = CASCADE.predict(name, model, features, rows, timeout, timer)
+            else:
+                with timer.stage('invoke'):
+                    predictions = model.handle.predict(features, timeout)[:, 0]
+            with timer.stage('drift'):
+                DRIFT.observe(name, model, features, rows)
+            with timer.stage('log'):
+                PREDICTION_LOG.record(name, model, features, predictions, rows)
+            with timer.stage('format'):
+                results = [module.format_result(p, row, model.metadata) for p, row in zip(predictions, rows)]
+        except Exception:
+            timer.finish(len(rows), error=True)
+            raise
+        timer.finish(len(rows))
+        return results
+
+    def stats(self):
+        return {name: dict(self.model(name).handle.stats(), version=version)
+                for name, version in self.registry.versions().items()}
+
+    def close(self):
+        self.registry.stop()
+        ENSEMBLE.close()
+        DRIFT.flush()
+        PREDICTION_LOG.flush()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Metric primitives shared by the inference scripts and the long-running modes.
+
+``METRICS`` records per-model request/row/error counters and a latency
+histogram per stage (parse, load_metadata, load_model, preprocess, invoke, escalate,
+ensemble, drift, log, format, serialize). It is switched on with the environment variable
+``ML_METRICS=json`` or ``ML_METRICS=prometheus``. One-shot scripts then write the
+dump to stderr on exit, and the inference server returns it from its ``stats``
+and ``metrics`` ops. When the variable is unset, ``METRICS.timer()`` returns a
+shared no-op timer, so the only cost left on the request path is a few
+attribute lookups.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+
+# Fallback origin for process_uptime() where /proc is unavailable
+IMPORTED_AT = time.perf_counter()
+
+# Upper bounds in seconds, roughly 2x apart from 50us to 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def process_uptime():
+    """Seconds since this process started, for the one-shot scripts' "startup" stage.
+
+    Read from /proc on Linux (10 ms resolution), so it covers interpreter start-up
+    and every import. Elsewhere it falls back to the time since this module was
+    imported, which misses the interpreter start and the imports before it.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - IMPORTED_AT
+
+
+class Histogram:
+    """Fixed-bucket cumulative histogram (Prometheus semantics: le = upper bound)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for n in self.counts:
+                running += n
+                cumulative.append(running)
+            return {
+                'buckets': [[bound, c] for bound, c in zip(list(self.buckets) + ['+Inf'], cumulative)],
+                'count': self.count,
+                'sum': self.sum,
+            }
+
+
+
+class StageStats:
+    """Rows, time and per-batch latency of one serving stage (a cascade tier, an ensemble member)"""
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = 0.0
+        self.batch_seconds = Histogram()
+
+    def record(self, rows, seconds):
+        self.rows += rows
+        self.seconds += seconds
+        self.batch_seconds.observe(seconds)
+
+    def report(self, total_rows=None):
+        """Counters and latency; with ``total_rows``, also the share of them this stage handled"""
+        report = {'rows': self.rows}
+        if total_rows is not None:
+            report['hit_rate'] = round(self.rows / total_rows, 4) if total_rows else 0.0
+        report.update({
+            'us_per_row': round(self.seconds / self.rows * 1e6, 2) if self.rows else 0.0,
+            'batch_p50_ms': self.batch_seconds.quantile(0.5) * 1000,
+            'batch_p99_ms': self.batch_seconds.quantile(0.99) * 1000,
+        })
+        return report
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTimer:
+    """Stand-in for RequestTimer while metrics are disabled"""
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, seconds):
+        pass
+
+    def finish(self, rows=1, error=False):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'started')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.metrics.stage_histogram(self.timer.model, self.name).observe(time.perf_counter() - self.started)
+        return False
+
+
+class RequestTimer:
+    """Times the stages of one request (or batch) for one model"""
+
+    def __init__(self, metrics, model):
+        self.metrics = metrics
+        self.model = model
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        self.metrics.stage_histogram(self.model, name).observe(seconds)
+
+    def finish(self, rows=1, error=False):
+        self.metrics.record_request(self.model, time.perf_counter() - self.started, rows, error)
+
+
+class InferenceMetrics:
+    """Per-model counters plus per-stage and end-to-end latency histograms"""
+
+    def __init__(self, enabled=False, output_format='json'):
+        self.enabled = enabled
+        self.output_format = output_format
+        self.started = time.time()
+        self.requests = {}
+        self.errors = {}
+        self.rows = {}
+        self.request_seconds = {}
+        self.stage_seconds = {}  # (model, stage) -> Histogram
+        self._lock = threading.Lock()
+
+    def timer(self, model):
+        return RequestTimer(self, model) if self.enabled else NULL_TIMER
+
+    def stage_histogram(self, model, stage):
+        histogram = self.stage_seconds.get((model, stage))
+        if histogram is None:
+            with self._lock:
+                histogram = self.stage_seconds.setdefault((model, stage), Histogram())
+        return histogram
+
+    def record_request(self, model, seconds, rows=1, error=False):
+        with self._lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+            self.rows[model] = self.rows.get(model, 0) + rows
+            if error:
+                self.errors[model] = self.errors.get(model, 0) + 1
+            histogram = self.request_seconds.setdefault(model, Histogram())
+        histogram.observe(seconds)
+
+    def to_json(self):
+        uptime = time.time() - self.started
+        models = {}
+        for model in sorted(set(self.requests) | {model for model, _ in self.stage_seconds}):
+            request_seconds = self.request_seconds.get(model, Histogram())
+            models[model] = {
+                'requests': self.requests.get(model, 0),
+                'errors': self.errors.get(model, 0),
+                'rows': self.rows.get(model, 0),
+                'rows_per_second': round(self.rows.get(model, 0) / uptime, 3) if uptime > 0 else 0.0,
+                'request_seconds': dict(request_seconds.snapshot(), p50=request_seconds.quantile(0.5),
+                                        p99=request_seconds.quantile(0.99)),
+                'stage_seconds': {stage: histogram.snapshot()
+                                  for (name, stage), histogram in sorted(self.stage_seconds.items())
+                                  if name == model},
+            }
+        return {'uptime_seconds': round(uptime, 3), 'models': models}
+
+    def to_prometheus(self):
+        lines = []
+
+        def counter(metric, help_text, values):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for model, value in sorted(values.items()):
+                lines.append(f'{metric}{{model="{model}"}} {value}')
+
+        def histogram(metric, help_text, series):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for labels, hist in series:
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                snapshot = hist.snapshot()
+                for bound, count in snapshot['buckets']:
+                    lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {count}')
+                lines.append(f'{metric}_sum{{{label_text}}} {snapshot["sum"]}')
+                lines.append(f'{metric}_count{{{label_text}}} {snapshot["count"]}')
+
+        counter('ml_requests_total', 'Requests handled per model', self.requests)
+        counter('ml_request_errors_total', 'Requests that failed per model', self.errors)
+        counter('ml_rows_total', 'Input rows scored per model', self.rows)
+        histogram('ml_request_seconds', 'End-to-end request latency',
+                  [((('model', model),), hist) for model, hist in sorted(self.request_seconds.items())])
+        histogram('ml_stage_seconds', 'Latency of each request stage',
+                  [((('model', model), ('stage', stage)), hist)
+                   for (model, stage), hist in sorted(self.stage_seconds.items())])
+        return '\n'.join(lines) + '\n'
+
+    def render(self, output_format=None):
+        if (output_format or self.output_format) == 'prometheus':
+            return self.to_prometheus()
+        return json.dumps(self.to_json())
+
+    def dump(self, stream=None):
+        """Write the metrics to stderr (one-shot scripts call this on exit)"""
+        if self.enabled:
+            stream = stream or sys.stderr
+            stream.write(self.render() + '\n')
+            stream.flush()
+
+
+def metrics_from_env():
+    setting = os.environ.get('ML_METRICS', '').strip().lower()
+    if setting in ('', '0', 'false', 'off'):
+        return InferenceMetrics(enabled=False)
+    return InferenceMetrics(enabled=True, output_format='prometheus' if setting == 'prometheus' else 'json')
+
+
+METRICS = metrics_from_env()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Shared Unix-domain-socket inference server.
+
+One process per host loads every model once and serves the carbon, future and
+recommendation scoring functions to all Node worker processes. The protocol is
+newline-delimited JSON over a persistent connection:
+
+    -> {"id": 1, "model": "carbon", "input": {...}}
+    <- {"id": 1, "result": {"emission": 2.41}}
+    -> {"id": 2, "op": "stats"}
+    <- {"id": 2, "result": {...}}
+    -> {"id": 3, "op": "metrics", "format": "prometheus"}
+    <- {"id": 3, "result": "# HELP ml_requests_total ..."}
+    -> {"id": 4, "op": "drift"}
+    <- {"id": 4, "result": {"carbon": {"rows": ..., "flagged": [...], ...}}}
+    -> {"id": 5, "op": "cascade"}
+    <- {"id": 5, "result": {"carbon": {"tiers": {"surrogate": {"hit_rate": ...}, ...}, ...}}}
+    -> {"id": 6, "op": "ensemble"}
+    <- {"id": 6, "result": {"carbon": {"members": {"xgb": {"us_per_row": ...}, ...}, ...}}}
+
+Clients may pipeline: every request line is handled concurrently and answered
+as soon as it is done, so responses can arrive out of order and are matched by
+``id``. Requests for the same model are micro-batched across connections.
+With ``ML_METRICS`` set, per-stage latency histograms (see inference_metrics.py)
+are included in ``stats`` and available on their own from ``metrics``. Input
+drift statistics (see drift_monitor.py) are in ``stats`` and on their own from ``drift``.
+With ``ML_CASCADE`` set, the per-tier hit rates and latency of the scoring
+cascade (see cascade.py) are in ``stats`` and on their own from ``cascade``.
+With ``ML_ENSEMBLE`` set, per-member latency and the added cost of ensemble
+serving (see model_ensemble.py) are in ``stats`` and on their own from ``ensemble``.
+With ``ML_PREDICTION_LOG_DIR`` set, the buffered and written row counts of the
+prediction log (see prediction_log.py) are in ``stats``.
+
+Usage:
+    python inference_server.py [--socket /tmp/carbon-ml.sock] [--workers N]
+
+With ``--workers N`` a pre-fork parent shares the mapped model files with N
+worker processes that all accept on the same socket (see prefork.py).
+``--profile cpu,memory --profile-every 1000`` profiles a sample of requests
+(see profiling.py).
+``--binary`` switches the socket to the length-prefixed binary frames described
+in wire_format.py. Each frame is scored as one batch.
+"""
+import os
+import sys
+import json
+import signal
+import asyncio
+import argparse
+
+import wire_format
+from batching import BatchScheduler
+from inference_metrics import METRICS, NULL_TIMER
+from drift_monitor import DRIFT
+from cascade import CASCADE
+from model_ensemble import ENSEMBLE
+from prediction_log import PREDICTION_LOG
+from profiling import PROFILER, parse_modes
+
+DEFAULT_SOCKET = os.environ.get('ML_INFERENCE_SOCKET', '/tmp/carbon-ml.sock')
+
+# Large enough for any single request line the backend sends
+MAX_LINE_BYTES = 1 << 20
+
+
+class InferenceServer:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.connections = 0
+        self._layouts = {}  # (model, version) -> wire_format.RecordLayout
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(writer, write_lock, {'id': None, 'error': 'Request line too long'})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.get_running_loop().create_task(self._answer(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def handle_binary_connection(self, reader, writer):
+        """Same as handle_connection, but with wire_format frames instead of JSON lines"""
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    payload = await wire_format.read_frame_async(reader)
+                except wire_format.ProtocolError as e:
+                    async with write_lock:
+                        writer.write(wire_format.encode_error(0, wire_format.OP_SCORE, e))
+                    break
+                if payload is None:
+                    break
+                task = asyncio.get_running_loop().create_task(self._answer_binary(payload, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _answer_binary(self, payload, writer, write_lock):
+        # A frame is already a batch, so it is scored directly rather than through the micro-batcher
+        timer = METRICS.timer('server')
+        frame = await asyncio.get_running_loop().run_in_executor(
+            self.scheduler.executor, wire_format.handle_request, payload, self.layout, self.scheduler.core.predict)
+        async with write_lock:
+            writer.write(frame)
+            await writer.drain()
+        timer.finish()
+
+    def layout(self, model):
+        snapshot = self.scheduler.core.model(model)
+        key = (model, snapshot.version)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = wire_format.RecordLayout(model, snapshot.metadata)
+        return layout
+
+    async def _answer(self, line, writer, write_lock):
+        request_id = None
+        # Server-side stages are recorded under the pseudo-model "server"
+        timer = METRICS.timer('server')
+        try:
+            with timer.stage('parse'):
+                request = json.loads(line)
+            request_id = request.get('id')
+            response = {'id': request_id, 'result': await self.dispatch(request)}
+        except Exception as e:
+            response = {'id': request_id, 'error': str(e)}
+        await self._send(writer, write_lock, response, timer)
+        timer.finish(error='error' in response)
+
+    async def dispatch(self, request):
+        op = request.get('op', 'score')
+        if op == 'score':
+            return await self.scheduler.submit(request['model'], request['input'])
+        if op == 'ping':
+            return 'pong'
+        if op == 'stats':
+            stats = {'connections': self.connections, 'models': self.scheduler.core.stats(),
+                     'batching': self.scheduler.stats()}
+            if METRICS.enabled:
+                stats['metrics'] = METRICS.to_json()
+            if DRIFT.enabled:
+                stats['drift'] = DRIFT.report()
+            if CASCADE.enabled:
+                stats['cascade'] = CASCADE.report()
+            if ENSEMBLE.enabled:
+                stats['ensemble'] = ENSEMBLE.report()
+            if PREDICTION_LOG.enabled:
+                stats['prediction_log'] = PREDICTION_LOG.stats()
+            return stats
+        if op == 'drift':
+            return DRIFT.report()
+        if op == 'cascade':
+            return CASCADE.report()
+        if op == 'ensemble':
+            return ENSEMBLE.report()
+        if op == 'metrics':
+            if request.get('format', METRICS.output_format) == 'prometheus':
+                return METRICS.to_prometheus()
+            return METRICS.to_json()
+        raise ValueError(f"Unknown op: {op}")
+
+    async def _send(self, writer, write_lock, response, timer=NULL_TIMER):
+        with timer.stage('serialize'):
+            data = json.dumps(response).encode('utf-8') + b'\n'
+        async with write_lock:
+            writer.write(data)
+            await writer.drain()
+
+
+async def serve(socket_path=DEFAULT_SOCKET, sock=None, scheduler=None, ready=None, binary=False):
+    """Run the server on ``socket_path`` (or an already bound ``sock``) until SIGTERM/SIGINT"""
+    scheduler = scheduler or BatchScheduler()
+    server = InferenceServer(scheduler)
+    handler = server.handle_binary_connection if binary else server.handle_connection
+    if sock is None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        unix_server = await asyncio.start_unix_server(handler, path=socket_path, limit=MAX_LINE_BYTES)
+        os.chmod(socket_path, 0o660)
+    else:
+        unix_server = await asyncio.start_unix_server(handler, sock=sock, limit=MAX_LINE_BYTES)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    if ready:
+        ready()
+    try:
+        async with unix_server:
+            await stop.wait()
+    finally:
+        scheduler.close()
+        if sock is None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve all ML models over a Unix domain socket')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ML_INFERENCE_WORKERS', 0)),
+                        help='Pre-fork this many worker processes (0 = serve in this process)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Speak length-prefixed binary frames (see wire_format.py) instead of JSON lines')
+    parser.add_argument('--profile', help='Profiling modes for sampled requests: cpu,memory,rss or all '
+                                          '(default: ML_PROFILE)')
+    parser.add_argument('--profile-every', type=int, help='Profile one request in N (default: ML_PROFILE_EVERY)')
+    parser.add_argument('--profile-dir', help='Where profiles are written (default: ML_PROFILE_DIR)')
+    args = parser.parse_args()
+    PROFILER.configure(parse_modes(args.profile) if args.profile else None, args.profile_every, args.profile_dir)
+    if args.workers > 0:
+        from prefork import PreforkSupervisor
+        PreforkSupervisor(args.socket, args.workers, binary=args.binary).run()
+        return
+    asyncio.run(serve(args.socket, binary=args.binary,
+                      ready=lambda: print(f"inference_server: listening on {args.socket}", file=sys.stderr)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Request fields behind the carbon and future model inputs.
+
+Kept apart from the scoring scripts so that code which only needs the field
+tables (wire_format.py and the tools built on it) does not import TensorFlow
+or the serving singletons.
+"""
+
+# Model column -> (request field, default) for the categorical inputs
+CATEGORICAL_INPUTS = {
+    'carbon': {
+        'Body Type': ('body_type', 'average'),
+        'Sex': ('sex', 'male'),
+        'Diet': ('diet', 'omnivore'),
+        'Shower': ('shower', 'daily'),
+        'Heating': ('heating', 'gas'),
+        'Transport': ('transport', 'car'),
+        'Vehicle': ('vehicle', 'petrol'),
+        'Social': ('social', 'medium'),
+        'Flight': ('flight', 'never'),
+        'Energy Eff': ('energy_eff', 'No'),
+        'Recycling': ('recycling', 'None'),
+        'Cooking': ('cooking', 'gas'),
+    },
+    'future': {
+        'Body Type': ('body_type', 'average'),
+        'Sex': ('sex', 'male'),
+        'Diet': ('diet', 'omnivore'),
+        'How Often Shower': ('shower', 'daily'),
+        'Heating Energy Source': ('heating', 'gas'),
+        'Transport': ('transport', 'car'),
+        'Vehicle Type': ('vehicle_type', 'petrol'),
+        'Social Activity': ('social_activity', 'medium'),
+        'Frequency of Traveling by Air': ('air_travel_frequency', 'never'),
+        'Waste Bag Size': ('waste_bag_size', 'medium'),
+        'Energy efficiency': ('energy_efficiency', 'No'),
+        'Recycling': ('recycling', 'None'),
+        'Cooking_With': ('cooking_with', 'gas'),
+    },
+}
+
+# Request field and default for each numerical input, in num_cols order
+NUMERICAL_INPUTS = {
+    'carbon': [
+        ('grocery', 400.0),
+        ('vehicle_distance', 500.0),
+        ('waste_weekly', 3.0),
+        ('tv_daily_hour', 2.0),
+        ('clothes_monthly', 5.0),
+        ('internet_daily', 4.0),
+    ],
+    'future': [
+        ('monthly_grocery_bill', 400.0),
+        ('vehicle_monthly_distance', 500.0),
+        ('waste_bag_weekly_count', 3.0),
+        ('tv_pc_daily_hour', 2.0),
+        ('new_clothes_monthly', 5.0),
+        ('internet_daily_hour', 4.0),
+    ],
+}
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Concurrent load generator for the ML inference entry points.
+
+Targets:
+    socket   the shared inference server (inference_server.py), pipelined over
+             --connections Unix-socket connections
+    process  one ``python3 <script>.py`` per request, the way mlService runs the
+             scripts without ML_INFERENCE_SOCKET
+
+Inputs are either replayed or synthetic:
+    --replay FILE  a JSON array or JSON-lines file of MLPrediction records (e.g. an
+                   export of ``SELECT "predictionType", "inputData" FROM ml_predictions``)
+                   or of bare input objects for --model
+    otherwise      rows drawn from the Joi schema ranges in mlController.ts (sample_inputs.py)
+
+Load shape:
+    --rate R          open loop: Poisson arrivals at R requests/s. Latency is counted from
+                      the scheduled arrival, so time spent queueing behind --concurrency
+                      is included (no coordinated omission)
+    --rate 0          closed loop: --concurrency clients each send back to back
+
+Every --interval seconds a line with achieved QPS, errors and p50/p95/p99 latency is
+printed; a summary (optionally saved with --output) follows at the end.
+
+Usage:
+    python loadtest.py socket --rate 200 --concurrency 64 --duration 30
+    python loadtest.py process --model carbon --rate 0 --concurrency 4 --requests 200
+    python loadtest.py socket --replay predictions.jsonl --rate 500
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from sample_inputs import SCHEMAS, synthetic_rows
+
+script_dir = Path(__file__).parent
+
+# MLPrediction.predictionType -> served model name
+PREDICTION_TYPES = {
+    'recommendation': 'recommendation',
+    'carbon_emission': 'carbon',
+    'future_prediction': 'future',
+}
+
+# Script mlService runs for each model
+MODEL_SCRIPTS = {
+    'carbon': 'carbon_inference.py',
+    'future': 'future_inference.py',
+    'recommendation': 'enhanced_recommendation_inference.py',
+}
+
+
+def load_replay(path, default_model=None):
+    """(model, input) pairs from a JSON array or JSON-lines file"""
+    text = Path(path).read_text()
+    stripped = text.lstrip()
+    records = json.loads(text) if stripped.startswith('[') else [json.loads(line) for line in text.splitlines()
+                                                                 if line.strip()]
+    requests = []
+    for record in records:
+        if 'inputData' in record:
+            model = PREDICTION_TYPES.get(record.get('predictionType'), default_model)
+            data = record['inputData']
+            if isinstance(data, str):  # JSON columns come back as text from some drivers
+                data = json.loads(data)
+        else:
+            model, data = default_model, record
+        if model is None:
+            raise ValueError("Replay record without predictionType; pass --model")
+        requests.append((model, data))
+    if not requests:
+        raise ValueError(f"No requests in {path}")
+    return requests
+
+
+def synthetic_requests(models, n, seed):
+    rows = {model: synthetic_rows(model, n, seed) for model in models}
+    rng = random.Random(seed)
+    return [(model, rows[model][i]) for i, model in enumerate(rng.choice(models) for _ in range(n))]
+
+
+class SocketTarget:
+    """Pipelined NDJSON client for inference_server.py over several connections"""
+
+    def __init__(self, socket_path, connections=4):
+        self.socket_path = socket_path
+        self.n_connections = connections
+        self.connections = []  # (writer, reader task, request id -> future)
+        self.next_id = 0
+
+    async def start(self):
+        for _ in range(self.n_connections):
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=1 << 20)
+            except OSError as e:
+                raise SystemExit(f"Cannot connect to the inference server at {self.socket_path}: {e}")
+            pending = {}
+            reader_task = asyncio.get_running_loop().create_task(self._read(reader, pending))
+            self.connections.append((writer, reader_task, pending))
+
+    async def _read(self, reader, pending):
+        """Resolve this connection's requests; fail only them when it closes"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = pending.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Inference server closed the connection'))
+            pending.clear()
+
+    async def call(self, model, data):
+        self.next_id += 1
+        request_id = self.next_id
+        writer, reader_task, pending = self.connections[request_id % len(self.connections)]
+        if reader_task.done():
+            raise ConnectionError('Inference server closed the connection')
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
+        writer.write(json.dumps({'id': request_id, 'model': model, 'input': data}).encode('utf-8') + b'\n')
+        response = await future
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    async def close(self):
+        for writer, reader_task, _ in self.connections:
+            writer.close()
+            reader_task.cancel()
+
+
+class ProcessTarget:
+    """Spawns the inference script per request, like mlService.runPythonScript"""
+
+    async def start(self):
+        pass
+
+    async def call(self, model, data):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(script_dir / MODEL_SCRIPTS[model]), stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate(json.dumps(data).encode('utf-8'))
+        if process.returncode != 0:
+            raise RuntimeError(f"exit {process.returncode}: {stderr.decode('utf-8')[-200:] or stdout.decode('utf-8')}")
+        result = json.loads(stdout)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result
+
+    async def close(self):
+        pass
+
+
+class LoadReport:
+    """Per-interval and overall latency/error accounting"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = None
+        self.latencies = []
+        self.errors = {}
+        self.sent = 0
+        self.window = []
+        self.window_errors = 0
+        self.timeline = []
+
+    def record(self, latency, error=None):
+        if error is None:
+            self.latencies.append(latency)
+            self.window.append(latency)
+        else:
+            key = error.splitlines()[0][:120] if error else 'error'
+            self.errors[key] = self.errors.get(key, 0) + 1
+            self.window_errors += 1
+
+    def tick(self, in_flight):
+        elapsed = time.perf_counter() - self.started
+        window = np.array(self.window) if self.window else np.zeros(0)
+        point = {
+            't': round(elapsed, 1),
+            'qps': round((len(self.window) + self.window_errors) / self.interval, 1),
+            'ok': len(self.window),
+            'errors': self.window_errors,
+            'in_flight': in_flight,
+            'p50_ms': round(float(np.percentile(window, 50)) * 1000, 2) if len(window) else None,
+            'p95_ms': round(float(np.percentile(window, 95)) * 1000, 2) if len(window) else None,
+            'p99_ms': round(float(np.percentile(window, 99)) * 1000, 2) if len(window) else None,
+        }
+        self.timeline.append(point)
+        self.window = []
+        self.window_errors = 0
+        print(f"t={point['t']:>6}s qps={point['qps']:>8} ok={point['ok']:>6} err={point['errors']:>4} "
+              f"in_flight={in_flight:>4} p50={point['p50_ms']}ms p95={point['p95_ms']}ms p99={point['p99_ms']}ms",
+              file=sys.stderr)
+
+    def summary(self, settings):
+        elapsed = time.perf_counter() - self.started
+        latencies = np.array(self.latencies)
+        n_errors = sum(self.errors.values())
+        return {
+            'settings': settings,
+            'duration_seconds': round(elapsed, 3),
+            'sent': self.sent,
+            'ok': len(self.latencies),
+            'errors': n_errors,
+            'error_rate': round(n_errors / max(1, self.sent), 4),
+            'error_kinds': self.errors,
+            'achieved_qps': round((len(self.latencies) + n_errors) / elapsed, 2) if elapsed > 0 else 0.0,
+            # None rather than 0 ms when nothing succeeded
+            'latency_ms': {
+                'p50': round(float(np.percentile(latencies, 50)) * 1000, 3) if len(latencies) else None,
+                'p95': round(float(np.percentile(latencies, 95)) * 1000, 3) if len(latencies) else None,
+                'p99': round(float(np.percentile(latencies, 99)) * 1000, 3) if len(latencies) else None,
+                'max': round(float(latencies.max()) * 1000, 3) if len(latencies) else None,
+                'mean': round(float(latencies.mean()) * 1000, 3) if len(latencies) else None,
+            },
+            'timeline': self.timeline,
+        }
+
+
+async def run_load(target, requests, rate, concurrency, duration, max_requests, interval, seed):
+    report = LoadReport(interval)
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    rng = random.Random(seed)
+    await target.start()
+    report.started = time.perf_counter()
+    deadline = report.started + duration if duration else None
+
+    def more():
+        if max_requests and report.sent >= max_requests:
+            return False
+        return deadline is None or time.perf_counter() < deadline
+
+    async def one(model, data, scheduled):
+        try:
+            await target.call(model, data)
+            report.record(time.perf_counter() - scheduled)
+        except Exception as e:
+            report.record(time.perf_counter() - scheduled, str(e) or type(e).__name__)
+        finally:
+            slots.release()
+
+    async def ticker():
+        while True:
+            await asyncio.sleep(interval)
+            report.tick(len(in_flight))
+
+    ticker_task = asyncio.get_running_loop().create_task(ticker())
+    try:
+        next_arrival = time.perf_counter()
+        while more():
+            if rate > 0:
+                next_arrival += rng.expovariate(rate)
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                scheduled = next_arrival
+            else:
+                scheduled = None
+            await slots.acquire()
+            model, data = requests[report.sent % len(requests)]
+            report.sent += 1
+            task = asyncio.get_running_loop().create_task(
+                one(model, data, scheduled if scheduled is not None else time.perf_counter()))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    finally:
+        ticker_task.cancel()
+        await target.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the ML inference entry points')
+    parser.add_argument('target', choices=['socket', 'process'])
+    parser.add_argument('--socket', default=os.environ.get('ML_INFERENCE_SOCKET', '/tmp/carbon-ml.sock'))
+    parser.add_argument('--connections', type=int, default=4, help='Socket connections to spread requests over')
+    parser.add_argument('--model', choices=sorted(SCHEMAS), action='append',
+                        help='Model(s) for synthetic inputs or bare replay records (default: all)')
+    parser.add_argument('--replay', help='JSON/JSONL file of MLPrediction records or input objects')
+    parser.add_argument('--rate', type=float, default=0.0, help='Arrivals per second (0 = closed loop)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Most requests in flight at once')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to generate load (0 = no limit)')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (0 = no limit)')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between progress lines')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON summary here as well')
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error('Need --duration or --requests')
+
+    models = args.model or sorted(SCHEMAS)
+    if args.replay:
+        requests = load_replay(args.replay, models[0] if len(models) == 1 else None)
+    else:
+        requests = synthetic_requests(models, 10000, args.seed)
+    target = SocketTarget(args.socket, args.connections) if args.target == 'socket' else ProcessTarget()
+
+    report = asyncio.run(run_load(target, requests, args.rate, args.concurrency, args.duration, args.requests,
+                                  args.interval, args.seed))
+    settings = {key: value for key, value in vars(args).items() if key != 'output'}
+    summary = report.summary(settings)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps({key: value for key, value in summary.items() if key != 'timeline'}, indent=2))
+    if summary['ok'] == 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
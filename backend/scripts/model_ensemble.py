@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""Weighted multi-model ensemble serving, with the members evaluated concurrently.
+
+For a model listed in ``ML_ENSEMBLE`` the inference core scores every batch
+with all members of ``<model>_ensemble.json`` at once and returns their
+weighted mean. The spec lists the members and their weights:
+
+    {"meta_sha256": "...",
+     "members": [
+        {"name": "surrogate", "weight": 1},
+        {"name": "xgb", "path": "carbon_ens_xgb.json", "weight": 2},
+        {"name": "rf", "path": "carbon_ens_rf.npz", "weight": 1}]}
+
+A member without a ``path`` is the served TFLite surrogate (its registry pool).
+The others are loaded by file type:
+
+    .json/.ubj   XGBoost booster (needs xgboost), inplace_predict
+    .cbm         CatBoost model (needs catboost)
+    .npz         flattened tree ensemble (tree_ensemble.py), NumPy only
+
+All of them take the feature matrix ``preprocess_batch`` builds, so they must
+be fitted on the served layout (``distill_surrogates.py --ensemble`` exports
+them). TFLite, XGBoost and CatBoost release the GIL while they predict, so
+those members run on threads. The NumPy tree walk is many small GIL-holding
+operations, so each ``.npz`` member gets its own worker process, which loads
+the model once. A member's ``"executor": "thread" | "process"`` overrides the
+default.
+
+The report gives each member's latency (from submit to result, so a process
+member includes the round trip) and what the ensemble adds per batch over
+scoring with the surrogate alone, and the mean spread between members. The inference
+server returns it from its ``stats`` and ``ensemble`` ops.
+
+    python model_ensemble.py eval carbon [--input rows.jsonl | --rows 2000] [--batch-size 32]
+
+scores a sample with the ensemble, with each member alone, and serially.
+
+A model in both ``ML_ENSEMBLE`` and ``ML_CASCADE`` is served by the ensemble.
+The spec and member files are read again whenever the registry serves a new
+version of the model. The spec's ``meta_sha256`` (written by
+``distill_surrogates.py``) must match the served meta file. When it does not,
+or the spec or a member fails to load, the members already started are shut
+down and that version is served by the surrogate alone (logged once). So is a
+version whose member fails while scoring, e.g. a crashed worker process.
+
+After a hot reload, batches still holding the previous snapshot finish on the
+previous version's ensemble, which is closed once the last of them is done. A
+batch of an older version that arrives after that is scored by its surrogate
+alone; an older version is never loaded again.
+
+Environment:
+    ML_ENSEMBLE          comma-separated models to serve as ensembles, e.g. carbon (default: unset, off)
+    ML_ENSEMBLE_DIR      directory with <model>_ensemble.json and the member files
+                         (default: backend/src/ml_models)
+    ML_ENSEMBLE_WEIGHTS  weight overrides, e.g. xgb=2,rf=1,surrogate=0 (a zero weight skips the member)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from model_registry import models_dir, metadata_sha256
+from inference_metrics import Histogram, StageStats
+
+SURROGATE = 'surrogate'
+
+
+def load_member(path):
+    """Predict function (features -> (N,) float64) for an exported member file"""
+    extension = os.path.splitext(path)[1]
+    if extension == '.npz':
+        from tree_ensemble import TreeEnsemble
+        return TreeEnsemble.load(path).predict
+    if extension in ('.json', '.ubj'):
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(path)
+        return lambda features: np.asarray(booster.inplace_predict(features), dtype=np.float64)
+    if extension == '.cbm':
+        from catboost import CatBoostRegressor
+        model = CatBoostRegressor()
+        model.load_model(path)
+        return lambda features: np.asarray(model.predict(features), dtype=np.float64)
+    raise ValueError(f"Unsupported ensemble member file: {path}")
+
+
+# Worker-process side of a process member: the model is loaded once by the initializer
+_worker_predict = None
+
+
+def _load_worker(path):
+    global _worker_predict
+    _worker_predict = load_member(path)
+
+
+def _run_worker(features):
+    return _worker_predict(features)
+
+
+class Member:
+    """One weighted ensemble member and the executor it runs on"""
+
+    def __init__(self, name, weight, path=None, executor=None):
+        self.name = name
+        self.weight = float(weight)
+        self.path = path
+        if path is None:
+            self.executor_kind = 'thread'
+        else:
+            self.executor_kind = executor or ('process' if path.endswith('.npz') else 'thread')
+        self.predict = None
+        self.pool = None
+        self.stats = StageStats()
+
+    def start(self):
+        if self.path is None:
+            return self
+        if self.executor_kind == 'process':
+            # Spawned, not forked: the serving process has threads (and possibly TFLite state)
+            self.pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_load_worker, initargs=(self.path,))
+            try:
+                self.pool.submit(int).result()  # wait until the worker has loaded the model
+            except Exception:
+                self.close()
+                raise
+        else:
+            self.predict = load_member(self.path)
+        return self
+
+    def submit(self, threads, snapshot, features, timeout):
+        if self.path is None:
+            return threads.submit(lambda: snapshot.handle.predict(features, timeout)[:, 0].astype(np.float64))
+        if self.pool is not None:
+            return self.pool.submit(_run_worker, features)
+        return threads.submit(self.predict, features)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ModelEnsemble:
+    """Members, weights and counters for one served model version"""
+
+    def __init__(self, model, snapshot, directory, weight_overrides=None):
+        self.model = model
+        self.version = snapshot.version
+        self.problem = None  # why the spec's members are not used
+        self.users = 0  # batches in flight, counted by EnsembleServer
+        self.retired = False
+        try:
+            self.members = self._start(model, snapshot, directory, weight_overrides or {})
+        except Exception as e:
+            self.problem = str(e) or type(e).__name__
+            self.members = [Member(SURROGATE, 1.0)]
+        total = sum(member.weight for member in self.members)
+        self.weights = np.array([member.weight / total for member in self.members])
+        # Enough threads for every thread member of a batch on each core at once
+        thread_members = sum(member.executor_kind == 'thread' for member in self.members)
+        self.threads = ThreadPoolExecutor(max(1, thread_members) * (os.cpu_count() or 1),
+                                          thread_name_prefix=f'{model}-ensemble')
+        self.batches = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.spread_sum = 0.0
+        self.added = Histogram()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _start(model, snapshot, directory, overrides):
+        spec_path = os.path.join(directory, f'{model}_ensemble.json')
+        with open(spec_path) as f:
+            spec = json.load(f)
+        if spec.get('meta_sha256') not in (None, metadata_sha256(snapshot.metadata)):
+            raise ValueError(f"{spec_path} was fitted on different {model} metadata than {snapshot.version}")
+        members = []
+        for entry in spec['members']:
+            weight = overrides.get(entry['name'], entry.get('weight', 1.0))
+            if not weight:
+                continue
+            path = os.path.join(directory, entry['path']) if entry.get('path') else None
+            members.append(Member(entry['name'], weight, path, entry.get('executor')))
+        if not members:
+            raise ValueError(f"{spec_path} has no members with a non-zero weight")
+        started = []
+        try:
+            for member in members:
+                try:
+                    started.append(member.start())
+                except Exception as e:
+                    raise RuntimeError(f"ensemble member {member.name} ({member.path}) failed to load: {e}") from e
+        except Exception:
+            # Don't leave the worker processes of the members already started running
+            for member in started:
+                member.close()
+            raise
+        return started
+
+    def predict(self, snapshot, features, timeout=None):
+        """Weighted mean of every member's predictions for ``features``, shape (N,)"""
+        if self.problem and len(self.members) > 1:
+            # A member failed while scoring: the surrogate alone from then on
+            return snapshot.handle.predict(features, timeout)[:, 0].astype(np.float64)
+        started = time.perf_counter()
+        futures = {member.submit(self.threads, snapshot, features, timeout): i
+                   for i, member in enumerate(self.members)}
+        predictions = np.empty((len(self.members), len(features)))
+        member_seconds = {}
+        failed = None
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                predictions[i] = future.result()
+            except Exception as e:
+                if self.members[i].name == SURROGATE:
+                    raise
+                failed = failed or f"ensemble member {self.members[i].name} failed: {str(e) or type(e).__name__}"
+                continue
+            member_seconds[self.members[i].name] = time.perf_counter() - started
+        if failed:
+            with self._lock:
+                first = not self.problem
+                self.problem = self.problem or failed
+            if first:
+                print(f"{failed}; serving {self.model} {self.version} from the surrogate alone", file=sys.stderr)
+            surrogate = next((i for i, member in enumerate(self.members) if member.name == SURROGATE), None)
+            if surrogate is not None:
+                return predictions[surrogate]
+            return snapshot.handle.predict(features, timeout)[:, 0].astype(np.float64)
+        combined = self.weights @ predictions
+        wall = time.perf_counter() - started
+        spread = float(predictions.std(axis=0).sum())
+        baseline = member_seconds.get(SURROGATE, 0.0)
+        with self._lock:
+            self.batches += 1
+            self.rows += len(features)
+            self.seconds += wall
+            self.spread_sum += spread
+            self.added.observe(max(0.0, wall - baseline))
+            for member in self.members:
+                member.stats.record(len(features), member_seconds[member.name])
+        return combined
+
+    def report(self):
+        with self._lock:
+            rows = self.rows
+            surrogate = next((m.stats for m in self.members if m.name == SURROGATE), None)
+            baseline = surrogate.seconds if surrogate is not None else 0.0
+            return {
+                'version': self.version,
+                'problem': self.problem,
+                'rows': rows,
+                'batches': self.batches,
+                'members': {member.name: dict(member.stats.report(), weight=round(float(weight), 4),
+                                              executor=member.executor_kind)
+                            for member, weight in zip(self.members, self.weights)},
+                'us_per_row': round(self.seconds / rows * 1e6, 2) if rows else 0.0,
+                'added_us_per_row': round((self.seconds - baseline) / rows * 1e6, 2) if rows else 0.0,
+                'added_batch_p50_ms': self.added.quantile(0.5) * 1000,
+                'added_batch_p99_ms': self.added.quantile(0.99) * 1000,
+                'mean_member_spread': round(self.spread_sum / rows, 6) if rows else 0.0,
+            }
+
+    def close(self):
+        self.threads.shutdown(wait=False)
+        for member in self.members:
+            member.close()
+
+
+def parse_weights(text):
+    """``xgb=2,rf=1`` -> {'xgb': 2.0, 'rf': 1.0}"""
+    weights = {}
+    for item in text.split(','):
+        if item.strip():
+            name, _, weight = item.partition('=')
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+class EnsembleServer:
+    """ModelEnsemble per ensemble-served model; one per process (``ENSEMBLE``)"""
+
+    def __init__(self, models=(), directory=models_dir, weights=None):
+        self.models = set(models)
+        self.directory = str(directory)
+        self.weights = weights or {}
+        self.ensembles = {}  # model -> ModelEnsemble of the version being served
+        self.retired = {}  # (model, version) -> ModelEnsemble still finishing batches of a replaced version
+        self.replaced = {}  # model -> versions whose ensembles were replaced
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        models = [name.strip() for name in os.environ.get('ML_ENSEMBLE', '').split(',') if name.strip()]
+        return cls(models, directory=os.environ.get('ML_ENSEMBLE_DIR') or models_dir,
+                   weights=parse_weights(os.environ.get('ML_ENSEMBLE_WEIGHTS', '')))
+
+    @property
+    def enabled(self):
+        return bool(self.models)
+
+    def covers(self, model):
+        return model in self.models
+
+    def _ensemble(self, model, snapshot, current=None):
+        """Ensemble for ``snapshot`` (None for an already replaced version), with a batch checked out.
+
+        ``current`` is the registry's snapshot for ``model``: ``snapshot`` is stale when it is
+        another one. Without it, a snapshot of a version this server has replaced is stale.
+        """
+        with self._lock:
+            ensemble = self.ensembles.get(model)
+            if ensemble is not None and ensemble.version == snapshot.version:
+                ensemble.users += 1
+                return ensemble
+            if current is not None:
+                stale = current is not snapshot
+            else:
+                stale = snapshot.version in self.replaced.get(model, ())
+            if stale:
+                ensemble = self.retired.get((model, snapshot.version))
+                if ensemble is not None:
+                    ensemble.users += 1
+                return ensemble
+            if ensemble is not None:
+                self._retire(ensemble)
+            ensemble = self.ensembles[model] = ModelEnsemble(model, snapshot, self.directory, self.weights)
+            ensemble.users += 1
+        if ensemble.problem:
+            print(f"ensemble: {ensemble.problem}; serving {model} from the surrogate alone", file=sys.stderr)
+        return ensemble
+
+    def _retire(self, ensemble):
+        ensemble.retired = True
+        self.replaced.setdefault(ensemble.model, set()).add(ensemble.version)
+        if ensemble.users:
+            self.retired[(ensemble.model, ensemble.version)] = ensemble
+        else:
+            ensemble.close()
+
+    def _release(self, ensemble):
+        with self._lock:
+            ensemble.users -= 1
+            if ensemble.retired and not ensemble.users:
+                # The last batch of a replaced version is done
+                self.retired.pop((ensemble.model, ensemble.version), None)
+                ensemble.close()
+
+    def predict(self, model, snapshot, features, timeout=None, timer=None, current=None):
+        started = time.perf_counter()
+        ensemble = self._ensemble(model, snapshot, current)
+        if ensemble is None:
+            predictions = snapshot.handle.predict(features, timeout)[:, 0].astype(np.float64)
+        else:
+            try:
+                predictions = ensemble.predict(snapshot, features, timeout)
+            finally:
+                self._release(ensemble)
+        if timer is not None:
+            timer.record('ensemble', time.perf_counter() - started)
+        return predictions
+
+    def report(self):
+        with self._lock:
+            ensembles = sorted(self.ensembles.items())
+        return {model: ensemble.report() for model, ensemble in ensembles}
+
+    def close(self):
+        with self._lock:
+            for ensemble in list(self.ensembles.values()) + list(self.retired.values()):
+                ensemble.close()
+            self.ensembles = {}
+            self.retired = {}
+
+
+ENSEMBLE = EnsembleServer.from_env()
+
+
+def evaluate(model, rows, batch_size=32, directory=None, weights=None):
+    """Score ``rows`` with the ensemble, every member alone and the members one after another"""
+    from inference_core import InferenceCore, scoring_module
+    core = InferenceCore(names=[model], watch=False, size=1)
+    server = EnsembleServer([model], directory or ENSEMBLE.directory, weights or ENSEMBLE.weights)
+    try:
+        snapshot = core.model(model)
+        module = scoring_module(model)
+        batches = [module.preprocess_batch(rows[start:start + batch_size], snapshot.metadata)
+                   for start in range(0, len(rows), batch_size)]
+        ensemble = server._ensemble(model, snapshot)
+        server._release(ensemble)
+        if ensemble.problem:
+            raise RuntimeError(ensemble.problem)
+        started = time.perf_counter()
+        combined = np.concatenate([server.predict(model, snapshot, features) for features in batches])
+        concurrent_seconds = time.perf_counter() - started
+        alone = {}
+        for member in ensemble.members:
+            started = time.perf_counter()
+            predictions = np.concatenate([member.submit(ensemble.threads, snapshot, features, None).result()
+                                          for features in batches])
+            alone[member.name] = (predictions, time.perf_counter() - started)
+        serial_seconds = sum(seconds for _, seconds in alone.values())
+        return {
+            'model': model,
+            'rows': len(rows),
+            'batch_size': batch_size,
+            'concurrent_us_per_row': round(concurrent_seconds / len(rows) * 1e6, 2),
+            'serial_us_per_row': round(serial_seconds / len(rows) * 1e6, 2),
+            'members_alone': {name: {'us_per_row': round(seconds / len(rows) * 1e6, 2),
+                                     'mean_abs_diff_vs_ensemble': float(np.mean(np.abs(predictions - combined)))}
+                              for name, (predictions, seconds) in alone.items()},
+            'ensemble': server.report()[model],
+        }
+    finally:
+        server.close()
+        core.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Weighted multi-model ensemble serving')
+    commands = parser.add_subparsers(dest='command', required=True)
+    eval_parser = commands.add_parser('eval', help='Per-member latency and added cost of the ensemble on a sample')
+    eval_parser.add_argument('model')
+    eval_parser.add_argument('--input', help='JSON list or JSONL of request inputs (default: synthetic rows)')
+    eval_parser.add_argument('--rows', type=int, default=2000, help='Synthetic rows when there is no --input')
+    eval_parser.add_argument('--batch-size', type=int, default=32)
+    eval_parser.add_argument('--dir', help=f'Directory with the spec and member files (default: {ENSEMBLE.directory})')
+    eval_parser.add_argument('--weights', help='Weight overrides, e.g. xgb=2,rf=1')
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            rows = json.load(f) if args.input.endswith('.json') else [json.loads(line) for line in f if line.strip()]
+    else:
+        from sample_inputs import synthetic_rows
+        rows = synthetic_rows(args.model, args.rows)
+    weights = parse_weights(args.weights) if args.weights else None
+    print(json.dumps(evaluate(args.model, rows, args.batch_size, args.dir, weights), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""Versioned model registry with atomic hot reload.
+
+``registry.json`` in the models directory lists, per model, the current version
+and the content hash of its ``.tflite`` file and ``*_meta.json``:
+
+    {"models": {"carbon": {"version": "...", "files": {
+        "model": {"path": "versions/carbon/<version>/carbonemission_surrogate.tflite", "sha256": "..."},
+        "meta": {"path": "versions/carbon/<version>/carbon_meta.json", "sha256": "..."}}}}}
+
+One-shot scripts resolve their files through ``resolve_model_files``. A
+long-running process uses ``ModelRegistry``: a watcher thread notices manifest
+changes, loads and warms up the new version in the background and then swaps
+the reference. Callers take one snapshot per request (``registry.get(name)``),
+so a swap never happens in the middle of a request.
+
+CLI:
+    python model_registry.py init                       # manifest for the current loose files
+    python model_registry.py publish carbon --model new.tflite --meta new_meta.json
+    python model_registry.py verify
+"""
+import os
+import sys
+import json
+import mmap
+import shutil
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+
+script_dir = Path(__file__).parent
+models_dir = script_dir.parent / 'src' / 'ml_models'
+
+MANIFEST_NAME = 'registry.json'
+
+# Loose file names the backend has always shipped
+MODEL_FILES = {
+    'carbon': {'model': 'carbonemission_surrogate.tflite', 'meta': 'carbon_meta.json'},
+    'future': {'model': 'future_prediction.tflite', 'meta': 'future_meta.json'},
+    'recommendation': {'model': 'recommendation_model_v2.tflite', 'meta': 'recommendation_v2_meta.json'},
+}
+
+
+class RegistryError(Exception):
+    pass
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def metadata_sha256(metadata):
+    """Hash of parsed meta contents, independent of the file's formatting.
+
+    Tiers fitted on a model's feature layout (cascade.py, model_ensemble.py) record it,
+    so they are only used with the scalers and categories they were fitted on.
+    """
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def read_manifest(base_dir=models_dir):
+    """Return the parsed manifest, or None when the directory has none"""
+    path = Path(base_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, base_dir=models_dir):
+    """Atomically replace the manifest (write to a temp file, then rename)"""
+    path = Path(base_dir) / MANIFEST_NAME
+    tmp = path.with_name(f'.{MANIFEST_NAME}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def resolve_model_files(name, base_dir=models_dir):
+    """Paths of the current model and meta files for ``name``"""
+    manifest = read_manifest(base_dir)
+    if manifest and name in manifest.get('models', {}):
+        files = manifest['models'][name]['files']
+        return Path(base_dir) / files['model']['path'], Path(base_dir) / files['meta']['path']
+    defaults = MODEL_FILES[name]
+    return Path(base_dir) / defaults['model'], Path(base_dir) / defaults['meta']
+
+
+def _entry_for(base_dir, version, model_rel, meta_rel):
+    return {
+        'version': version,
+        'published_at': datetime.now(timezone.utc).isoformat(),
+        'files': {
+            'model': {'path': str(model_rel), 'sha256': sha256_file(Path(base_dir) / model_rel)},
+            'meta': {'path': str(meta_rel), 'sha256': sha256_file(Path(base_dir) / meta_rel)},
+        },
+    }
+
+
+def init_manifest(base_dir=models_dir):
+    """Create a manifest describing the loose files already in ``base_dir``"""
+    models = {}
+    for name, files in MODEL_FILES.items():
+        if not (Path(base_dir) / files['model']).exists():
+            continue
+        entry = _entry_for(base_dir, 'initial', files['model'], files['meta'])
+        entry['version'] = 'initial-' + entry['files']['model']['sha256'][:8]
+        models[name] = entry
+    manifest = {'models': models}
+    write_manifest(manifest, base_dir)
+    return manifest
+
+
+def publish(name, model_src, meta_src, version=None, base_dir=models_dir):
+    """Copy a new model version into ``versions/<name>/<version>/`` and point the manifest at it"""
+    if name not in MODEL_FILES:
+        raise RegistryError(f"Unknown model: {name}")
+    if version is None:
+        version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S') + '-' + sha256_file(model_src)[:8]
+    rel_dir = Path('versions') / name / version
+    target = Path(base_dir) / rel_dir
+    target.mkdir(parents=True, exist_ok=True)
+    model_rel = rel_dir / MODEL_FILES[name]['model']
+    meta_rel = rel_dir / MODEL_FILES[name]['meta']
+    shutil.copyfile(model_src, Path(base_dir) / model_rel)
+    shutil.copyfile(meta_src, Path(base_dir) / meta_rel)
+
+    manifest = read_manifest(base_dir) or {'models': {}}
+    manifest['models'][name] = _entry_for(base_dir, version, model_rel, meta_rel)
+    write_manifest(manifest, base_dir)
+    return manifest['models'][name]
+
+
+def verify(base_dir=models_dir):
+    """Return a list of problems (missing files or hash mismatches)"""
+    manifest = read_manifest(base_dir)
+    if manifest is None:
+        return [f"No {MANIFEST_NAME} in {base_dir}"]
+    problems = []
+    for name, entry in manifest.get('models', {}).items():
+        for kind, info in entry['files'].items():
+            path = Path(base_dir) / info['path']
+            if not path.exists():
+                problems.append(f"{name}: missing {kind} file {info['path']}")
+            elif sha256_file(path) != info['sha256']:
+                problems.append(f"{name}: {kind} hash mismatch for {info['path']}")
+    return problems
+
+
+class LoadedModel:
+    """Immutable snapshot of one model version; ``handle`` is whatever the loader built"""
+
+    __slots__ = ('name', 'version', 'model_content', 'metadata', 'handle')
+
+    def __init__(self, name, version, model_content, metadata, handle):
+        self.name = name
+        self.version = version
+        self.model_content = model_content
+        self.metadata = metadata
+        self.handle = handle
+
+
+class MappedModel:
+    """Read-only mapping of a model file.
+
+    Processes forked after the mapping is made share its pages, and an
+    interpreter built from ``path`` maps the same page-cache pages instead of
+    holding a private copy of the model bytes.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.mapping, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            self.mapping.madvise(mmap.MADV_WILLNEED)
+
+    def __len__(self):
+        return len(self.mapping)
+
+
+def interpreter_source(model_content):
+    """Keyword arguments for tf.lite.Interpreter from bytes or a MappedModel"""
+    if isinstance(model_content, MappedModel):
+        return {'model_path': str(model_content.path)}
+    return {'model_content': model_content}
+
+
+def content_sha256(model_content):
+    """Hash of model bytes or a MappedModel"""
+    if isinstance(model_content, MappedModel):
+        return hashlib.sha256(model_content.mapping).hexdigest()
+    return hashlib.sha256(model_content).hexdigest()
+
+
+def default_loader(name, model_content, metadata):
+    """Build and warm up a single interpreter for the model"""
+    import numpy as np
+    import tensorflow as tf
+    interpreter = tf.lite.Interpreter(**interpreter_source(model_content))
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()
+    interpreter.set_tensor(input_details[0]['index'], np.zeros(input_details[0]['shape'], dtype=np.float32))
+    interpreter.invoke()
+    return interpreter
+
+
+def load_version(name, entry, base_dir=models_dir, loader=default_loader, use_mmap=False):
+    """Read, hash-check and load one manifest entry"""
+    files = entry['files']
+    model_path = Path(base_dir) / files['model']['path']
+    if use_mmap:
+        model_content = MappedModel(model_path)
+    else:
+        with open(model_path, 'rb') as f:
+            model_content = f.read()
+    if content_sha256(model_content) != files['model']['sha256']:
+        raise RegistryError(f"{name}: model hash mismatch for version {entry['version']}")
+    meta_path = Path(base_dir) / files['meta']['path']
+    if sha256_file(meta_path) != files['meta']['sha256']:
+        raise RegistryError(f"{name}: meta hash mismatch for version {entry['version']}")
+    with open(meta_path, 'r') as f:
+        metadata = json.load(f)
+    return LoadedModel(name, entry['version'], model_content, metadata, loader(name, model_content, metadata))
+
+
+class ModelRegistry:
+    """Holds the current version of every model and hot-swaps new ones"""
+
+    def __init__(self, base_dir=models_dir, names=None, loader=default_loader, poll_interval=2.0,
+                 on_swap=None, use_mmap=False):
+        self.base_dir = Path(base_dir)
+        self.names = list(names or MODEL_FILES)
+        self.loader = loader
+        self.use_mmap = use_mmap
+        self.poll_interval = poll_interval
+        self.on_swap = on_swap
+        self._models = {}
+        self._manifest_stamp = None
+        self._failed = {}  # name -> version that failed to load, retried on every poll until it loads
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load_all(self):
+        """Synchronously load every model; used once at startup"""
+        manifest = self._manifest()
+        models = {}
+        for name in self.names:
+            models[name] = load_version(name, self._entry(manifest, name), self.base_dir, self.loader,
+                                        self.use_mmap)
+        self._models = models
+        self._manifest_stamp = self._stamp()
+        return self
+
+    def rebuild(self, loader):
+        """Rebuild every handle with ``loader`` from the already loaded bytes and metadata.
+
+        Used after fork: the parent loads once with a cheap loader, each worker
+        then builds its own interpreters on top of the inherited snapshots.
+        """
+        self.loader = loader
+        self._models = {name: LoadedModel(name, model.version, model.model_content, model.metadata,
+                                          loader(name, model.model_content, model.metadata))
+                        for name, model in self._models.items()}
+        return self
+
+    def get(self, name):
+        """Current snapshot for ``name``; hold on to it for the duration of one request"""
+        return self._models[name]
+
+    def versions(self):
+        return {name: model.version for name, model in self._models.items()}
+
+    def check_for_updates(self):
+        """Load any changed versions and swap them in; returns the names that changed"""
+        stamp = self._stamp()
+        if stamp == self._manifest_stamp:
+            return []
+        manifest = self._manifest()
+        fresh = {}
+        failed = {}
+        for name in self.names:
+            entry = self._entry(manifest, name)
+            current = self._models.get(name)
+            if current is not None and current.version == entry['version']:
+                continue
+            try:
+                fresh[name] = load_version(name, entry, self.base_dir, self.loader, self.use_mmap)
+            except Exception as e:
+                # e.g. a file still being copied; logged once per version, retried until it loads
+                if self._failed.get(name) != entry['version']:
+                    print(f"model_registry: keeping {name} {current.version if current else None}: {e}",
+                          file=sys.stderr)
+                failed[name] = entry['version']
+        with self._swap_lock:
+            # Build the new mapping aside and replace the reference in one step
+            models = dict(self._models)
+            models.update(fresh)
+            self._models = models
+            self._failed = failed
+            # A stamp with failed entries is not recorded, so the next poll tries them again
+            if not failed:
+                self._manifest_stamp = stamp
+        for name, model in fresh.items():
+            if self.on_swap:
+                self.on_swap(name, model)
+        return list(fresh)
+
+    def start(self):
+        """Start the background watcher thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='model-registry-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_updates()
+            except Exception as e:
+                print(f"model_registry: update check failed: {e}", file=sys.stderr)
+
+    def _manifest(self):
+        manifest = read_manifest(self.base_dir)
+        if manifest is None:
+            # No manifest yet: treat the loose files as the only version
+            manifest = {'models': {}}
+            for name in self.names:
+                files = MODEL_FILES[name]
+                manifest['models'][name] = _entry_for(self.base_dir, 'loose', files['model'], files['meta'])
+        return manifest
+
+    def _entry(self, manifest, name):
+        try:
+            return manifest['models'][name]
+        except KeyError:
+            raise RegistryError(f"{name} is not in {self.base_dir / MANIFEST_NAME}")
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.base_dir / MANIFEST_NAME)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the versioned model registry')
+    parser.add_argument('--models-dir', default=str(models_dir))
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('init', help='Write a manifest for the loose model files')
+    pub = sub.add_parser('publish', help='Publish a new version of a model')
+    pub.add_argument('name', choices=sorted(MODEL_FILES))
+    pub.add_argument('--model', required=True)
+    pub.add_argument('--meta', required=True)
+    pub.add_argument('--version')
+    sub.add_parser('verify', help='Check every manifest hash')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        print(json.dumps(init_manifest(args.models_dir), indent=2))
+    elif args.command == 'publish':
+        print(json.dumps(publish(args.name, args.model, args.meta, args.version, args.models_dir), indent=2))
+    else:
+        problems = verify(args.models_dir)
+        print(json.dumps({'ok': not problems, 'problems': problems}))
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""Score a whole file on every core through shared-memory arrays.
+
+The parent reads the file column-wise with pyarrow and encodes it once into a
+float32 feature matrix in ``multiprocessing.shared_memory``. Encoding is
+vectorized: categories are mapped with ``index_in``, numerics come out of Arrow
+as arrays, and the one-hot/scaling math is ``RecordLayout.matrix``. Each worker
+process holds its own interpreter for the model version the parent resolved.
+The row range is split into one contiguous slice per worker, and every worker
+writes its predictions into a shared float32 output array. Only ``(start,
+stop)`` pairs cross the pipes, so no rows are pickled.
+
+The whole file is held in memory. For constant memory, or to resume a long run,
+use bulk_score.py instead.
+
+Usage:
+    python parallel_score.py score carbon profiles.parquet scored.parquet --workers 8 [--columns user_id]
+    python parallel_score.py bench future --rows 1000000 --workers 1,2,4,8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import resolve_model_files
+from wire_format import RecordLayout, PREDICTION_FLOOR
+
+OUTPUT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet', '.pq': 'parquet',
+                  '.npy': 'npy'}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.json
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise SystemExit("parallel_score.py needs pyarrow (pip install pyarrow)")
+
+
+class SharedArray:
+    """A numpy array backed by a named shared-memory block"""
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        # Workers are children of the creating process and share its resource tracker,
+        # so only the owner's unlink() releases the block
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker(model_path, input_spec, output_spec, batch_size, num_threads, conn):
+    """Worker process: score the (start, stop) slices the parent sends until it sends None"""
+    try:
+        from inference_core import ModelRunner
+        runner = ModelRunner(Path(model_path).read_bytes(), num_threads).warm_up()
+        inputs = SharedArray(input_spec[1], input_spec[2], name=input_spec[0])
+        outputs = SharedArray(output_spec[1], output_spec[2], name=output_spec[0])
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        return
+    conn.send(('ready', os.getpid()))
+    try:
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            start, stop = task
+            started = time.perf_counter()
+            try:
+                for first in range(start, stop, batch_size):
+                    last = min(first + batch_size, stop)
+                    outputs.array[first:last] = runner.predict(inputs.array[first:last])[:, 0]
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+                continue
+            conn.send(('done', time.perf_counter() - started))
+    finally:
+        inputs.close()
+        outputs.close()
+
+
+class ParallelScorer:
+    """Worker processes scoring row slices of a shared float32 feature matrix
+
+    Fill ``inputs[:n]`` (e.g. with ``encode_table``), then ``score(n)`` returns
+    ``outputs[:n]``. The buffers are reused across calls up to ``capacity`` rows.
+    """
+
+    def __init__(self, model, capacity, workers=None, batch_size=512, num_threads=1):
+        self.model = model
+        self.workers = workers or os.cpu_count() or 1
+        model_path, meta_path = resolve_model_files(model)
+        with open(meta_path, 'r') as f:
+            self.metadata = json.load(f)
+        self.layout = RecordLayout(model, self.metadata)
+        self.capacity = capacity
+        self.input_buffer = SharedArray((capacity, self.layout.n_features), np.float32)
+        self.output_buffer = SharedArray((capacity,), np.float32)
+        self.inputs = self.input_buffer.array
+        self.outputs = self.output_buffer.array
+        self.last_worker_seconds = []
+
+        context = multiprocessing.get_context('spawn')
+        self.connections, self.processes = [], []
+        for _ in range(self.workers):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=_worker, args=(str(model_path), self.input_buffer.spec,
+                                                            self.output_buffer.spec, batch_size, num_threads,
+                                                            child_end), daemon=True)
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+        for conn in self.connections:
+            status, detail = conn.recv()
+            if status != 'ready':
+                self.close()
+                raise RuntimeError(f"Scoring worker failed to start:\n{detail}")
+
+    def score(self, n):
+        """Predictions for ``inputs[:n]``, computed across the workers"""
+        if n > self.capacity:
+            raise ValueError(f"{n} rows exceed the {self.capacity}-row shared buffer")
+        bounds = np.linspace(0, n, self.workers + 1).astype(int)
+        busy = []
+        for conn, start, stop in zip(self.connections, bounds[:-1], bounds[1:]):
+            if stop > start:
+                conn.send((int(start), int(stop)))
+                busy.append(conn)
+        errors, self.last_worker_seconds = [], []
+        for conn in busy:
+            status, detail = conn.recv()
+            if status == 'error':
+                errors.append(detail)
+            else:
+                self.last_worker_seconds.append(detail)
+        if errors:
+            raise RuntimeError(f"Scoring worker failed:\n{errors[0]}")
+        return self.outputs[:n]
+
+    def close(self):
+        for conn, process in zip(self.connections, self.processes):
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.connections:
+            conn.close()
+        self.input_buffer.close()
+        self.output_buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def encode_table(layout, table, out):
+    """Arrow table of request fields -> the rows preprocess_batch would build, written into ``out``"""
+    pa = require_pyarrow()
+    pc = pa.compute
+    rows = table.num_rows
+    codes = np.zeros((rows, len(layout.categorical)), dtype=np.int64)
+    for i, (field, categories, default) in enumerate(layout.categorical):
+        column = table.column(field).cast(pa.string()) if field in table.column_names else None
+        if default is None and (column is None or column.null_count):
+            # No default to fill in (the recommendation inputs); the JSON path raises too
+            raise ValueError(f"{layout.model} input '{field}' is required but missing")
+        if column is None:
+            codes[:, i] = categories.index(default) if default in categories else 0
+            continue
+        if default is not None:
+            column = pc.fill_null(column, default)
+        # Unknown or missing values fall back to the first category, as in the JSON path
+        codes[:, i] = pc.fill_null(pc.index_in(column, value_set=pa.array(categories)), 0).to_numpy()
+    values = np.empty((rows, len(layout.numerical)), dtype=np.float64)
+    for i, (field, default) in enumerate(layout.numerical):
+        column = table.column(field).cast(pa.float64()) if field in table.column_names else None
+        if column is None or column.null_count:
+            if default is None:
+                raise ValueError(f"{layout.model} input '{field}' is required but missing")
+            column = pa.chunked_array([pa.array([default] * rows, pa.float64())]) if column is None else \
+                pc.fill_null(column, default)
+        values[:, i] = column.to_numpy()
+    return layout.matrix(codes, values, out=out[:rows])
+
+
+def read_table(path, layout):
+    """Whole input file as an Arrow table, with the categorical fields kept as text"""
+    pa = require_pyarrow()
+    kind = Path(path).suffix.lower()
+    if kind in ('.parquet', '.pq'):
+        return pa.parquet.read_table(path)
+    if kind in ('.jsonl', '.ndjson'):
+        return pa.json.read_json(path)
+    if kind == '.csv':
+        # Category values like "None" or "NA" must stay strings, and empty cells mean missing
+        string_types = {field: pa.string() for field, _, _ in layout.categorical}
+        return pa.csv.read_csv(path, convert_options=pa.csv.ConvertOptions(
+            column_types=string_types, strings_can_be_null=True, null_values=['']))
+    raise ValueError(f"Cannot tell the format of {path}; use .csv, .jsonl or .parquet")
+
+
+def write_output(path, table, predictions):
+    pa = require_pyarrow()
+    kind = OUTPUT_FORMATS.get(Path(path).suffix.lower())
+    if kind == 'npy':
+        np.save(path, predictions)
+        return
+    table = table.append_column('prediction', pa.array(predictions, pa.float32()))
+    if kind == 'parquet':
+        pa.parquet.write_table(table, path)
+    elif kind == 'csv':
+        pa.csv.write_csv(table, path)
+    elif kind == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            for batch in table.to_batches(max_chunksize=10000):
+                f.writelines(json.dumps(row) + '\n' for row in batch.to_pylist())
+    else:
+        raise ValueError(f"Cannot tell the output format of {path}; use .csv, .jsonl, .parquet or .npy")
+
+
+def score(args):
+    started = time.perf_counter()
+    metadata = json.loads(Path(resolve_model_files(args.model)[1]).read_text())
+    table = read_table(args.input, RecordLayout(args.model, metadata))
+    rows = table.num_rows
+    read_seconds = time.perf_counter() - started
+    with ParallelScorer(args.model, max(rows, 1), args.workers, args.batch_size, args.num_threads) as scorer:
+        phase = time.perf_counter()
+        encode_table(scorer.layout, table, scorer.inputs)
+        encode_seconds = time.perf_counter() - phase
+        phase = time.perf_counter()
+        predictions = scorer.score(rows).copy()
+        score_seconds = time.perf_counter() - phase
+    if not args.raw and PREDICTION_FLOOR[args.model] is not None:
+        predictions = np.maximum(predictions, PREDICTION_FLOOR[args.model])
+    output = table.select(args.columns.split(',')) if args.columns else table
+    phase = time.perf_counter()
+    write_output(args.output, output, predictions)
+    write_seconds = time.perf_counter() - phase
+    total = time.perf_counter() - started
+    print(f"{rows} rows with {scorer.workers} workers in {total:.2f}s ({rows / total:,.0f} rows/s): "
+          f"read {read_seconds:.2f}s, encode {encode_seconds:.2f}s, score {score_seconds:.2f}s "
+          f"({rows / score_seconds if score_seconds else 0:,.0f} rows/s), write {write_seconds:.2f}s -> {args.output}",
+          file=sys.stderr)
+
+
+def bench(args):
+    """Scoring throughput of the shared-memory workers at several worker counts"""
+    from sample_inputs import synthetic_rows
+    pa = require_pyarrow()
+    base = synthetic_rows(args.model, min(args.rows, 10000), seed=11)
+    table = pa.Table.from_pylist([base[i % len(base)] for i in range(args.rows)])
+    results = []
+    for workers in [int(count) for count in args.workers.split(',')]:
+        with ParallelScorer(args.model, args.rows, workers, args.batch_size, args.num_threads) as scorer:
+            phase = time.perf_counter()
+            encode_table(scorer.layout, table, scorer.inputs)
+            encode_seconds = time.perf_counter() - phase
+            seconds = min(_timed(scorer.score, args.rows) for _ in range(args.repeat))
+        throughput = args.rows / seconds
+        # Relative to the first worker count given (normally 1)
+        first = results[0] if results else {'workers': workers, 'rows_per_second': throughput}
+        speedup = throughput / first['rows_per_second']
+        results.append({'workers': workers, 'rows_per_second': round(throughput), 'speedup': round(speedup, 2),
+                        'efficiency': round(speedup * first['workers'] / workers, 2),
+                        'encode_seconds': round(encode_seconds, 3)})
+        print(f"workers={workers:>3}  {throughput:>12,.0f} rows/s  speedup x{results[-1]['speedup']:<5} "
+              f"efficiency {results[-1]['efficiency']:.0%}  (encode {encode_seconds:.2f}s once)", file=sys.stderr)
+    print(json.dumps({'model': args.model, 'rows': args.rows, 'cpus': os.cpu_count(), 'results': results},
+                     indent=2))
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process scoring over shared-memory arrays')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    score_parser = commands.add_parser('score', help='Score a CSV/JSONL/Parquet file')
+    score_parser.add_argument('model', choices=['carbon', 'future', 'recommendation'])
+    score_parser.add_argument('input')
+    score_parser.add_argument('output', help='.csv, .jsonl, .parquet, or .npy for the predictions alone')
+    score_parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs)')
+    score_parser.add_argument('--columns', help='Input columns to copy to the output (default: all)')
+    score_parser.add_argument('--raw', action='store_true', help='Keep negative model outputs (no floor at 0)')
+    score_parser.set_defaults(handler=score)
+
+    bench_parser = commands.add_parser('bench', help='Throughput at several worker counts')
+    bench_parser.add_argument('model', choices=['carbon', 'future', 'recommendation'])
+    bench_parser.add_argument('--rows', type=int, default=1000000)
+    bench_parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts')
+    bench_parser.add_argument('--repeat', type=int, default=3, help='Timed passes per count (best is kept)')
+    bench_parser.set_defaults(handler=bench)
+
+    for sub in (score_parser, bench_parser):
+        sub.add_argument('--batch-size', type=int, default=512, help='Rows per interpreter invoke')
+        sub.add_argument('--num-threads', type=int, default=1, help='TFLite threads per worker')
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""Append-only columnar log of served predictions, for analytics, retraining and drift analysis.
+
+With ``ML_PREDICTION_LOG_DIR`` set, every batch the inference core scores is
+buffered in memory as typed columns and written out in batches, one file per
+model, day and flush:
+
+    <dir>/model=carbon/date=2026-10-18/part-231502-4711-000003.parquet
+
+Each file holds one row per prediction:
+
+    timestamp     when the batch was scored (UTC, microseconds)
+    version       registry version of the model that scored it
+    <categorical> one string column per categorical input, as sent (unknown values included)
+    <numerical>   one float32 column per numeric input, as sent
+    prediction    float32 raw model output (before format_result's rounding/floor)
+
+The columns come from the model's RecordLayout (see wire_format.py). Binary
+frames carry no input dicts, so their inputs are recovered from the feature
+matrix; an unknown category is then logged as the category it was scored as.
+
+Files are Parquet when pyarrow is installed and .npz otherwise (one array per
+column; ``ML_PREDICTION_LOG_FORMAT=npz`` forces it). Scoring only appends a
+reference to the batch (input dicts or feature matrix, and predictions) to an
+in-memory buffer. A background thread builds the columns and writes the file
+once the buffer holds ``ML_PREDICTION_LOG_ROWS`` rows, its oldest row is
+``ML_PREDICTION_LOG_FLUSH_SECONDS`` old or the model version changes; the rest
+is written on shutdown. The age is checked by a flusher thread (started with the
+first recorded batch, in the process that records it) as well as on every
+``record``, so a model that stops getting traffic is still written out on time. Each process writes its own files under a temporary
+name and renames them into place, so readers never see a partial file and
+pre-fork workers need no coordination.
+
+``scan`` reads the log back. Whole days outside ``since``/``until`` are skipped
+by their directory, only the requested columns (plus the filtered ones) are
+read, and the (column, op, value) filters go to pyarrow's row-group pruning:
+
+    python prediction_log.py scan carbon --since 2026-10-01 --columns vehicle_distance,prediction \\
+        --where "transport==car" --where "vehicle_distance>1000" [--output car.csv]
+
+Environment:
+    ML_PREDICTION_LOG_DIR            log directory (default: unset, predictions are not logged)
+    ML_PREDICTION_LOG_ROWS           buffered rows per model that trigger a write (default: 20000)
+    ML_PREDICTION_LOG_FLUSH_SECONDS  longest a row stays buffered, give or take a quarter (default: 60)
+    ML_PREDICTION_LOG_FORMAT         parquet or npz (default: parquet when pyarrow is installed)
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import operator
+import argparse
+import threading
+import itertools
+
+import numpy as np
+
+FILTER_OPS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda column, values: np.isin(column, list(values)),
+    'not in': lambda column, values: ~np.isin(column, list(values)),
+}
+# Longest operators first, so "<=" is not read as "<"
+WHERE_OPS = ('==', '!=', '<=', '>=', '<', '>')
+
+
+def have_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return True
+    except ImportError:
+        return False
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class LogSchema:
+    """Columns of one model version's log, built from buffered batches at write time"""
+
+    def __init__(self, layout, version):
+        self.layout = layout
+        self.version = version
+        self.categorical = list(layout.categorical)
+        self.numerical = list(layout.numerical)
+        self.dtypes = {'timestamp': 'datetime64[us]', 'version': str}
+        self.dtypes.update({field: str for field, _, _ in self.categorical})
+        self.dtypes.update({field: np.float32 for field, _ in self.numerical})
+        self.dtypes['prediction'] = np.float32
+
+    def inputs(self, features=None, rows=None):
+        """Input columns as lists, from the raw dicts or recovered from the feature matrix"""
+        if rows is not None:
+            columns = {field: [_text(row.get(field, default)) for row in rows]
+                       for field, _, default in self.categorical}
+            columns.update({field: [_number(row.get(field, default)) for row in rows]
+                            for field, default in self.numerical})
+            return columns
+        layout = self.layout
+        features = np.asarray(features, dtype=np.float64)
+        if layout.one_hot:
+            codes = [features[:, offset:offset + len(categories)].argmax(axis=1)
+                     for offset, (_, categories, _) in zip(layout.offsets, self.categorical)]
+            values = features[:, layout.n_onehot:] * layout.scale + layout.mean
+        else:
+            # Scaled label codes and numerics alternate (see RecordLayout.matrix)
+            unscaled = features * layout.scale + layout.mean
+            codes = [np.clip(np.rint(unscaled[:, column]).astype(np.int64), 0, len(categories) - 1)
+                     for column, (_, categories, _) in zip((0, 2), self.categorical)]
+            values = unscaled[:, [1, 3]]
+        columns = {field: [categories[code] for code in code_column.tolist()]
+                   for (field, categories, _), code_column in zip(self.categorical, codes)}
+        columns.update({field: values[:, i].tolist() for i, (field, _) in enumerate(self.numerical)})
+        return columns
+
+    def columns(self, batches):
+        """Buffered (timestamp, version, rows, features, predictions) batches -> {column: array}"""
+        columns = {name: [] for name in self.dtypes}
+        # Consecutive batches of the same kind are converted together, not one micro-batch at a time
+        for has_rows, group in itertools.groupby(batches, key=lambda batch: batch[2] is not None):
+            group = list(group)
+            if has_rows:
+                inputs = self.inputs(rows=[row for batch in group for row in batch[2]])
+            else:
+                inputs = self.inputs(np.concatenate([batch[3] for batch in group]))
+            for name, values in inputs.items():
+                columns[name].extend(values)
+            for timestamp, version, _, _, predictions in group:
+                columns['timestamp'].extend([timestamp] * len(predictions))
+                columns['version'].extend([version] * len(predictions))
+                columns['prediction'].extend(predictions.tolist())
+        return {name: np.array(values, dtype=self.dtypes[name]) for name, values in columns.items()}
+
+
+class ModelBuffer:
+    """Scored batches of one model version waiting to be written.
+
+    Only references are kept on the request path; the columns are built when the buffer is written.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.batches = []
+        self.rows = 0
+        self.oldest = time.monotonic()
+
+    def append(self, batch, rows):
+        self.batches.append(batch)
+        self.rows += rows
+
+
+def write_part(directory, model, columns, fmt, sequence):
+    """Write one file per day in ``columns``; returns the paths written"""
+    paths = []
+    days = columns['timestamp'].astype('datetime64[D]')
+    for day in np.unique(days):
+        select = days == day
+        part = {name: values[select] for name, values in columns.items()}
+        folder = os.path.join(directory, f'model={model}', f'date={day}')
+        os.makedirs(folder, exist_ok=True)
+        stamp = time.strftime('%H%M%S', time.gmtime())
+        path = os.path.join(folder, f'part-{stamp}-{os.getpid()}-{sequence:06d}.{fmt}')
+        # Dot-prefixed while being written; scan skips it until the rename
+        tmp = os.path.join(folder, f'.{os.path.basename(path)}.tmp')
+        if fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            arrays = {name: pa.array(values, type=pa.timestamp('us', tz='UTC')) if name == 'timestamp'
+                      else pa.array(values) for name, values in part.items()}
+            pq.write_table(pa.table(arrays), tmp)
+        else:
+            with open(tmp, 'wb') as f:
+                np.savez(f, **part)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+class PredictionLog:
+    """Buffers scored batches per model and writes them as columnar parts; one per process (``PREDICTION_LOG``)"""
+
+    def __init__(self, directory=None, max_rows=20000, flush_seconds=60.0, fmt=None):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        # pyarrow is only imported when logging is on; it is slow to import
+        self.format = fmt or (('parquet' if have_pyarrow() else 'npz') if directory else None)
+        self.schemas = {}  # (model, version) -> LogSchema
+        self.buffers = {}  # model -> ModelBuffer
+        self.rows_written = 0
+        self.files_written = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writers = []
+        self._flusher = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        return cls(directory=os.environ.get('ML_PREDICTION_LOG_DIR') or None,
+                   max_rows=int(os.environ.get('ML_PREDICTION_LOG_ROWS', 20000)),
+                   flush_seconds=float(os.environ.get('ML_PREDICTION_LOG_FLUSH_SECONDS', 60)),
+                   fmt=os.environ.get('ML_PREDICTION_LOG_FORMAT') or None)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _schema(self, model, snapshot):
+        key = (model, snapshot.version)
+        schema = self.schemas.get(key)
+        if schema is None:
+            from wire_format import RecordLayout
+            schema = self.schemas[key] = LogSchema(RecordLayout(model, snapshot.metadata), snapshot.version)
+        return schema
+
+    def record(self, model, snapshot, features, predictions, rows=None):
+        """Buffer one scored batch: its inputs (dicts or feature matrix) and the raw predictions"""
+        if not self.enabled:
+            return
+        predictions = np.asarray(predictions, dtype=np.float32).reshape(len(features), -1)[:, 0]
+        batch = (time.time_ns() // 1000, str(snapshot.version), rows, None if rows is not None else features,
+                 predictions)
+        taken = []
+        with self._lock:
+            buffer = self.buffers.get(model)
+            if buffer is not None and buffer.schema.version != snapshot.version:
+                # A new version can bring new categories, so its rows start a file of their own
+                taken.append(self.buffers.pop(model))
+                buffer = None
+            if buffer is None:
+                buffer = self.buffers[model] = ModelBuffer(self._schema(model, snapshot))
+            buffer.append(batch, len(predictions))
+            if buffer.rows >= self.max_rows or time.monotonic() - buffer.oldest >= self.flush_seconds:
+                taken.append(self.buffers.pop(model))
+            # Not inherited across fork, so each pre-fork worker starts its own
+            if self._flusher is None or not self._flusher.is_alive():
+                self._stop = threading.Event()
+                self._flusher = threading.Thread(target=self._flush_old, args=(self._stop,),
+                                                 name='prediction-log-flusher', daemon=True)
+                self._flusher.start()
+        if taken:
+            # Written by a background thread, so no request waits for the file
+            writer = threading.Thread(target=self._write_logged, args=(model, taken), name='prediction-log', daemon=True)
+            with self._lock:
+                self._writers = [thread for thread in self._writers if thread.is_alive()] + [writer]
+            writer.start()
+
+    def _flush_old(self, stop):
+        """Flusher thread: write buffers whose oldest row is ``flush_seconds`` old"""
+        while not stop.wait(max(0.05, self.flush_seconds / 4)):
+            now = time.monotonic()
+            with self._lock:
+                taken = {model: buffer for model, buffer in self.buffers.items()
+                         if now - buffer.oldest >= self.flush_seconds}
+                for model in taken:
+                    del self.buffers[model]
+            for model, buffer in taken.items():
+                self._write_logged(model, [buffer])
+
+    def flush(self):
+        """Write every buffered batch and wait for the background writes (on shutdown)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            taken, self.buffers = self.buffers, {}
+            writers, self._writers = self._writers, []
+            flusher, self._flusher = self._flusher, None
+            self._stop.set()
+        if flusher is not None:
+            flusher.join()
+        for model, buffer in taken.items():
+            self._write(model, [buffer])
+        for writer in writers:
+            writer.join()
+
+    def _write_logged(self, model, buffers):
+        """Background-thread ``_write``: a failed write is logged, and the buffers dropped"""
+        try:
+            self._write(model, buffers)
+        except Exception as e:
+            print(f"prediction_log: writing {model} failed: {e}", file=sys.stderr)
+
+    def _write(self, model, buffers):
+        with self._write_lock:
+            for buffer in buffers:
+                columns = buffer.schema.columns(buffer.batches)
+                paths = write_part(self.directory, model, columns, self.format, next(self._sequence))
+                self.rows_written += buffer.rows
+                self.files_written += len(paths)
+
+    def stats(self):
+        with self._lock:
+            buffered = {name: buffer.rows for name, buffer in self.buffers.items()}
+        return {'directory': self.directory, 'format': self.format, 'buffered_rows': buffered,
+                'rows_written': self.rows_written, 'files_written': self.files_written}
+
+
+PREDICTION_LOG = PredictionLog.from_env()
+
+
+def log_files(directory, model, since=None, until=None):
+    """Part files of ``model``, oldest day first, skipping days outside [since, until] (YYYY-MM-DD)"""
+    files = []
+    for folder in sorted(glob.glob(os.path.join(directory, f'model={model}', 'date=*'))):
+        day = os.path.basename(folder)[len('date='):]
+        if (since and day < since) or (until and day > until):
+            continue
+        files.extend(sorted(glob.glob(os.path.join(folder, 'part-*.parquet')) +
+                            glob.glob(os.path.join(folder, 'part-*.npz'))))
+    return files
+
+
+def _read_part(path, names, filters):
+    """Columns ``names`` of the rows of one part file that pass ``filters``"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=names, filters=[tuple(f) for f in filters] or None)
+        columns = {}
+        for name in names:
+            column = table.column(name)
+            if name == 'timestamp':
+                columns[name] = column.cast('int64').to_numpy().astype('datetime64[us]')
+            else:
+                values = column.to_numpy()
+                # Strings come back as objects; match the fixed-width strings of the npz files
+                columns[name] = values.astype(str) if values.dtype == object else values
+        return columns
+    with np.load(path) as part:
+        columns = {name: part[name] for name in names}
+    if filters:
+        keep = np.ones(len(next(iter(columns.values()))), dtype=bool)
+        for column, op, value in filters:
+            keep &= FILTER_OPS[op](columns[column], value)
+        columns = {name: values[keep] for name, values in columns.items()}
+    return columns
+
+
+def iter_scan(directory, model, columns=None, filters=(), since=None, until=None):
+    """Yield {column: array} per part file, projected to ``columns`` and filtered by ``filters``.
+
+    ``filters`` are (column, op, value) triples with op one of ==, !=, <, <=, >, >=, in, not in;
+    they are ANDed.
+    """
+    for path in log_files(directory, model, since, until):
+        available = _column_names(path)
+        wanted = list(columns) if columns else available
+        missing = [name for name in wanted + [f[0] for f in filters] if name not in available]
+        if missing:
+            raise KeyError(f"{path} has no column {missing[0]} (has {', '.join(available)})")
+        names = wanted + [f[0] for f in filters if f[0] not in wanted]
+        part = _read_part(path, names, filters)
+        yield {name: part[name] for name in wanted}
+
+
+def _column_names(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    with np.load(path) as part:
+        return list(part.files)
+
+
+def scan(directory, model, columns=None, filters=(), since=None, until=None):
+    """Every matching row of the log as one {column: array}"""
+    parts = [part for part in iter_scan(directory, model, columns, filters, since, until)
+             if len(next(iter(part.values()), ()))]
+    if not parts:
+        return {name: np.array([]) for name in columns or ()}
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def parse_where(text):
+    """'vehicle_distance>1000' -> ('vehicle_distance', '>', 1000.0); a value that is not a number stays a string"""
+    for op in WHERE_OPS:
+        column, found, value = text.partition(op)
+        if found:
+            value = value.strip()
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+            return column.strip(), op, value
+    raise ValueError(f"Cannot parse filter {text!r}; expected e.g. vehicle_distance>1000 or transport==car")
+
+
+def write_columns(path, columns):
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({name: pa.array(values) for name, values in columns.items()}), path)
+    elif path.endswith('.npz'):
+        np.savez(path, **columns)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*(values.tolist() for values in columns.values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read the columnar prediction log')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan_parser = commands.add_parser('scan', help='Filter and project the logged predictions of one model')
+    scan_parser.add_argument('model')
+    scan_parser.add_argument('--dir', default=os.environ.get('ML_PREDICTION_LOG_DIR', '/tmp/ml-predictions'))
+    scan_parser.add_argument('--columns', help='Comma-separated columns to read (default: all)')
+    scan_parser.add_argument('--where', action='append', default=[], help='Row filter, e.g. vehicle_distance>1000')
+    scan_parser.add_argument('--since', help='First day to read, YYYY-MM-DD')
+    scan_parser.add_argument('--until', help='Last day to read, YYYY-MM-DD')
+    scan_parser.add_argument('--output', help='Write the rows to .csv, .parquet or .npz instead of a summary')
+    args = parser.parse_args()
+
+    try:
+        filters = [parse_where(text) for text in args.where]
+    except ValueError as e:
+        parser.error(e.args[0])
+    columns = args.columns.split(',') if args.columns else None
+    started = time.perf_counter()
+    try:
+        result = scan(args.dir, args.model, columns, filters, args.since, args.until)
+    except KeyError as e:
+        parser.error(e.args[0])
+    seconds = time.perf_counter() - started
+    rows = len(next(iter(result.values()), ()))
+    if args.output:
+        write_columns(args.output, result)
+        print(f"Wrote {rows} rows to {args.output} in {seconds:.2f}s")
+        return
+    summary = {'model': args.model, 'rows': rows, 'files': len(log_files(args.dir, args.model, args.since, args.until)),
+               'seconds': round(seconds, 3), 'columns': {}}
+    for name, values in result.items():
+        if values.dtype.kind == 'f' and rows:
+            summary['columns'][name] = {'mean': float(np.nanmean(values)), 'min': float(np.nanmin(values)),
+                                        'max': float(np.nanmax(values))}
+        elif values.dtype.kind in 'UO' and rows:
+            found, counts = np.unique(values.astype(str), return_counts=True)
+            summary['columns'][name] = dict(zip(found.tolist(), counts.tolist()))
+        elif values.dtype.kind == 'M' and rows:
+            summary['columns'][name] = {'first': str(values.min()), 'last': str(values.max())}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
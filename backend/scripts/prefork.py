@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Pre-fork worker pool for the inference server.
+
+The parent binds the Unix socket, imports the scoring modules, memory-maps and
+hash-checks every ``.tflite`` file and parses the metadata once, then forks N
+workers. Each worker inherits those pages copy-on-write and builds its own
+interpreter pool from the mapped files, so the model bytes are shared through
+the page cache rather than copied per worker. All workers accept on the same
+listening socket.
+
+The parent supervises: a worker that exits unexpectedly is restarted (with a
+back-off if it keeps crashing right after start). Startup time and per-worker
+RSS/PSS are reported on stderr whenever a worker becomes ready.
+"""
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import asyncio
+
+from model_registry import ModelRegistry, models_dir
+from inference_core import InferenceCore, SCORING_MODULES, scoring_module
+
+# A worker that dies sooner than this after starting counts as a crash loop
+MIN_WORKER_LIFETIME = 5.0
+MAX_RESTART_DELAY = 30.0
+
+
+def memory_usage_kb(pid='self'):
+    """RSS and (when available) PSS of a process in kB, from /proc"""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_kb'] = int(line.split()[1])
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    usage['pss_kb'] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+def log(event, **fields):
+    print(json.dumps(dict(event=event, **fields)), file=sys.stderr, flush=True)
+
+
+class PreforkSupervisor:
+    def __init__(self, socket_path, workers, base_dir=models_dir, binary=False):
+        self.socket_path = socket_path
+        self.n_workers = workers
+        self.binary = binary
+        self.base_dir = base_dir
+        self.started_at = time.monotonic()
+        self.registry = None
+        self.sock = None
+        self.workers = {}  # pid -> (slot, started monotonic)
+        self.crashes = {}  # slot -> consecutive quick crashes
+        self.restarts = {}  # slot -> monotonic time its replacement is due
+        self.stopping = False
+        self.ready_read = None
+        self.ready_write = None
+
+    def prepare(self):
+        """Everything done once in the parent before forking"""
+        for name in SCORING_MODULES:
+            scoring_module(name)  # import TF, NumPy and the preprocessing code once
+        self.registry = ModelRegistry(self.base_dir, loader=lambda name, content, metadata: None,
+                                      use_mmap=True).load_all()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self.sock.listen(512)
+        self.ready_read, self.ready_write = os.pipe()
+        log('parent_ready', prepare_seconds=round(time.monotonic() - self.started_at, 3),
+            versions=self.registry.versions(), **memory_usage_kb())
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)  # never returns
+        self.workers[pid] = (slot, time.monotonic())
+
+    def _run_worker(self, slot):
+        code = 0
+        try:
+            os.close(self.ready_read)
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(sig, signal.SIG_DFL)
+            started = time.monotonic()
+            from batching import BatchScheduler
+            from inference_server import serve
+            core = InferenceCore(registry=self.registry)
+            scheduler = BatchScheduler(core)
+
+            def ready():
+                report = dict(pid=os.getpid(), slot=slot, startup_seconds=round(time.monotonic() - started, 3),
+                              **memory_usage_kb())
+                os.write(self.ready_write, (json.dumps(report) + '\n').encode('utf-8'))
+
+            asyncio.run(serve(sock=self.sock, scheduler=scheduler, ready=ready, binary=self.binary))
+        except Exception as e:
+            log('worker_error', pid=os.getpid(), slot=slot, error=str(e))
+            code = 1
+        finally:
+            os._exit(code)
+
+    def run(self):
+        self.prepare()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for slot in range(self.n_workers):
+            self.spawn(slot)
+        pending = b''
+        try:
+            while not self.stopping or self.workers:
+                readable, _, _ = select.select([self.ready_read], [], [], 0.1)
+                if readable:
+                    pending += os.read(self.ready_read, 65536)
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        self._report_ready(json.loads(line))
+                self._reap()
+                self._restart_due()
+        finally:
+            self.sock.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _report_ready(self, report):
+        report['since_parent_start_seconds'] = round(time.monotonic() - self.started_at, 3)
+        log('worker_ready', **report)
+
+    def _reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            slot, started = self.workers.pop(pid)
+            if self.stopping:
+                continue
+            lifetime = time.monotonic() - started
+            self.crashes[slot] = self.crashes.get(slot, 0) + 1 if lifetime < MIN_WORKER_LIFETIME else 0
+            delay = min(MAX_RESTART_DELAY, 0.5 * (2 ** self.crashes[slot]) - 0.5)
+            log('worker_exit', pid=pid, slot=slot, status=status, lifetime_seconds=round(lifetime, 3),
+                restart_delay_seconds=delay)
+            # Spawned from the main loop once due, so one slot's back-off
+            # doesn't hold up reaping and restarting the others
+            self.restarts[slot] = time.monotonic() + delay
+
+    def _restart_due(self):
+        if self.stopping:
+            self.restarts.clear()
+            return
+        now = time.monotonic()
+        for slot, due in list(self.restarts.items()):
+            if due <= now:
+                del self.restarts[slot]
+                self.spawn(slot)
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
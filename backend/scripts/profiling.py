@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""On-demand CPU and memory profiling for inference requests and training runs.
+
+Profiling is off unless ``ML_PROFILE`` names one or more modes:
+
+    cpu     cProfile the request; dump a ``.prof`` file (open with pstats or snakeviz)
+    memory  tracemalloc the request; write the top allocation sites to ``.alloc.txt``
+    rss     record peak RSS before/after the request (cheap, no tracing)
+    all     all of the above
+
+Only every N-th request is profiled (``ML_PROFILE_EVERY``, default 100). The
+counter starts at a random offset, so one-shot scripts that handle a single
+request per process are sampled with probability 1/N. Long-running modes
+profile exactly every N-th request. Only one request is profiled at a time; any
+other request sampled while a profile is running is skipped. With a rate
+like 1000 it is safe to leave on for production traffic.
+
+The cpu mode profiles only the thread running the request. The memory and
+rss modes cover the whole process: tracemalloc records allocations from every
+thread, so in the inference server or any mode that scores requests
+concurrently, the allocation sites and peaks include whatever other requests
+were running at the time. Take memory profiles at concurrency 1, e.g.
+a single one-shot script or ``loadtest.py --concurrency 1`` against an otherwise
+idle server.
+
+Every profiled request appends a summary line (label, wall time, peak RSS,
+tracemalloc peak, written files) to ``profiles.jsonl`` in ``ML_PROFILE_DIR``
+(default: /tmp/ml-profiles).
+
+Environment:
+    ML_PROFILE        comma-separated modes: cpu, memory, rss, all (default: off)
+    ML_PROFILE_EVERY  profile one request in N (default: 100)
+    ML_PROFILE_DIR    output directory (default: /tmp/ml-profiles)
+    ML_PROFILE_TOP    allocation sites to keep per memory profile (default: 25)
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import threading
+
+MODES = ('cpu', 'memory', 'rss')
+
+
+class _NullSession:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SESSION = _NullSession()
+
+
+def parse_modes(value):
+    return [m.strip() for m in value.split(',') if m.strip()]
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far (ru_maxrss is kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ProfileSession:
+    """Profiles one request; created by Profiler.request() when the request is sampled"""
+
+    def __init__(self, profiler, label, sequence):
+        self.profiler = profiler
+        self.label = label
+        self.sequence = sequence
+        self.cpu = None
+        self.memory_started = False
+
+    def __enter__(self):
+        self.started = time.time()
+        self.wall_started = time.perf_counter()
+        self.rss_before = peak_rss_kb()
+        # Import before the baseline snapshot so it does not count as request allocations
+        import cProfile
+        if 'memory' in self.profiler.modes:
+            import tracemalloc
+            self.memory_started = not tracemalloc.is_tracing()
+            if self.memory_started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.take_snapshot()
+        if 'cpu' in self.profiler.modes:
+            self.cpu = cProfile.Profile()
+            self.cpu.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._write(time.perf_counter() - self.wall_started)
+        except Exception as e:
+            # e.g. a full disk: the profile is lost, the request is not
+            print(f"profiling: writing the {self.label} profile failed: {e}", file=sys.stderr)
+        finally:
+            if self.memory_started:
+                import tracemalloc
+                tracemalloc.stop()  # also when _write failed part way
+            self.profiler._release()
+        return False
+
+    def _write(self, wall_seconds):
+        if self.cpu is not None:
+            self.cpu.disable()
+        stem = os.path.join(self.profiler.directory,
+                            f'{self.label}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{self.sequence}')
+        os.makedirs(self.profiler.directory, exist_ok=True)
+        summary = {
+            'label': self.label,
+            'pid': os.getpid(),
+            'started': self.started,
+            'wall_seconds': round(wall_seconds, 6),
+            'files': [],
+        }
+        # Allocations first, so the cProfile dump below does not show up in them
+        if 'memory' in self.profiler.modes:
+            summary.update(self._write_allocations(stem + '.alloc.txt'))
+            summary['files'].append(stem + '.alloc.txt')
+        if self.cpu is not None:
+            self.cpu.dump_stats(stem + '.prof')
+            summary['files'].append(stem + '.prof')
+        if 'rss' in self.profiler.modes:
+            summary['peak_rss_kb'] = peak_rss_kb()
+            summary['peak_rss_growth_kb'] = summary['peak_rss_kb'] - self.rss_before
+        with open(os.path.join(self.profiler.directory, 'profiles.jsonl'), 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+    def _write_allocations(self, path):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        import cProfile
+        # Leave out the profilers' own bookkeeping
+        ignore = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile)]
+        ignore.append(tracemalloc.Filter(False, __file__))
+        growth = snapshot.filter_traces(ignore).compare_to(self.memory_before.filter_traces(ignore), 'lineno')
+        with open(path, 'w') as f:
+            f.write(f'# {self.label}: traced peak {peak / 1024:.1f} KiB, top {self.profiler.top} sites by growth\n')
+            for stat in growth[:self.profiler.top]:
+                f.write(f'{stat}\n')
+        return {'tracemalloc_peak_kb': round(peak / 1024, 1)}
+
+
+class Profiler:
+    """Decides which requests to profile and hands out sessions for them"""
+
+    def __init__(self, modes=(), every=100, directory='/tmp/ml-profiles', top=25):
+        self.directory = directory
+        self.top = top
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._active = False
+        self.configure(modes, every)
+
+    @classmethod
+    def from_env(cls):
+        return cls(parse_modes(os.environ.get('ML_PROFILE', '')), int(os.environ.get('ML_PROFILE_EVERY', 100)),
+                   os.environ.get('ML_PROFILE_DIR', '/tmp/ml-profiles'), int(os.environ.get('ML_PROFILE_TOP', 25)))
+
+    def configure(self, modes=None, every=None, directory=None):
+        """Change settings in place (e.g. from command-line flags); None keeps the current value"""
+        if modes is not None:
+            modes = set(modes)
+            if 'all' in modes:
+                modes = set(MODES)
+            unknown = modes - set(MODES)
+            if unknown:
+                raise ValueError(f"Unknown profiling mode(s): {', '.join(sorted(unknown))}")
+            self.modes = modes
+            self.enabled = bool(modes)
+        if every is not None:
+            self.every = max(1, int(every))
+            self._count = random.randrange(self.every)
+        if directory is not None:
+            self.directory = directory
+        return self
+
+    def request(self, label):
+        """Context manager for one request: a ProfileSession if sampled, else a no-op"""
+        if not self.enabled:
+            return NULL_SESSION
+        with self._lock:
+            self._count += 1
+            if self._count % self.every or self._active:
+                return NULL_SESSION
+            self._active = True
+            self._sequence += 1
+            sequence = self._sequence
+        return ProfileSession(self, label, sequence)
+
+    def _release(self):
+        with self._lock:
+            self._active = False
+
+
+PROFILER = Profiler.from_env()
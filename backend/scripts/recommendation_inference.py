@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 import sys
 import json
+from inference_metrics import METRICS, process_uptime
 import numpy as np
 import tensorflow as tf
 import os
 from pathlib import Path
+from model_registry import resolve_model_files
+from profiling import PROFILER
 
 # Get the directory of this script
 script_dir = Path(__file__).parent
@@ -12,41 +15,34 @@ models_dir = script_dir.parent / 'src' / 'ml_models'
 
 def load_metadata():
     """Load preprocessing metadata"""
-    meta_path = models_dir / 'recommendation_v2_meta.json'
+    _, meta_path = resolve_model_files('recommendation')
     with open(meta_path, 'r') as f:
         return json.load(f)
 
-def preprocess_input(data, metadata):
-    """Preprocess input data for the model"""
-    # Map commute mode to encoded value
-    commute_classes = metadata['le_commute_classes']
-    diet_classes = metadata['le_diet_classes']
-    
-    try:
-        commute_encoded = commute_classes.index(data['commute_mode'])
-    except ValueError:
-        commute_encoded = 0  # Default to first class if not found
-    
-    try:
-        diet_encoded = diet_classes.index(data['diet_type'])
-    except ValueError:
-        diet_encoded = 0  # Default to first class if not found
-    
-    # Create feature vector
+def preprocess_batch(rows, metadata):
+    """Preprocess a list of input dicts into one (N, 4) scaled matrix"""
+    # Unknown classes fall back to the first class
+    commute_lookup = {value: i for i, value in enumerate(metadata['le_commute_classes'])}
+    diet_lookup = {value: i for i, value in enumerate(metadata['le_diet_classes'])}
+
     features = np.array([[
-        commute_encoded,
-        data['distance_km'],
-        diet_encoded,
-        data['energy_usage_kWh']
-    ]], dtype=np.float32)
-    
+        commute_lookup.get(row['commute_mode'], 0),
+        row['distance_km'],
+        diet_lookup.get(row['diet_type'], 0),
+        row['energy_usage_kWh']
+    ] for row in rows], dtype=np.float32).reshape(len(rows), 4)
+
     # Apply scaling
     scaler_mean = np.array(metadata['scaler_mean'], dtype=np.float32)
     scaler_scale = np.array(metadata['scaler_scale'], dtype=np.float32)
     features_scaled = (features - scaler_mean) / scaler_scale
-    
+
     return features_scaled.astype(np.float32)
 
+def preprocess_input(data, metadata):
+    """Preprocess input data for the model"""
+    return preprocess_batch([data], metadata)
+
 def generate_recommendations(current_emission, input_data, metadata):
     """Generate recommendations for reducing carbon footprint"""
     recommendations = []
@@ -105,51 +101,73 @@ def generate_recommendations(current_emission, input_data, metadata):
     alternatives.sort(key=lambda x: x['emission_saving'], reverse=True)
     return alternatives[:3]
 
+def format_result(prediction, input_data, metadata):
+    """Turn one raw model output into the response dict"""
+    current_emission = float(prediction)
+
+    # Calculate green score
+    green_score = max(0, 100 - (current_emission / 0.7))
+    green_score = min(100, round(green_score, 2))
+
+    # Generate recommendations
+    recommendations = generate_recommendations(current_emission, input_data, metadata)
+
+    return {
+        'current_emission': round(current_emission, 2),
+        'green_score': green_score,
+        'recommendations': recommendations
+    }
+
 def main():
+    if '--binary' in sys.argv[1:]:
+        # Length-prefixed binary frames instead of one JSON object (see wire_format.py)
+        from wire_format import serve_stdio
+        serve_stdio('recommendation', load_metadata())
+        return
+
+    timer = METRICS.timer('recommendation')
+    timer.record('startup', process_uptime())
     try:
         # Read input from stdin
-        input_data = json.loads(sys.stdin.read())
+        with timer.stage('parse'):
+            input_data = json.loads(sys.stdin.read())
         
         # Load metadata
-        metadata = load_metadata()
+        with timer.stage('load_metadata'):
+            metadata = load_metadata()
         
         # Load TFLite model
-        model_path = models_dir / 'recommendation_model_v2.tflite'
-        interpreter = tf.lite.Interpreter(model_path=str(model_path))
-        interpreter.allocate_tensors()
+        with timer.stage('load_model'):
+            model_path, _ = resolve_model_files('recommendation')
+            interpreter = tf.lite.Interpreter(model_path=str(model_path))
+            interpreter.allocate_tensors()
         
-        # Get input and output tensors
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+            # Get input and output tensors
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
         
         # Preprocess input
-        features = preprocess_input(input_data, metadata)
+        with timer.stage('preprocess'):
+            features = preprocess_input(input_data, metadata)
         
         # Run inference
-        interpreter.set_tensor(input_details[0]['index'], features)
-        interpreter.invoke()
+        with timer.stage('invoke'):
+            interpreter.set_tensor(input_details[0]['index'], features)
+            interpreter.invoke()
         
-        # Get prediction
-        prediction = interpreter.get_tensor(output_details[0]['index'])
-        current_emission = float(prediction[0][0])
-        
-        # Calculate green score
-        green_score = max(0, 100 - (current_emission / 0.7))
-        green_score = min(100, round(green_score, 2))
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(current_emission, input_data, metadata)
+            # Get prediction
+            prediction = interpreter.get_tensor(output_details[0]['index'])
         
         # Prepare output
-        result = {
-            'current_emission': round(current_emission, 2),
-            'green_score': green_score,
-            'recommendations': recommendations
-        }
+        with timer.stage('format'):
+            result = format_result(prediction[0][0], input_data, metadata)
         
-        print(json.dumps(result))
+        with timer.stage('serialize'):
+            print(json.dumps(result))
+        timer.finish()
         
     except Exception as e:
+        timer.finish(error=True)
         error_result = {
             'error': str(e),
             'current_emission': 0,
@@ -158,6 +176,9 @@ def main():
         }
         print(json.dumps(error_result))
         sys.exit(1)
+    finally:
+        METRICS.dump()
 
 if __name__ == "__main__":
-    main()
+    with PROFILER.request('recommendation'):
+        main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Request inputs that mirror the Joi schemas in backend/src/controllers/mlController.ts.
+
+Used by the benchmark and load-test tools to build realistic rows without a
+database. Keep the choices, ranges and defaults in sync with the controller.
+"""
+import numpy as np
+
+
+def choice(values, default=None):
+    return ('choice', list(values), default if default is not None else values[0])
+
+
+def number(low, high, default=None):
+    return ('number', low, high, default if default is not None else (low + high) / 2)
+
+
+# Model name -> request field -> spec, as validated by mlController.ts
+SCHEMAS = {
+    'recommendation': {
+        # Required in the controller; the defaults here are just a typical request
+        'commute_mode': choice(['car', 'bus', 'bike', 'walk', 'train', 'EV']),
+        'distance_km': number(0, 500, 25),
+        'diet_type': choice(['veg', 'non-veg', 'mixed'], 'mixed'),
+        'energy_usage_kWh': number(0, 2000, 350),
+    },
+    'carbon': {
+        'body_type': choice(['thin', 'average', 'overweight'], 'average'),
+        'sex': choice(['male', 'female']),
+        'diet': choice(['omnivore', 'vegetarian', 'vegan']),
+        'shower': choice(['daily', 'weekly']),
+        'heating': choice(['gas', 'electric', 'solar', 'none']),
+        'transport': choice(['car', 'bus', 'train', 'walk/bicycle', 'none']),
+        'vehicle': choice(['none', 'petrol', 'diesel', 'ev'], 'petrol'),
+        'social': choice(['low', 'medium', 'high'], 'medium'),
+        'grocery': number(0, 2000, 400),
+        'flight': choice(['never', 'yearly', 'monthly']),
+        'vehicle_distance': number(0, 5000, 500),
+        'waste_weekly': number(0, 20, 3),
+        'tv_daily_hour': number(0, 24, 2),
+        'clothes_monthly': number(0, 50, 5),
+        'internet_daily': number(0, 24, 4),
+        'energy_eff': choice(['Yes', 'No'], 'No'),
+        'recycling': choice(['None', 'Basic', 'Full']),
+        'cooking': choice(['electric', 'gas', 'wood'], 'gas'),
+    },
+    'future': {
+        'body_type': choice(['thin', 'average', 'overweight'], 'average'),
+        'sex': choice(['male', 'female']),
+        'diet': choice(['omnivore', 'vegetarian', 'vegan']),
+        'shower': choice(['daily', 'weekly', 'rarely']),
+        'heating': choice(['gas', 'electric', 'solar', 'none']),
+        'transport': choice(['car', 'bus', 'train', 'walk/bicycle', 'none']),
+        'vehicle_type': choice(['none', 'petrol', 'diesel', 'ev'], 'petrol'),
+        'social_activity': choice(['low', 'medium', 'high'], 'medium'),
+        'monthly_grocery_bill': number(0, 2000, 400),
+        'air_travel_frequency': choice(['never', 'yearly', 'monthly']),
+        'vehicle_monthly_distance': number(0, 5000, 500),
+        'waste_bag_weekly_count': number(0, 20, 3),
+        'tv_pc_daily_hour': number(0, 24, 2),
+        'new_clothes_monthly': number(0, 50, 5),
+        'internet_daily_hour': number(0, 24, 4),
+        'energy_efficiency': choice(['Yes', 'No'], 'No'),
+        'recycling': choice(['None', 'Basic', 'Full']),
+        'cooking_with': choice(['electric', 'gas', 'wood'], 'gas'),
+        'waste_bag_size': choice(['small', 'medium', 'large'], 'medium'),
+    },
+}
+
+
+def default_row(model):
+    """The request the controller would build from an empty body (typical values where required)"""
+    return {field: spec[-1] for field, spec in SCHEMAS[model].items()}
+
+
+def synthetic_rows(model, n, seed=0):
+    """``n`` requests drawn uniformly from the schema's choices and numeric ranges"""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for field, spec in SCHEMAS[model].items():
+        if spec[0] == 'choice':
+            columns[field] = [spec[1][i] for i in rng.integers(0, len(spec[1]), n)]
+        else:
+            columns[field] = np.round(rng.uniform(spec[1], spec[2], n), 2).tolist()
+    return [{field: values[i] for field, values in columns.items()} for i in range(n)]
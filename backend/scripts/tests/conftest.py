@@ -0,0 +1,53 @@
+"""Make the scripts importable as top-level modules, as they import each other, and share carbon fixtures"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+class ConstantHandle:
+    """Served-model stand-in that predicts the same value for every row"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, features, timeout=None):
+        return np.full((len(features), 1), self.value, dtype=np.float32)
+
+
+@pytest.fixture(scope='session')
+def carbon_meta():
+    from model_registry import resolve_model_files
+    _, meta_path = resolve_model_files('carbon')
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def make_snapshot(carbon_meta):
+    """Carbon snapshot of ``version`` whose model predicts ``value`` for every row"""
+    from model_registry import LoadedModel
+    return lambda version='v1', value=1.0: LoadedModel('carbon', version, b'', carbon_meta, ConstantHandle(value))
+
+
+@pytest.fixture
+def snapshot(make_snapshot):
+    return make_snapshot()
+
+
+@pytest.fixture
+def layout(carbon_meta):
+    from wire_format import RecordLayout
+    return RecordLayout('carbon', carbon_meta)
+
+
+@pytest.fixture
+def features_for(layout):
+    """Input dicts -> the carbon feature matrix, through the binary record path"""
+    return lambda rows: layout.features(layout.decode(layout.encode(rows), len(rows)))
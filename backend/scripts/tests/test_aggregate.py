@@ -0,0 +1,73 @@
+import argparse
+import csv
+
+import numpy as np
+import pytest
+
+from aggregate import GroupedStats, aggregate
+from sample_inputs import synthetic_rows
+
+
+@pytest.fixture(scope='module')
+def grouped():
+    rng = np.random.default_rng(0)
+    group_ids = rng.integers(0, 4, size=5000)
+    values = rng.lognormal(mean=np.log(2000), sigma=0.6, size=5000)
+    return group_ids, values
+
+
+def test_exact_statistics_per_group(grouped):
+    group_ids, values = grouped
+    stats = GroupedStats()
+    # Two chunks, the first of which has not seen every group yet
+    first = group_ids < 3
+    stats.add(group_ids[first], values[first], 3)
+    stats.add(group_ids[~first], values[~first], 4)
+    for g, summary in enumerate(stats.summaries([50])):
+        selected = values[group_ids == g]
+        assert summary['count'] == len(selected)
+        assert summary['mean'] == pytest.approx(selected.mean(), rel=1e-6)
+        assert summary['std'] == pytest.approx(selected.std(), rel=1e-4)
+        assert summary['min'] == pytest.approx(selected.min())
+        assert summary['max'] == pytest.approx(selected.max())
+
+
+@pytest.mark.parametrize('rows', [100, 5000])
+def test_percentiles_within_one_bucket(rows):
+    values = np.random.default_rng(rows).lognormal(mean=np.log(2000), sigma=0.6, size=rows)
+    stats = GroupedStats(bins_per_decade=50)
+    stats.add(np.zeros(rows, dtype=np.int64), values, 1)
+    qs = np.arange(1, 100)
+    exact = np.percentile(values, qs, method='inverted_cdf')
+    np.testing.assert_allclose(stats.percentiles(qs)[0], exact, rtol=stats.edges[1] / stats.edges[0] - 1)
+
+
+def test_rollup_matches_adding_the_parents_directly(grouped):
+    group_ids, values = grouped
+    fine = GroupedStats()
+    fine.add(group_ids, values, 4)
+    parents = np.array([0, 0, 1, 1])
+    direct = GroupedStats()
+    direct.add(parents[group_ids], values, 2)
+    rolled = fine.rollup(parents, 2)
+    assert rolled.summaries([50, 99]) == direct.summaries([50, 99])
+
+
+def test_aggregate_rolls_departments_up_to_organizations(tmp_path):
+    pytest.importorskip('tensorflow')
+    rows = synthetic_rows('carbon', 60, seed=4)
+    path = tmp_path / 'members.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['organizationId', 'department'] + list(rows[0]))
+        writer.writeheader()
+        for i, row in enumerate(rows):
+            writer.writerow(dict(row, organizationId=f'org{i % 2}', department=f'dept{i % 3}'))
+    args = argparse.Namespace(model='carbon', input=str(path), group_by='organizationId,department',
+                              percentiles='50,90', format=None, chunk_size=25, batch_size=16, bins_per_decade=50)
+    summary = aggregate(args)
+    assert summary['rows'] == summary['overall']['count'] == 60
+    organizations, departments = summary['levels']
+    assert organizations['group_by'] == ['organizationId']
+    assert sorted(group['count'] for group in organizations['groups']) == [30, 30]
+    assert len(departments['groups']) == 6
+    assert sum(group['total'] for group in departments['groups']) == pytest.approx(summary['overall']['total'])
@@ -0,0 +1,27 @@
+import pytest
+
+from autotune import merge_ranges, tuned_runner_settings
+from model_registry import resolve_model_files, sha256_file
+
+
+def test_merge_ranges_joins_equal_neighbours():
+    assert merge_ranges([1, 8, 32, 128], [1, 1, 2, 2]) == [{'max_batch': 8, 'num_threads': 1},
+                                                           {'max_batch': 128, 'num_threads': 2}]
+
+
+def test_tuned_runner_settings():
+    entry = {'buckets': [1, 8, 32], 'ranges': [{'max_batch': 8, 'num_threads': 1},
+                                               {'max_batch': 32, 'num_threads': 2}], 'pool_size': 3}
+    assert tuned_runner_settings(entry) == ([1, 8, 32], [1, 1, 2], 3)
+
+
+@pytest.mark.parametrize('matches', [True, False])
+def test_tuned_entry_only_applies_to_its_model_file(matches, capsys):
+    pytest.importorskip('tensorflow')
+    from inference_core import pool_loader
+    model_path, _ = resolve_model_files('carbon')
+    tuned = {'carbon': {'buckets': [1, 8], 'num_threads': [1, 1], 'size': 3,
+                        'model_sha256': sha256_file(model_path) if matches else '0' * 64}}
+    pool = pool_loader(size=1, tuned=tuned)('carbon', model_path.read_bytes(), {})
+    assert pool.size == (3 if matches else 1)
+    assert ('timed on another model file' in capsys.readouterr().err) != matches
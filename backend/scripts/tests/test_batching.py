@@ -0,0 +1,66 @@
+import asyncio
+
+from batching import MicroBatcher
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def test_concurrent_rows_share_a_batch():
+    batches = []
+
+    def score(rows):
+        batches.append(list(rows))
+        return [row * 2 for row in rows]
+
+    async def main():
+        batcher = MicroBatcher(score, max_batch_size=4, max_wait_ms=50, adaptive=False)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        finally:
+            batcher.close()
+
+    assert run(main()) == [0, 2, 4, 6, 8, 10]
+    assert [len(batch) for batch in batches] == [4, 2]
+
+
+def test_invalid_row_fails_only_its_caller():
+    batches = []
+
+    def score(rows):
+        batches.append(list(rows))
+        if any(row < 0 for row in rows):
+            raise ValueError('bad row')
+        return [row * 2 for row in rows]
+
+    async def main():
+        batcher = MicroBatcher(score, max_batch_size=8, max_wait_ms=20, adaptive=False)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in (1, -1, 3)), return_exceptions=True)
+        finally:
+            batcher.close()
+
+    first, second, third = run(main())
+    assert (first, third) == (2, 6)
+    assert isinstance(second, ValueError)
+    assert batches[0] == [1, -1, 3]
+
+
+def test_other_batch_errors_reach_every_caller():
+    calls = []
+
+    def score(rows):
+        calls.append(rows)
+        raise TimeoutError('no runner')
+
+    async def main():
+        batcher = MicroBatcher(score, max_batch_size=8, max_wait_ms=20, adaptive=False)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        finally:
+            batcher.close()
+
+    results = run(main())
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert len(calls) == 1
@@ -0,0 +1,34 @@
+import argparse
+import csv
+import json
+
+import pytest
+
+from bulk_score import run
+from sample_inputs import synthetic_rows
+
+
+def bulk_args(tmp_path, **overrides):
+    rows = synthetic_rows('carbon', 30, seed=5)
+    path = tmp_path / 'users.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    args = dict(model='carbon', input=str(path), output=str(tmp_path / 'scored.csv'), format=None, chunk_size=10,
+                batch_size=8, columns=None, raw=True, checkpoint=None, resume=False, progress_interval=60.0)
+    return argparse.Namespace(**dict(args, **overrides))
+
+
+def test_resume_refuses_a_checkpoint_of_another_model_version(tmp_path):
+    pytest.importorskip('tensorflow')
+    args = bulk_args(tmp_path)
+    run(args)
+    checkpoint = tmp_path / 'scored.csv.ckpt'
+    state = json.loads(checkpoint.read_text())
+    scored = (tmp_path / 'scored.csv').read_text()
+    # As if interrupted after the first chunk and the model was republished since
+    checkpoint.write_text(json.dumps(dict(state, done=False, rows_done=10, model_version='older')))
+    with pytest.raises(SystemExit, match='older'):
+        run(bulk_args(tmp_path, resume=True))
+    assert (tmp_path / 'scored.csv').read_text() == scored
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+
+from cascade import Cascade, uncertain_rows
+from model_registry import metadata_sha256
+from tree_ensemble import export_ensemble
+from wire_format import RecordLayout
+
+
+def write_tier(directory, snapshot, meta_sha256=None, n_features=None):
+    n_features = n_features or RecordLayout('carbon', snapshot.metadata).n_features
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, n_features))
+    model = GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0).fit(X, 10 + X[:, -1])
+    ensemble = export_ensemble(model)
+    ensemble.meta_sha256 = meta_sha256
+    ensemble.save(directory / 'carbon_cascade.npz')
+    return ensemble
+
+
+def test_uncertain_rows_flags_out_of_range_numerics():
+    features = np.zeros((3, 5))
+    features[1, 3] = 4.0
+    escalate, signals = uncertain_rows(features, 2, np.zeros(3), z_limit=3.0)
+    assert escalate.tolist() == [False, True, False]
+    assert signals['out_of_range'].tolist() == [False, True, False]
+
+
+def test_escalated_rows_use_the_matching_ensemble(tmp_path, snapshot, features_for):
+    ensemble = write_tier(tmp_path, snapshot, metadata_sha256(snapshot.metadata))
+    cascade = Cascade(['carbon'], tmp_path)
+    features = features_for([{}, {'grocery': 1e6}])
+    predictions = cascade.predict('carbon', snapshot, features)
+    assert predictions[0] == 1.0
+    assert np.isclose(predictions[1], ensemble.predict(features[1:])[0])
+    assert cascade.report()['carbon']['tiers']['ensemble']['rows'] == 1
+
+
+@pytest.mark.parametrize('bad_tier', ['other_meta', 'other_width'])
+def test_mismatched_tier_falls_back_to_tier_1_once(tmp_path, snapshot, capsys, bad_tier, features_for):
+    if bad_tier == 'other_meta':
+        write_tier(tmp_path, snapshot, meta_sha256='0' * 64)
+    else:
+        write_tier(tmp_path, snapshot, metadata_sha256(snapshot.metadata), n_features=7)
+    cascade = Cascade(['carbon'], tmp_path)
+    features = features_for([{}, {'grocery': 1e6}])
+    for _ in range(3):
+        assert cascade.predict('carbon', snapshot, features).tolist() == [1.0, 1.0]
+    logged = capsys.readouterr().err
+    assert logged.count('serving carbon from tier 1') == 1
+    assert cascade.report()['carbon']['problem']
@@ -0,0 +1,91 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from drift_monitor import DriftMonitor, ModelDrift, Moments, merged_report
+from sample_inputs import synthetic_rows
+
+
+def test_moments_merge_matches_one_pass():
+    values = np.random.default_rng(0).normal(3.0, 2.0, size=(1000, 3))
+    whole, merged, part = Moments(3), Moments(3), Moments(3)
+    whole.update(values)
+    merged.update(values[:300])
+    part.update(values[300:])
+    merged.merge(part)
+    np.testing.assert_allclose(merged.mean, values.mean(axis=0))
+    np.testing.assert_allclose(merged.std, values.std(axis=0))
+    np.testing.assert_allclose(whole.std, values.std(axis=0))
+    np.testing.assert_array_equal(merged.min, values.min(axis=0))
+
+
+def test_shifted_numeric_input_is_flagged(layout, features_for):
+    rows = synthetic_rows('carbon', 500, seed=1)
+    for row in rows:
+        row['vehicle_distance'] = 5000 + row['vehicle_distance'] * 10
+    drift = ModelDrift(layout, 'v1')
+    drift.observe(features_for(rows), rows)
+    report = drift.report(threshold=0.25)
+    assert report['rows'] == 500
+    assert 'vehicle_distance' in report['flagged']
+    entry = report['numerical']['vehicle_distance']
+    assert entry['min'] == pytest.approx(min(row['vehicle_distance'] for row in rows), rel=1e-3)
+    assert entry['p1'] <= entry['p50'] <= entry['p99']
+
+
+def test_unknown_categories_are_counted(layout, features_for):
+    rows = [{'transport': 'teleport'}] * 10 + [{'transport': 'car'}] * 30
+    drift = ModelDrift(layout)
+    drift.observe(features_for(rows), rows)
+    assert drift.report(threshold=0.25)['categorical']['transport']['unknown_rate'] == 0.25
+
+
+def test_monitor_saves_its_state(tmp_path, snapshot, features_for):
+    rows = synthetic_rows('carbon', 50)
+    monitor = DriftMonitor(directory=str(tmp_path))
+    monitor.observe('carbon', snapshot, features_for(rows), rows)
+    monitor.flush()
+    assert merged_report(str(tmp_path))['carbon@v1'] == monitor.report()['carbon']
+
+
+def test_saved_states_merge_into_one_report(tmp_path, layout, features_for):
+    rows = synthetic_rows('carbon', 400, seed=2)
+    single = ModelDrift(layout, 'v1')
+    single.observe(features_for(rows), rows)
+    # One state file per worker process
+    for worker, part in enumerate((rows[:150], rows[150:])):
+        drift = ModelDrift(layout, 'v1')
+        drift.observe(features_for(part), part)
+        (tmp_path / f'drift-{worker}.json').write_text(json.dumps({'models': [drift.to_json()]}))
+    merged = merged_report(str(tmp_path))['carbon@v1']
+    expected = single.report(threshold=0.25)
+    assert merged['rows'] == expected['rows'] == 400
+    assert merged['categorical'] == expected['categorical']
+    for field, entry in expected['numerical'].items():
+        assert merged['numerical'][field] == pytest.approx(entry, abs=1e-3)
+
+
+def test_batches_of_a_replaced_version_are_left_out(snapshot, features_for, make_snapshot):
+    newer = make_snapshot('v2')
+    rows = synthetic_rows('carbon', 20)
+    features = features_for(rows)
+    monitor = DriftMonitor()
+    monitor.observe('carbon', snapshot, features, rows)
+    monitor.observe('carbon', newer, features, rows)
+    monitor.observe('carbon', snapshot, features, rows)  # still in flight across the reload
+    report = monitor.report()['carbon']
+    assert (report['version'], report['rows']) == ('v2', 20)
+
+
+def test_failed_save_does_not_fail_the_request(tmp_path, snapshot, capsys, features_for):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    monitor = DriftMonitor(directory=str(blocker / 'drift'), flush_seconds=0)
+    rows = synthetic_rows('carbon', 5)
+    monitor.observe('carbon', snapshot, features_for(rows), rows)
+    deadline = time.monotonic() + 5
+    while monitor._flushing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'saving state' in capsys.readouterr().err
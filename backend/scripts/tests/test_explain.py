@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+
+from explain import Explainer
+from model_registry import resolve_model_files
+from sample_inputs import synthetic_rows
+
+
+def carbon_explainer():
+    _, meta_path = resolve_model_files('carbon')
+    with open(meta_path) as f:
+        return Explainer('carbon', json.load(f))
+
+
+def explain_linear(explainer, row, weights):
+    layout = explainer.layout
+    features = layout.features(layout.decode(layout.encode([row]), 1))[0]
+    matrix = explainer.perturb(features)
+    return features, explainer.explain(row, features, matrix @ weights)
+
+
+def test_linear_model_contributions():
+    explainer = carbon_explainer()
+    layout = explainer.layout
+    weights = np.random.default_rng(0).normal(size=layout.n_features)
+    row = synthetic_rows('carbon', 1, seed=9)[0]
+    features, explanation = explain_linear(explainer, row, weights)
+    assert explanation['rows_scored'] == explainer.n_rows
+    assert np.isclose(explanation['baseline'], features @ weights, atol=1e-3)
+    by_feature = {item['feature']: item for item in explanation['contributions']}
+    for j, (field, _) in enumerate(layout.numerical):
+        # The central difference of a linear model is exact
+        expected = weights[layout.n_onehot + j] * features[layout.n_onehot + j]
+        assert np.isclose(by_feature[field]['contribution'], expected, atol=1e-3)
+
+
+def test_best_alternative_only_when_it_lowers_the_prediction():
+    explainer = carbon_explainer()
+    layout = explainer.layout
+    field, categories, _ = layout.categorical[0]
+    start = layout.offsets[0]
+    weights = np.zeros(layout.n_features)
+    weights[start:start + len(categories)] = np.arange(len(categories))  # first category scores lowest
+
+    _, explanation = explain_linear(explainer, {field: categories[0]}, weights)
+    item = next(item for item in explanation['contributions'] if item['feature'] == field)
+    assert item['best_alternative'] is None
+
+    _, explanation = explain_linear(explainer, {field: categories[-1]}, weights)
+    item = next(item for item in explanation['contributions'] if item['feature'] == field)
+    assert item['best_alternative']['value'] == categories[0]
+    assert item['best_alternative']['change'] < 0
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+from inference_metrics import Histogram, process_uptime
+
+
+def test_process_uptime_covers_time_before_import():
+    script = 'import time; time.sleep(0.3); from inference_metrics import process_uptime; print(process_uptime())'
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            env={'PYTHONPATH': ':'.join(sys.path)}).stdout
+    assert float(output) >= 0.25
+    assert process_uptime() >= 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == [[1, 2], [2, 3], [5, 4], ['+Inf', 5]]
+    assert snapshot['count'] == 5
+    assert snapshot['sum'] == 16.0
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from loadtest import LoadReport, SocketTarget
+
+
+def test_closed_connection_fails_only_its_own_requests(tmp_path):
+    socket_path = str(tmp_path / 'ml.sock')
+    accepted = []
+    dropped = asyncio.Event()
+
+    async def handle(reader, writer):
+        accepted.append(writer)
+        if len(accepted) == 1:  # the first connection drops without answering
+            await reader.readline()
+            writer.close()
+            await asyncio.sleep(0.05)
+            dropped.set()
+            return
+        await dropped.wait()  # answer only once the other connection is gone
+        while line := await reader.readline():
+            request = json.loads(line)
+            writer.write(json.dumps({'id': request['id'], 'result': request['input']}).encode() + b'\n')
+            await writer.drain()
+
+    async def main():
+        server = await asyncio.start_unix_server(handle, socket_path)
+        target = SocketTarget(socket_path, connections=2)
+        await target.start()
+        try:
+            return await asyncio.gather(*(target.call('carbon', {'n': n}) for n in range(4)),
+                                        return_exceptions=True)
+        finally:
+            await target.close()
+            server.close()
+
+    results = asyncio.run(main())
+    # Ids 1 and 3 go to the second connection, 2 and 4 to the first
+    assert results[0] == {'n': 0} and results[2] == {'n': 2}
+    assert all(isinstance(results[i], ConnectionError) for i in (1, 3))
+
+
+def test_summary_without_successes_has_no_latencies():
+    report = LoadReport(interval=1.0)
+    report.started = 0.0
+    report.sent = 2
+    report.record(0.01, 'boom')
+    report.record(0.02, 'boom')
+    summary = report.summary({})
+    assert summary['ok'] == 0 and summary['errors'] == 2
+    assert set(summary['latency_ms'].values()) == {None}
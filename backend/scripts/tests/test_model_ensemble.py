@@ -0,0 +1,130 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+
+from model_ensemble import EnsembleServer, parse_weights
+from model_registry import metadata_sha256
+from tree_ensemble import export_ensemble
+from wire_format import RecordLayout
+
+
+@pytest.fixture
+def features(features_for):
+    return features_for([{}, {'grocery': 500}])
+
+
+def write_spec(directory, snapshot, members, meta_sha256=None):
+    spec = {'members': members}
+    if meta_sha256 is not None:
+        spec['meta_sha256'] = meta_sha256
+    (directory / 'carbon_ensemble.json').write_text(json.dumps(spec))
+
+
+def write_member(directory, snapshot, name):
+    n_features = RecordLayout('carbon', snapshot.metadata).n_features
+    X = np.random.default_rng(0).normal(size=(200, n_features))
+    ensemble = export_ensemble(GradientBoostingRegressor(n_estimators=10, random_state=0).fit(X, 5 + X[:, -1]))
+    ensemble.save(directory / name)
+    return ensemble
+
+
+def test_parse_weights():
+    assert parse_weights('xgb=2, rf=1,') == {'xgb': 2.0, 'rf': 1.0}
+
+
+def test_weighted_mean_of_members(tmp_path, snapshot, features):
+    member = write_member(tmp_path, snapshot, 'rf.npz')
+    write_spec(tmp_path, snapshot, [{'name': 'surrogate', 'weight': 1},
+                                    {'name': 'rf', 'path': 'rf.npz', 'weight': 3, 'executor': 'thread'}],
+               metadata_sha256(snapshot.metadata))
+    server = EnsembleServer(['carbon'], tmp_path)
+    try:
+        predictions = server.predict('carbon', snapshot, features)
+        np.testing.assert_allclose(predictions, 0.25 * 1.0 + 0.75 * member.predict(features))
+        report = server.report()['carbon']
+        assert report['problem'] is None
+        assert report['members']['rf']['weight'] == 0.75
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize('problem', ['other_meta', 'missing_member', 'no_spec'])
+def test_unusable_spec_falls_back_to_the_surrogate_once(tmp_path, snapshot, features, capsys, problem):
+    members = [{'name': 'surrogate', 'weight': 1}, {'name': 'rf', 'path': 'rf.npz', 'weight': 3}]
+    if problem == 'other_meta':
+        write_member(tmp_path, snapshot, 'rf.npz')
+        write_spec(tmp_path, snapshot, members, meta_sha256='0' * 64)
+    elif problem == 'missing_member':
+        write_spec(tmp_path, snapshot, members + [{'name': 'xgb', 'path': 'missing.json', 'weight': 1}])
+        write_member(tmp_path, snapshot, 'rf.npz')
+    server = EnsembleServer(['carbon'], tmp_path)
+    try:
+        for _ in range(3):
+            assert server.predict('carbon', snapshot, features).tolist() == [1.0, 1.0]
+        ensemble = server.ensembles['carbon']
+        assert [member.name for member in ensemble.members] == ['surrogate']
+        assert server.report()['carbon']['problem']
+    finally:
+        server.close()
+    assert capsys.readouterr().err.count('serving carbon from the surrogate alone') == 1
+
+
+def test_failed_load_shuts_down_started_members(tmp_path, snapshot, monkeypatch):
+    import model_ensemble
+    write_member(tmp_path, snapshot, 'rf.npz')
+    write_spec(tmp_path, snapshot, [{'name': 'rf', 'path': 'rf.npz'}, {'name': 'xgb', 'path': 'bad.cbm'}])
+    closed = []
+    close = model_ensemble.Member.close
+    monkeypatch.setattr(model_ensemble.Member, 'close', lambda member: (closed.append(member.name), close(member)))
+    server = EnsembleServer(['carbon'], tmp_path)
+    try:
+        ensemble = server._ensemble('carbon', snapshot)
+        assert 'xgb' in ensemble.problem
+        assert closed == ['rf']
+    finally:
+        server.close()
+
+
+def write_thread_ensemble(directory, snapshot):
+    write_member(directory, snapshot, 'rf.npz')
+    write_spec(directory, snapshot, [{'name': 'surrogate', 'weight': 1},
+                                     {'name': 'rf', 'path': 'rf.npz', 'weight': 1, 'executor': 'thread'}])
+
+
+def test_stale_snapshot_finishes_on_its_version_without_a_reload(tmp_path, snapshot, make_snapshot, features):
+    write_thread_ensemble(tmp_path, snapshot)
+    newer = make_snapshot('v2', 2.0)
+    server = EnsembleServer(['carbon'], tmp_path)
+    try:
+        old = server._ensemble('carbon', snapshot)  # a v1 batch in flight across the reload
+        server.predict('carbon', newer, features, current=newer)
+        assert server.ensembles['carbon'].version == 'v2'
+        assert not old.threads._shutdown
+        old.predict(snapshot, features)
+        server._release(old)
+        assert old.threads._shutdown
+        # A v1 batch after that: its surrogate alone, and v2 stays loaded
+        assert server.predict('carbon', snapshot, features, current=newer).tolist() == [1.0, 1.0]
+        assert server.ensembles['carbon'].version == 'v2'
+    finally:
+        server.close()
+
+
+def test_member_failing_while_scoring_falls_back_to_the_surrogate(tmp_path, snapshot, features, capsys):
+    write_thread_ensemble(tmp_path, snapshot)
+    server = EnsembleServer(['carbon'], tmp_path)
+    try:
+        server.predict('carbon', snapshot, features)
+
+        def crash(features):
+            raise RuntimeError('worker died')
+
+        server.ensembles['carbon'].members[1].predict = crash
+        for _ in range(3):
+            assert server.predict('carbon', snapshot, features).tolist() == [1.0, 1.0]
+        assert 'worker died' in server.report()['carbon']['problem']
+    finally:
+        server.close()
+    assert capsys.readouterr().err.count('from the surrogate alone') == 1
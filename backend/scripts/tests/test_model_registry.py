@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from model_registry import ModelRegistry, RegistryError, load_version, publish, read_manifest
+
+
+def content_loader(name, model_content, metadata):
+    return bytes(model_content)
+
+
+def write_version(tmp_path, tag):
+    model, meta = tmp_path / f'model-{tag}.tflite', tmp_path / f'meta-{tag}.json'
+    model.write_bytes(f'model {tag}'.encode())
+    meta.write_text(json.dumps({'tag': tag}))
+    return model, meta
+
+
+@pytest.fixture
+def registry(tmp_path):
+    base = tmp_path / 'registry'
+    base.mkdir()
+    publish('carbon', *write_version(tmp_path, 'v1'), version='v1', base_dir=base)
+    return ModelRegistry(base, names=['carbon'], loader=content_loader).load_all()
+
+
+def test_publish_and_hot_swap(registry, tmp_path):
+    assert registry.get('carbon').handle == b'model v1'
+    publish('carbon', *write_version(tmp_path, 'v2'), version='v2', base_dir=registry.base_dir)
+    assert registry.check_for_updates() == ['carbon']
+    snapshot = registry.get('carbon')
+    assert (snapshot.version, snapshot.handle, snapshot.metadata) == ('v2', b'model v2', {'tag': 'v2'})
+    assert registry.check_for_updates() == []
+
+
+def test_hash_mismatch_is_rejected(registry):
+    entry = read_manifest(registry.base_dir)['models']['carbon']
+    (registry.base_dir / entry['files']['model']['path']).write_bytes(b'tampered')
+    with pytest.raises(RegistryError):
+        load_version('carbon', entry, registry.base_dir, content_loader)
+
+
+def test_failed_reload_is_retried_without_a_manifest_change(registry, tmp_path):
+    publish('carbon', *write_version(tmp_path, 'v2'), version='v2', base_dir=registry.base_dir)
+    entry = read_manifest(registry.base_dir)['models']['carbon']
+    model_path = registry.base_dir / entry['files']['model']['path']
+    model_path.write_bytes(b'model v')  # still being copied
+    assert registry.check_for_updates() == []
+    assert registry.get('carbon').version == 'v1'
+    model_path.write_bytes(b'model v2')
+    assert registry.check_for_updates() == ['carbon']
+    assert registry.get('carbon').version == 'v2'
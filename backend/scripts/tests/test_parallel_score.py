@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from model_registry import resolve_model_files
+from parallel_score import encode_table
+from sample_inputs import synthetic_rows
+from wire_format import RecordLayout
+
+
+def load_layout(model):
+    _, meta_path = resolve_model_files(model)
+    with open(meta_path) as f:
+        return RecordLayout(model, json.load(f))
+
+
+@pytest.mark.parametrize('model', ['carbon', 'future', 'recommendation'])
+def test_table_encoding_matches_records(model):
+    layout = load_layout(model)
+    rows = synthetic_rows(model, 30, seed=4)
+    out = np.empty((len(rows), layout.n_features), dtype=np.float32)
+    encoded = encode_table(layout, pa.Table.from_pylist(rows), out)
+    expected = layout.features(layout.decode(layout.encode(rows), len(rows)))
+    np.testing.assert_allclose(encoded, expected, atol=1e-5)
+
+
+def test_missing_defaulted_fields_are_filled():
+    layout = load_layout('carbon')
+    out = np.empty((2, layout.n_features), dtype=np.float32)
+    encoded = encode_table(layout, pa.Table.from_pylist([{'diet': 'vegan'}, {'diet': None}]), out)
+    expected = layout.features(layout.decode(layout.encode([{'diet': 'vegan'}, {}]), 2))
+    np.testing.assert_allclose(encoded, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize('field', ['commute_mode', 'distance_km'])
+def test_missing_required_recommendation_field_raises(field):
+    layout = load_layout('recommendation')
+    rows = synthetic_rows('recommendation', 3, seed=1)
+    table = pa.Table.from_pylist([{k: v for k, v in row.items() if k != field} for row in rows])
+    with pytest.raises(ValueError, match=field):
+        encode_table(layout, table, np.empty((3, layout.n_features), dtype=np.float32))
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+from prediction_log import PredictionLog, log_files, parse_where, scan
+
+
+ROWS = [{'transport': 'car', 'vehicle_distance': 4000}, {'transport': 'walk/bicycle', 'vehicle_distance': 10}]
+
+
+def test_parse_where():
+    assert parse_where('vehicle_distance>=1000') == ('vehicle_distance', '>=', 1000.0)
+    assert parse_where('transport==car') == ('transport', '==', 'car')
+    with pytest.raises(ValueError):
+        parse_where('transport')
+
+
+@pytest.mark.parametrize('fmt', ['npz', 'parquet'])
+def test_record_flush_scan_round_trip(tmp_path, snapshot, fmt, features_for):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    log = PredictionLog(str(tmp_path), fmt=fmt)
+    features = features_for(ROWS)
+    log.record('carbon', snapshot, features, np.array([[2500.0], [900.0]]), ROWS)
+    log.record('carbon', snapshot, features, np.array([2400.0, 800.0]))  # binary frame: no input dicts
+    log.flush()
+    assert log.stats()['rows_written'] == 4
+
+    result = scan(str(tmp_path), 'carbon', ['transport', 'vehicle_distance', 'prediction'])
+    assert result['transport'].tolist() == ['car', 'walk/bicycle'] * 2
+    np.testing.assert_allclose(result['vehicle_distance'], [4000, 10] * 2, rtol=1e-4)
+    cars = scan(str(tmp_path), 'carbon', ['prediction'], [('transport', '==', 'car')])
+    assert cars['prediction'].tolist() == [2500.0, 2400.0]
+
+
+def test_old_buffers_are_written_without_further_traffic(tmp_path, snapshot, features_for):
+    log = PredictionLog(str(tmp_path), flush_seconds=0.1, fmt='npz')
+    log.record('carbon', snapshot, features_for(ROWS), np.array([2500.0, 900.0]), ROWS)
+    deadline = time.monotonic() + 5
+    while not log_files(str(tmp_path), 'carbon') and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert log_files(str(tmp_path), 'carbon')
+    assert log.stats()['buffered_rows'] == {}
+    log.flush()
+    assert log.stats()['rows_written'] == 2
+
+
+def test_failed_background_write_is_logged(tmp_path, snapshot, features_for, capsys):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    log = PredictionLog(str(blocker / 'log'), max_rows=1, fmt='npz')
+    log.record('carbon', snapshot, features_for(ROWS), np.array([2500.0, 900.0]), ROWS)
+    log.flush()
+    assert 'prediction_log: writing carbon failed' in capsys.readouterr().err
+    assert log.stats()['rows_written'] == 0
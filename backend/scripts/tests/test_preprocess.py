@@ -0,0 +1,26 @@
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+import carbon_inference
+import future_inference
+
+
+@pytest.mark.parametrize('module', [carbon_inference, future_inference])
+def test_batch_matches_single_rows(module):
+    metadata = module.load_metadata()
+    rows = [{}, {module.NUMERICAL_INPUTS[0][0]: 12.5}, {module.NUMERICAL_INPUTS[1][0]: 0}]
+    batch = module.preprocess_batch(rows, metadata)
+    singles = np.concatenate([module.preprocess_input(row, metadata) for row in rows])
+    np.testing.assert_array_equal(batch, singles)
+
+
+@pytest.mark.parametrize('module', [carbon_inference, future_inference])
+@pytest.mark.parametrize('value', [None, math.nan, math.inf])
+def test_non_finite_numeric_rejected(module, value):
+    field = module.NUMERICAL_INPUTS[2][0]
+    with pytest.raises(ValueError, match=field):
+        module.preprocess_batch([{}, {field: value}], module.load_metadata())
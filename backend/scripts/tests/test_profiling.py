@@ -0,0 +1,36 @@
+import json
+import tracemalloc
+
+from profiling import NULL_SESSION, Profiler
+
+
+def test_every_nth_request_is_profiled(tmp_path):
+    profiler = Profiler(['rss'], every=3, directory=str(tmp_path))
+    sampled = 0
+    for _ in range(6):
+        session = profiler.request('carbon')
+        with session:
+            sampled += session is not NULL_SESSION
+    assert sampled == 2
+
+
+def test_profile_summary_is_written(tmp_path):
+    profiler = Profiler(['cpu', 'memory', 'rss'], every=1, directory=str(tmp_path))
+    with profiler.request('carbon'):
+        sum(range(1000))
+    summary = json.loads((tmp_path / 'profiles.jsonl').read_text())
+    assert summary['label'] == 'carbon'
+    assert len(summary['files']) == 2
+    assert not tracemalloc.is_tracing()
+
+
+def test_write_failure_does_not_fail_the_request(tmp_path, capsys):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    profiler = Profiler(['memory', 'rss'], every=1, directory=str(blocker / 'profiles'))
+    with profiler.request('carbon'):
+        pass
+    assert 'profiling: writing the carbon profile failed' in capsys.readouterr().err
+    assert not tracemalloc.is_tracing()
+    # The next sampled request is profiled again
+    assert profiler.request('carbon') is not NULL_SESSION
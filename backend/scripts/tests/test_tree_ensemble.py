@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+
+from tree_ensemble import TreeEnsemble, check_parity, export_checked, export_ensemble
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 6)).astype(np.float32)
+    y = X[:, 0] * 3 + np.sin(X[:, 1]) + (X[:, 2] > 0) * 2 + rng.normal(scale=0.1, size=400)
+    return X, y
+
+
+@pytest.mark.parametrize('model', [
+    RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+    GradientBoostingRegressor(n_estimators=50, max_depth=3, random_state=0),
+], ids=['rf', 'gbr'])
+def test_sklearn_parity(data, model):
+    X, y = data
+    model.fit(X, y)
+    ok, max_abs = check_parity(model, export_ensemble(model), X)
+    assert ok, max_abs
+
+
+def test_xgboost_parity_with_missing_values(data):
+    xgb = pytest.importorskip('xgboost')
+    X, y = data
+    X = X.copy()
+    X[::7, 3] = np.nan
+    model = xgb.XGBRegressor(n_estimators=40, max_depth=4).fit(X, y)
+    ok, max_abs = check_parity(model, export_ensemble(model), X)
+    assert ok, max_abs
+
+
+def test_save_load_round_trip(data, tmp_path):
+    X, y = data
+    model = GradientBoostingRegressor(n_estimators=10, random_state=0).fit(X, y)
+    exported = export_checked({'gbr': model}, X, str(tmp_path), feature_names=[f'f{i}' for i in range(6)])['gbr']
+    loaded = TreeEnsemble.load(str(tmp_path / 'gbr.npz'))
+    np.testing.assert_array_equal(loaded.predict(X), exported.predict(X))
+    assert loaded.feature_names == [f'f{i}' for i in range(6)]
+    np.testing.assert_array_equal(loaded.cover, exported.cover)
+
+
+def test_meta_sha256_round_trip(data, tmp_path):
+    X, y = data
+    exported = export_ensemble(GradientBoostingRegressor(n_estimators=5, random_state=0).fit(X, y))
+    exported.save(str(tmp_path / 'plain.npz'))
+    assert TreeEnsemble.load(str(tmp_path / 'plain.npz')).meta_sha256 is None
+    exported.meta_sha256 = 'ab' * 32
+    exported.save(str(tmp_path / 'bound.npz'))
+    assert TreeEnsemble.load(str(tmp_path / 'bound.npz')).meta_sha256 == 'ab' * 32
+
+
+def test_export_checked_does_not_save_a_mismatch(data, tmp_path, monkeypatch):
+    import tree_ensemble
+    X, y = data
+    models = {name: GradientBoostingRegressor(n_estimators=5, random_state=0).fit(X, y) for name in ('good', 'bad')}
+    real_check = tree_ensemble.check_parity
+    monkeypatch.setattr(tree_ensemble, 'check_parity', lambda model, flat, X: (False, 1.0) if model is models['bad']
+                        else real_check(model, flat, X))
+    with pytest.raises(ValueError, match='bad'):
+        export_checked(models, X, str(tmp_path))
+    assert (tmp_path / 'good.npz').exists()
+    assert not (tmp_path / 'bad.npz').exists()
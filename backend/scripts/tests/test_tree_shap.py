@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from tree_ensemble import export_ensemble
+from tree_shap import TreeExplainer
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(300, 5)).astype(np.float32)
+    y = 2 * X[:, 0] - X[:, 1] * X[:, 2] + rng.normal(scale=0.1, size=300)
+    return X, y
+
+
+def test_matches_xgboost_pred_contribs(data):
+    xgb = pytest.importorskip('xgboost')
+    X, y = data
+    model = xgb.XGBRegressor(n_estimators=30, max_depth=4).fit(X, y)
+    explainer = TreeExplainer(export_ensemble(model))
+    contribs = model.get_booster().predict(xgb.DMatrix(X[:50]), pred_contribs=True)
+    np.testing.assert_allclose(explainer.shap_values(X[:50]), contribs[:, :-1], atol=1e-4)
+    np.testing.assert_allclose(explainer.expected_value, contribs[0, -1], atol=1e-4)
+
+
+def test_values_sum_to_the_prediction(data):
+    X, y = data
+    ensemble = export_ensemble(RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(X, y))
+    explainer = TreeExplainer(ensemble)
+    phi = explainer.shap_values(X[:40])
+    np.testing.assert_allclose(phi.sum(axis=1) + explainer.expected_value, ensemble.predict(X[:40]), atol=1e-4)
@@ -0,0 +1,90 @@
+import io
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from model_registry import resolve_model_files
+from sample_inputs import synthetic_rows
+from wire_format import (OP_LAYOUT, OP_SCORE, STATUS_ERROR, STATUS_OK, ProtocolError, RecordLayout,
+                         decode_request, decode_response, encode_request, handle_request, read_frame)
+
+MODELS = ['carbon', 'future', 'recommendation']
+
+
+def load_layout(model):
+    _, meta_path = resolve_model_files(model)
+    with open(meta_path) as f:
+        return RecordLayout(model, json.load(f))
+
+
+def test_import_stays_light():
+    script = "import sys, wire_format; print(any(m in sys.modules for m in ('inference_core', 'tensorflow')))"
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            env={'PYTHONPATH': ':'.join(sys.path)}).stdout
+    assert output.strip() == 'False'
+
+
+@pytest.mark.parametrize('model', MODELS)
+def test_records_round_trip(model):
+    layout = load_layout(model)
+    rows = synthetic_rows(model, 20, seed=3)
+    records = layout.decode(layout.encode(rows), len(rows))
+    for i, (field, categories, default) in enumerate(layout.categorical):
+        assert [categories[code] for code in records['codes'][:, i]] == [row.get(field, default) for row in rows]
+    for i, (field, default) in enumerate(layout.numerical):
+        np.testing.assert_allclose(records['values'][:, i], [row.get(field, default) for row in rows], rtol=1e-6)
+    with pytest.raises(ProtocolError):
+        layout.decode(layout.encode(rows)[:-1], len(rows))
+
+
+@pytest.mark.parametrize('model', ['carbon', 'future'])
+def test_features_match_json_preprocessing(model):
+    pytest.importorskip('tensorflow')
+    from inference_core import scoring_module
+    module = scoring_module(model)
+    metadata = module.load_metadata()
+    layout = RecordLayout(model, metadata)
+    rows = synthetic_rows(model, 50, seed=5)
+    binary = layout.features(layout.decode(layout.encode(rows), len(rows)))
+    np.testing.assert_allclose(binary, module.preprocess_batch(rows, metadata), atol=1e-5)
+
+
+def test_frames_round_trip():
+    layout = load_layout('carbon')
+    rows = synthetic_rows('carbon', 4, seed=1)
+    stream = io.BytesIO(encode_request(7, OP_SCORE, 'carbon', len(rows), layout.encode(rows)) +
+                        encode_request(8, OP_LAYOUT, 'carbon'))
+    request_id, op, model, count, body = decode_request(read_frame(stream))
+    assert (request_id, op, model, count) == (7, OP_SCORE, 'carbon', 4)
+    assert len(body) == 4 * layout.record_size
+    assert decode_request(read_frame(stream))[:3] == (8, OP_LAYOUT, 'carbon')
+    assert read_frame(stream) is None
+
+
+def test_handle_request_scores_and_reports_errors():
+    layout = load_layout('carbon')
+    rows = synthetic_rows('carbon', 3, seed=2)
+    predict = lambda model, features: np.array([[-1.0], [2.5], [4.0]])
+    payload = encode_request(1, OP_SCORE, 'carbon', 3, layout.encode(rows))[4:]
+    request_id, status, op, count, scores = decode_response(handle_request(payload, lambda m: layout, predict)[4:])
+    assert (request_id, status, count) == (1, STATUS_OK, 3)
+    np.testing.assert_array_equal(scores, [0.0, 2.5, 4.0])  # floored at 0 like the JSON result
+
+    payload = encode_request(2, OP_SCORE, 'carbon', 5, layout.encode(rows))[4:]
+    request_id, status, _, _, message = decode_response(handle_request(payload, lambda m: layout, predict)[4:])
+    assert (request_id, status) == (2, STATUS_ERROR)
+    assert 'records' in message
+
+
+def test_handle_request_rejects_non_finite_numerics():
+    layout = load_layout('carbon')
+    rows = synthetic_rows('carbon', 2, seed=3)
+    rows[1]['vehicle_distance'] = float('nan')
+    payload = encode_request(3, OP_SCORE, 'carbon', 2, layout.encode(rows))[4:]
+    predict = lambda model, features: np.zeros((len(features), 1))
+    request_id, status, _, _, message = decode_response(handle_request(payload, lambda m: layout, predict)[4:])
+    assert (request_id, status) == (3, STATUS_ERROR)
+    assert "'vehicle_distance' must be a finite number" in message
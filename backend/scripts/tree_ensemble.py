@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Flattened, array-backed tree ensembles.
+
+Fitted RandomForest / GradientBoosting / XGBoost regressors are compiled into
+contiguous NumPy arrays (feature, threshold, left, right, value) so they can be
+served with NumPy alone. All trees are concatenated into one node table; leaves
+point at themselves, so a batch of rows walks every tree level by level for
+``max_depth`` vectorized steps.
+
+Prediction = base_score + sum of the leaf values reached in each tree. Leaf
+values are stored already scaled (1/n_trees for forests, learning rate for
+gradient boosting), so the evaluator never needs to know the source library.
+
+Format 2 adds the training cover of every node (sample weight for sklearn, sum
+of hessians for XGBoost), which tree_shap.py needs, and the feature names the
+model was fitted with. It can also record ``meta_sha256``, the hash of the
+served model's preprocessing metadata the features were built with
+(model_registry.metadata_sha256), so a serving tier can refuse an ensemble
+fitted on other scalers or categories. Format 1 files still load and predict.
+
+CLI:
+    python tree_ensemble.py export --model rf.joblib --out rf.npz [--check-data X.npy]
+    python tree_ensemble.py predict --ensemble rf.npz --data X.npy
+"""
+import sys
+import json
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 2
+
+# Split rule used by the source library: sklearn goes left on x <= t, XGBoost on x < t
+DECISION_LE = 0
+DECISION_LT = 1
+
+
+class TreeEnsemble:
+    """Evaluator over a flattened node table"""
+
+    def __init__(self, feature, threshold, left, right, value, default_left, roots,
+                 base_score=0.0, max_depth=0, decision=DECISION_LE, n_features=0, source='',
+                 cover=None, feature_names=None, meta_sha256=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.default_left = np.ascontiguousarray(default_left, dtype=np.bool_)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.base_score = float(base_score)
+        self.max_depth = int(max_depth)
+        self.decision = int(decision)
+        self.n_features = int(n_features)
+        self.source = source
+        self.cover = None if cover is None else np.ascontiguousarray(cover, dtype=np.float64)
+        self.feature_names = list(feature_names) if feature_names is not None and len(feature_names) else None
+        self.meta_sha256 = meta_sha256 or None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def leaf_indices(self, X, chunk_size=4096):
+        """Global leaf index reached by every row in every tree, shape (N, n_trees)"""
+        X = _as_float32_rows(X, self.n_features)
+        out = np.empty((X.shape[0], self.n_trees), dtype=np.int32)
+        for start in range(0, X.shape[0], chunk_size):
+            out[start:start + chunk_size] = self._walk(X[start:start + chunk_size])
+        return out
+
+    def _walk(self, X):
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]].astype(np.float64)
+            thr = self.threshold[node]
+            if self.decision == DECISION_LT:
+                go_left = x < thr
+            else:
+                go_left = x <= thr
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict(self, X, chunk_size=4096):
+        X = _as_float32_rows(X, self.n_features)
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_size):
+            leaves = self._walk(X[start:start + chunk_size])
+            out[start:start + chunk_size] = self.value[leaves].sum(axis=1) + self.base_score
+        return out
+
+    def save(self, path):
+        optional = {}
+        if self.cover is not None:
+            optional['cover'] = self.cover
+        if self.feature_names is not None:
+            optional['feature_names'] = np.array(self.feature_names, dtype=str)
+        if self.meta_sha256 is not None:
+            optional['meta_sha256'] = np.array(self.meta_sha256)
+        np.savez(
+            path,
+            format_version=np.int32(FORMAT_VERSION),
+            feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            value=self.value, default_left=self.default_left, roots=self.roots,
+            base_score=np.float64(self.base_score), max_depth=np.int32(self.max_depth),
+            decision=np.int32(self.decision), n_features=np.int32(self.n_features),
+            source=np.array(self.source), **optional,
+        )
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        data = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        version = int(data['format_version'])
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported tree ensemble format version {version}")
+        return cls(
+            data['feature'], data['threshold'], data['left'], data['right'], data['value'],
+            data['default_left'], data['roots'],
+            base_score=float(data['base_score']), max_depth=int(data['max_depth']),
+            decision=int(data['decision']), n_features=int(data['n_features']), source=str(data['source']),
+            cover=data['cover'] if 'cover' in data.files else None,
+            feature_names=data['feature_names'].tolist() if 'feature_names' in data.files else None,
+            meta_sha256=str(data['meta_sha256']) if 'meta_sha256' in data.files else None,
+        )
+
+
+def _as_float32_rows(X, n_features):
+    # Both sklearn and XGBoost compare float32 feature values against the split thresholds
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if n_features and X.shape[1] != n_features:
+        raise ValueError(f"Expected {n_features} features, got {X.shape[1]}")
+    return X
+
+
+class _NodeTableBuilder:
+    """Accumulates per-tree arrays into one flattened node table"""
+
+    def __init__(self):
+        self.parts = {k: [] for k in ('feature', 'threshold', 'left', 'right', 'value', 'default_left', 'cover')}
+        self.roots = []
+        self.offset = 0
+        self.max_depth = 0
+
+    def add_tree(self, feature, threshold, left, right, value, default_left, depth, cover):
+        n = len(feature)
+        ids = np.arange(n, dtype=np.int64)
+        is_leaf = np.asarray(left) < 0
+        left = np.where(is_leaf, ids, left) + self.offset
+        right = np.where(is_leaf, ids, right) + self.offset
+        self.parts['feature'].append(np.where(is_leaf, 0, feature))
+        self.parts['threshold'].append(np.where(is_leaf, 0.0, threshold))
+        self.parts['left'].append(left)
+        self.parts['right'].append(right)
+        self.parts['value'].append(np.where(is_leaf, value, 0.0))
+        self.parts['default_left'].append(default_left)
+        self.parts['cover'].append(np.asarray(cover, dtype=np.float64))
+        self.roots.append(self.offset)
+        self.offset += n
+        self.max_depth = max(self.max_depth, int(depth))
+
+    def build(self, **kwargs):
+        arrays = {k: np.concatenate(v) for k, v in self.parts.items()}
+        return TreeEnsemble(roots=np.array(self.roots), max_depth=self.max_depth, **arrays, **kwargs)
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):  # children always have larger ids than their parent
+        if left[node] >= 0:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _add_sklearn_tree(builder, tree, scale):
+    t = tree.tree_
+    missing_left = getattr(t, 'missing_go_to_left', np.zeros(t.node_count, dtype=np.uint8))
+    builder.add_tree(
+        t.feature, t.threshold, t.children_left, t.children_right,
+        t.value[:, 0, 0] * scale, np.asarray(missing_left, dtype=bool),
+        _tree_depth(t.children_left, t.children_right), t.weighted_n_node_samples,
+    )
+
+
+def _sklearn_feature_names(model, feature_names):
+    if feature_names is not None:
+        return list(feature_names)
+    names = getattr(model, 'feature_names_in_', None)
+    return None if names is None else [str(name) for name in names]
+
+
+def export_random_forest(model, feature_names=None):
+    """Compile a fitted sklearn RandomForestRegressor / ExtraTreesRegressor"""
+    builder = _NodeTableBuilder()
+    scale = 1.0 / len(model.estimators_)
+    for tree in model.estimators_:
+        _add_sklearn_tree(builder, tree, scale)
+    return builder.build(base_score=0.0, decision=DECISION_LE, n_features=model.n_features_in_,
+                         source=type(model).__name__, feature_names=_sklearn_feature_names(model, feature_names))
+
+
+def export_gradient_boosting(model, feature_names=None):
+    """Compile a fitted sklearn GradientBoostingRegressor (squared/absolute/huber loss)"""
+    init = model.init_
+    if init == 'zero':
+        base = 0.0
+    elif hasattr(init, 'constant_'):
+        base = float(np.ravel(init.constant_)[0])
+    else:
+        raise ValueError("Only constant init estimators can be flattened")
+    builder = _NodeTableBuilder()
+    for stage in model.estimators_[:, 0]:
+        _add_sklearn_tree(builder, stage, model.learning_rate)
+    return builder.build(base_score=base, decision=DECISION_LE, n_features=model.n_features_in_,
+                         source=type(model).__name__, feature_names=_sklearn_feature_names(model, feature_names))
+
+
+def _parse_base_score(raw):
+    # XGBoost >= 2 serializes base_score as a vector literal, e.g. "[3.1E2]"
+    return float(str(raw).strip('[]').split(',')[0])
+
+
+def export_xgboost(model, feature_names=None):
+    """Compile a fitted XGBRegressor / Booster (gbtree, regression objective)"""
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    config = json.loads(bytes(booster.save_raw(raw_format='json')).decode('utf-8'))
+    learner = config['learner']
+    objective = learner['objective']['name']
+    if objective not in ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror'):
+        raise ValueError(f"Unsupported XGBoost objective for flattening: {objective}")
+    gbm = learner['gradient_booster']
+    if gbm.get('name') != 'gbtree':
+        raise ValueError(f"Unsupported XGBoost booster: {gbm.get('name')}")
+    builder = _NodeTableBuilder()
+    for tree in gbm['model']['trees']:
+        left = np.array(tree['left_children'], dtype=np.int64)
+        right = np.array(tree['right_children'], dtype=np.int64)
+        # Leaf values live in split_conditions for leaf nodes
+        conditions = np.array(tree['split_conditions'], dtype=np.float32).astype(np.float64)
+        builder.add_tree(
+            np.array(tree['split_indices'], dtype=np.int64), conditions, left, right, conditions,
+            np.array(tree['default_left'], dtype=bool), _tree_depth(left, right),
+            np.array(tree['sum_hessian'], dtype=np.float64),
+        )
+    n_features = int(learner['learner_model_param']['num_feature'])
+    if feature_names is None and booster.feature_names:
+        feature_names = list(booster.feature_names)
+    return builder.build(base_score=_parse_base_score(learner['learner_model_param']['base_score']),
+                         decision=DECISION_LT, n_features=n_features, source='XGBoost', feature_names=feature_names)
+
+
+def export_ensemble(model, feature_names=None):
+    """Dispatch on the fitted model type; ``feature_names`` defaults to what the model was fitted with"""
+    name = type(model).__name__
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        return export_random_forest(model, feature_names)
+    if name == 'GradientBoostingRegressor':
+        return export_gradient_boosting(model, feature_names)
+    if name in ('XGBRegressor', 'Booster'):
+        return export_xgboost(model, feature_names)
+    raise ValueError(f"Unsupported ensemble type: {name}")
+
+
+def check_parity(model, ensemble, X, rtol=1e-5, atol=1e-4):
+    """Compare the flattened evaluator with the source library's predict"""
+    expected = np.asarray(model.predict(X), dtype=np.float64).ravel()
+    actual = ensemble.predict(X)
+    max_abs = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    return bool(np.allclose(expected, actual, rtol=rtol, atol=atol)), max_abs
+
+
+def export_checked(models, X_check, out_dir, feature_names=None):
+    """Export each fitted model in ``{name: model}`` to ``out_dir/<name>.npz``, checking parity on ``X_check``.
+
+    A model whose flattened predictions differ from its own is not saved; the others
+    are, and then a ValueError names the ones that failed.
+    """
+    import os
+    os.makedirs(out_dir, exist_ok=True)
+    exported = {}
+    failed = []
+    for name, fitted in models.items():
+        flat = export_ensemble(fitted, feature_names=feature_names)
+        ok, max_abs = check_parity(fitted, flat, X_check)
+        print(f"{name}: {flat.n_trees} trees, parity={ok} (max abs diff {max_abs:.2e})")
+        if not ok:
+            failed.append(f"{name} (max abs diff {max_abs:.2e})")
+            continue
+        flat.save(os.path.join(out_dir, f'{name}.npz'))
+        exported[name] = flat
+    if failed:
+        raise ValueError(f"Flattened ensembles disagree with their source models, not saved: {', '.join(failed)}")
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or evaluate flattened tree ensembles')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='Compile a joblib-pickled fitted model into an .npz ensemble')
+    exp.add_argument('--model', required=True)
+    exp.add_argument('--out', required=True)
+    exp.add_argument('--check-data', help='.npy feature matrix used to verify predictions match')
+    pred = sub.add_parser('predict', help='Score a .npy feature matrix and print JSON predictions')
+    pred.add_argument('--ensemble', required=True)
+    pred.add_argument('--data', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        import joblib
+        model = joblib.load(args.model)
+        ensemble = export_ensemble(model)
+        if args.check_data:
+            ok, max_abs = check_parity(model, ensemble, np.load(args.check_data))
+            print(json.dumps({'parity': ok, 'max_abs_diff': max_abs}), file=sys.stderr)
+            if not ok:
+                sys.exit(1)
+        ensemble.save(args.out)
+        print(json.dumps({'trees': ensemble.n_trees, 'nodes': ensemble.n_nodes, 'max_depth': ensemble.max_depth,
+                          'source': ensemble.source}))
+    else:
+        ensemble = TreeEnsemble.load(args.ensemble)
+        print(json.dumps({'predictions': ensemble.predict(np.load(args.data)).tolist()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Compact binary framing between the Node service and the Python inference entry points.
+
+JSON stays the default. With ``--binary`` the one-shot scripts read request
+frames from stdin and write response frames to stdout; ``inference_server.py
+--binary`` speaks the same frames over its socket.
+
+Every frame is a little-endian ``uint32`` payload length followed by the payload.
+Payloads start with a 12-byte header:
+
+    request   uint32 id | uint8 op | uint8 model | uint16 version | uint32 count | records
+    response  uint32 id | uint8 status | uint8 op | uint16 version | uint32 count | body
+
+ops:    0 = score, 1 = layout
+models: 0 = carbon, 1 = future, 2 = recommendation
+status: 0 = ok, 1 = error
+
+A score request carries ``count`` fixed-layout records. Each record is one
+``uint8`` code per categorical input (the index into the category list in the
+model's meta file; an out-of-range code means "unknown" and falls back to the
+first category like the JSON path) followed by one ``float32`` per numeric
+input. A score response carries ``count`` packed ``float32`` predictions: the
+model output, floored at 0 where the JSON result is. A layout response (and an
+error response) carries ``count`` bytes of UTF-8: the layout as JSON, or the
+error message.
+
+The layout (field order, category lists, defaults, record size) is derived from
+the meta file, so it changes with the published model version. Print it with:
+
+    python wire_format.py layout carbon
+"""
+import sys
+import json
+import struct
+import argparse
+
+import numpy as np
+
+from input_fields import CATEGORICAL_INPUTS, NUMERICAL_INPUTS
+
+PROTOCOL_VERSION = 1
+
+LENGTH = struct.Struct('<I')
+HEADER = struct.Struct('<IBBHI')
+
+OP_SCORE = 0
+OP_LAYOUT = 1
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MODEL_CODES = {'carbon': 0, 'future': 1, 'recommendation': 2}
+MODEL_NAMES = {code: name for name, code in MODEL_CODES.items()}
+
+# Lower bound format_result applies to the prediction (None: returned as is)
+PREDICTION_FLOOR = {'carbon': 0.0, 'future': 0.0, 'recommendation': None}
+
+# Largest frame accepted, to bound memory on a corrupt length prefix
+MAX_FRAME_BYTES = 64 << 20
+
+
+class ProtocolError(Exception):
+    """Malformed frame or a request that does not match the layout"""
+
+
+class RecordLayout:
+    """Fixed record layout for one model, derived from its meta file"""
+
+    def __init__(self, model, metadata):
+        self.model = model
+        if 'onehot_categories' in metadata:
+            # carbon/future: one-hot categoricals followed by standard-scaled numerics
+            fields = CATEGORICAL_INPUTS[model]
+            self.one_hot = True
+            self.categorical = [(fields[col][0], list(categories), fields[col][1])
+                                for col, categories in zip(metadata['cat_cols'], metadata['onehot_categories'])]
+            self.numerical = list(NUMERICAL_INPUTS[model])
+            self.mean = np.array(metadata['num_scaler_mean'])
+            self.scale = np.array(metadata['num_scaler_scale'])
+        else:
+            # recommendation: label codes scaled alongside the numerics, in feature_order
+            self.one_hot = False
+            self.categorical = [('commute_mode', list(metadata['le_commute_classes']), None),
+                                ('diet_type', list(metadata['le_diet_classes']), None)]
+            self.numerical = [('distance_km', None), ('energy_usage_kWh', None)]
+            self.mean = np.array(metadata['scaler_mean'], dtype=np.float32)
+            self.scale = np.array(metadata['scaler_scale'], dtype=np.float32)
+        self.dtype = np.dtype([('codes', 'u1', (len(self.categorical),)),
+                               ('values', '<f4', (len(self.numerical),))])
+        self.record_size = self.dtype.itemsize
+        self.offsets = np.cumsum([0] + [len(categories) for _, categories, _ in self.categorical])[:-1]
+        self.n_onehot = sum(len(categories) for _, categories, _ in self.categorical)
+
+    def to_json(self):
+        return {
+            'model': self.model,
+            'version': PROTOCOL_VERSION,
+            'record_size': self.record_size,
+            'categorical': [{'field': field, 'categories': categories, 'default': default}
+                            for field, categories, default in self.categorical],
+            'numerical': [{'field': field, 'default': default} for field, default in self.numerical],
+        }
+
+    def encode(self, rows):
+        """Input dicts -> packed records (what the Node side sends)"""
+        records = np.zeros(len(rows), dtype=self.dtype)
+        for i, (field, categories, default) in enumerate(self.categorical):
+            lookup = {value: j for j, value in enumerate(categories)}
+            records['codes'][:, i] = [lookup.get(row.get(field, default), 0) for row in rows]
+        for i, (field, default) in enumerate(self.numerical):
+            records['values'][:, i] = [row.get(field, default) for row in rows]
+        return records.tobytes()
+
+    def decode(self, body, count):
+        if len(body) != count * self.record_size:
+            raise ProtocolError(f"Expected {count} x {self.record_size}-byte {self.model} records, "
+                                f"got {len(body)} bytes")
+        return np.frombuffer(body, dtype=self.dtype, count=count)
+
+    @property
+    def n_features(self):
+        return self.n_onehot + len(self.numerical) if self.one_hot else len(self.categorical) + len(self.numerical)
+
+    def features(self, records):
+        """Packed records -> the (N, features) matrix preprocess_batch would build"""
+        finite = np.isfinite(records['values'])
+        if not finite.all():
+            # Rejected like the JSON path does (preprocess_batch)
+            field = self.numerical[int(np.argwhere(~finite)[0][1])][0]
+            raise ValueError(f"Numeric input '{field}' must be a finite number")
+        return self.matrix(records['codes'], records['values'])
+
+    def matrix(self, codes, values, out=None):
+        """(N, categorical) codes and (N, numerical) raw values -> feature matrix, optionally into ``out``"""
+        codes = codes.astype(np.int64)
+        # Unknown codes fall back to the first category, as in the JSON path
+        for i, (_, categories, _) in enumerate(self.categorical):
+            codes[(codes[:, i] < 0) | (codes[:, i] >= len(categories)), i] = 0
+        rows = len(codes)
+        if out is None:
+            out = np.empty((rows, self.n_features), dtype=np.float32)
+        if self.one_hot:
+            out[:, :self.n_onehot] = 0.0
+            out[np.arange(rows)[:, None], self.offsets + codes] = 1.0
+            out[:, self.n_onehot:] = (values.astype(np.float64) - self.mean) / self.scale
+            return out
+        features = np.stack([codes[:, 0], values[:, 0], codes[:, 1], values[:, 1]], axis=1).astype(np.float32)
+        out[:] = (features - self.mean) / self.scale
+        return out
+
+    def results(self, predictions):
+        """Model outputs -> packed float32 response body"""
+        predictions = np.asarray(predictions, dtype=np.float32).reshape(-1)
+        floor = PREDICTION_FLOOR[self.model]
+        if floor is not None:
+            predictions = np.maximum(predictions, floor)
+        return predictions.astype('<f4').tobytes()
+
+
+def encode_request(request_id, op, model, count=0, body=b''):
+    payload = HEADER.pack(request_id, op, MODEL_CODES[model], PROTOCOL_VERSION, count) + body
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode_request(payload):
+    """-> (request_id, op, model name, count, body)"""
+    if len(payload) < HEADER.size:
+        raise ProtocolError(f"Frame of {len(payload)} bytes is shorter than the header")
+    request_id, op, model_code, version, count = HEADER.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if model_code not in MODEL_NAMES:
+        raise ProtocolError(f"Unknown model code {model_code}")
+    return request_id, op, MODEL_NAMES[model_code], count, memoryview(payload)[HEADER.size:]
+
+
+def encode_response(request_id, op, body=b'', count=None, status=STATUS_OK):
+    if count is None:
+        count = len(body)
+    payload = HEADER.pack(request_id, status, op, PROTOCOL_VERSION, count) + body
+    return LENGTH.pack(len(payload)) + payload
+
+
+def encode_error(request_id, op, message):
+    body = str(message).encode('utf-8')
+    return encode_response(request_id, op, body, len(body), STATUS_ERROR)
+
+
+def decode_response(payload):
+    """-> (request_id, status, op, count, body); float32 results for an OK score"""
+    request_id, status, op, version, count = HEADER.unpack_from(payload)
+    body = bytes(payload[HEADER.size:])
+    if status == STATUS_OK and op == OP_SCORE:
+        return request_id, status, op, count, np.frombuffer(body, dtype='<f4', count=count)
+    return request_id, status, op, count, body.decode('utf-8')
+
+
+def _check_length(length):
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_FRAME_BYTES}-byte limit")
+
+
+def read_frame(stream):
+    """Next payload from a binary stream, or None at a clean end of stream"""
+    prefix = stream.read(LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < LENGTH.size:
+        raise ProtocolError('Truncated frame length')
+    length, = LENGTH.unpack(prefix)
+    _check_length(length)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ProtocolError('Truncated frame')
+    return payload
+
+
+async def read_frame_async(reader):
+    """asyncio counterpart of read_frame"""
+    import asyncio
+    try:
+        prefix = await reader.readexactly(LENGTH.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ProtocolError('Truncated frame length')
+    length, = LENGTH.unpack(prefix)
+    _check_length(length)
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError('Truncated frame')
+
+
+def handle_request(payload, layouts, predict):
+    """Answer one request payload; ``layouts(model)`` gives the RecordLayout, ``predict(model, X)`` scores"""
+    request_id, op = 0, OP_SCORE
+    try:
+        request_id, op, model, count, body = decode_request(payload)
+        layout = layouts(model)
+        if op == OP_LAYOUT:
+            return encode_response(request_id, op, json.dumps(layout.to_json()).encode('utf-8'))
+        if op != OP_SCORE:
+            raise ProtocolError(f"Unknown op {op}")
+        features = layout.features(layout.decode(body, count))
+        return encode_response(request_id, op, layout.results(predict(model, features)[:, 0]), count)
+    except Exception as e:
+        return encode_error(request_id, op, e)
+
+
+def serve_stdio(model, metadata, stdin=None, stdout=None):
+    """``--binary`` mode of a one-shot script: answer every frame on stdin, then exit"""
+    from pathlib import Path
+    from inference_core import ModelRunner
+    from model_registry import resolve_model_files
+
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    model_path, _ = resolve_model_files(model)
+    runner = ModelRunner(Path(model_path).read_bytes())
+    layout = RecordLayout(model, metadata)
+
+    def layouts(name):
+        if name != model:
+            raise ProtocolError(f"This script serves {model}, not {name}")
+        return layout
+
+    while True:
+        payload = read_frame(stdin)
+        if payload is None:
+            break
+        stdout.write(handle_request(payload, layouts, lambda name, features: runner.predict(features)))
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary wire format helpers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    layout_parser = commands.add_parser('layout', help='Print the record layout for a model as JSON')
+    layout_parser.add_argument('model', choices=sorted(MODEL_CODES))
+    args = parser.parse_args()
+    if args.command == 'layout':
+        from inference_core import scoring_module
+        metadata = scoring_module(args.model).load_metadata()
+        print(json.dumps(RecordLayout(args.model, metadata).to_json(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
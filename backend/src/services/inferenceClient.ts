@@ -0,0 +1,154 @@
+import net from 'net';
+
+type ModelName = 'carbon' | 'future' | 'recommendation';
+
+interface PendingRequest {
+  resolve: (value: any) => void;
+  reject: (reason: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
+/**
+ * The socket transport failed (no server, dropped connection or an unreadable
+ * response), as opposed to the server reporting an error for the request.
+ * Callers can fall back to spawning the inference script.
+ */
+export class InferenceConnectionError extends Error {
+  constructor(message: string) {
+    super(message);
+    this.name = 'InferenceConnectionError';
+  }
+}
+
+/**
+ * Persistent, pipelined client for scripts/inference_server.py.
+ * Requests are newline-delimited JSON tagged with an id; responses may arrive
+ * out of order and are matched back by id.
+ */
+export class InferenceSocketClient {
+  private socket: net.Socket | null = null;
+  private connecting: Promise<net.Socket> | null = null;
+  private pending = new Map<number, PendingRequest>();
+  private nextId = 1;
+  private buffer = '';
+
+  constructor(private socketPath: string, private timeoutMs = 10000) {}
+
+  async score(model: ModelName, input: any): Promise<any> {
+    return this.request({ model, input });
+  }
+
+  async request(payload: Record<string, any>): Promise<any> {
+    let socket: net.Socket;
+    try {
+      socket = await this.connect();
+    } catch (error) {
+      throw new InferenceConnectionError(`Cannot reach inference server: ${(error as Error).message}`);
+    }
+    const id = this.nextId++;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Inference request ${id} timed out after ${this.timeoutMs}ms`));
+      }, this.timeoutMs);
+
+      this.pending.set(id, { resolve, reject, timer });
+      socket.write(JSON.stringify({ id, ...payload }) + '\n');
+    });
+  }
+
+  close(): void {
+    this.socket?.end();
+    this.socket = null;
+  }
+
+  private connect(): Promise<net.Socket> {
+    if (this.socket) {
+      return Promise.resolve(this.socket);
+    }
+    if (!this.connecting) {
+      this.connecting = new Promise((resolve, reject) => {
+        const socket = net.createConnection(this.socketPath);
+        let connected = false;
+        socket.setEncoding('utf-8');
+        socket.once('connect', () => {
+          connected = true;
+          this.socket = socket;
+          this.connecting = null;
+          resolve(socket);
+        });
+        socket.on('error', (error) => {
+          // Before 'connect' this fails the connection attempt; afterwards 'close'
+          // follows and fails whatever is still pending
+          if (!connected) {
+            this.connecting = null;
+            reject(error);
+          }
+        });
+        socket.on('data', (chunk: string) => this.onData(chunk));
+        socket.on('close', () => this.onClose(socket));
+      });
+    }
+    return this.connecting;
+  }
+
+  private onData(chunk: string): void {
+    this.buffer += chunk;
+    let newline = this.buffer.indexOf('\n');
+    while (newline >= 0) {
+      const line = this.buffer.slice(0, newline);
+      this.buffer = this.buffer.slice(newline + 1);
+      newline = this.buffer.indexOf('\n');
+      if (!line.trim()) {
+        continue;
+      }
+
+      let response: any;
+      try {
+        response = JSON.parse(line);
+      } catch (error) {
+        // The stream is out of sync; drop the connection so pending requests fail
+        // over and the next request reconnects
+        this.failConnection(`Unreadable response from inference server: ${(error as Error).message}`);
+        return;
+      }
+      const request = this.pending.get(response.id);
+      if (!request) {
+        continue;
+      }
+      this.pending.delete(response.id);
+      clearTimeout(request.timer);
+      if (response.error) {
+        request.reject(new Error(response.error));
+      } else {
+        request.resolve(response.result);
+      }
+    }
+  }
+
+  private failConnection(reason: string): void {
+    const socket = this.socket;
+    this.rejectPending((id) => `${reason} (request ${id})`);
+    this.socket = null;
+    this.buffer = '';
+    socket?.destroy();
+  }
+
+  private onClose(socket: net.Socket): void {
+    if (this.socket !== null && this.socket !== socket) {
+      return;  // an older connection; a newer one has taken over
+    }
+    this.socket = null;
+    this.buffer = '';
+    this.rejectPending((id) => `Inference server connection closed before request ${id} completed`);
+  }
+
+  private rejectPending(message: (id: number) => string): void {
+    for (const [id, request] of this.pending) {
+      clearTimeout(request.timer);
+      request.reject(new InferenceConnectionError(message(id)));
+    }
+    this.pending.clear();
+  }
+}
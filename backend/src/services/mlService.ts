@@ -1,6 +1,16 @@
 import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs';
+import crypto from 'crypto';
+import { InferenceConnectionError, InferenceSocketClient } from './inferenceClient';
+import {
+  FrameReader,
+  ModelName,
+  decodeLayout,
+  decodeScores,
+  encodeLayoutRequest,
+  encodeScoreRequest,
+} from './wireFormat';
 
 export interface RecommendationInput {
   commute_mode: string;
@@ -76,10 +86,15 @@ export interface FuturePredictionInput {
 class MLService {
   private mlModelsPath: string;
   private pythonScriptPath: string;
+  private inferenceClient: InferenceSocketClient | null;
 
   constructor() {
     this.mlModelsPath = path.join(__dirname, '../ml_models');
     this.pythonScriptPath = path.join(__dirname, '../../scripts');
+    // Share one inference_server.py per host when its socket is configured
+    this.inferenceClient = process.env.ML_INFERENCE_SOCKET
+      ? new InferenceSocketClient(process.env.ML_INFERENCE_SOCKET)
+      : null;
     this.ensureDirectoriesExist();
   }
 
@@ -126,9 +141,99 @@ class MLService {
     });
   }
 
+  // Batch scoring over the binary framing (scripts/wire_format.py): the script first
+  // answers a layout request, then scores every input in one packed frame.
+  private async runPythonScriptBinary(scriptName: string, model: ModelName, inputs: any[]): Promise<number[]> {
+    return new Promise((resolve, reject) => {
+      const scriptPath = path.join(this.pythonScriptPath, scriptName);
+      const python = spawn('python3', [scriptPath, '--binary'], {
+        stdio: ['pipe', 'pipe', 'pipe']
+      });
+      const reader = new FrameReader();
+      let stderr = '';
+      let scores: number[] | null = null;
+
+      python.stdout.on('data', (data: Buffer) => {
+        for (const response of reader.push(data)) {
+          try {
+            if (response.id === 1) {
+              python.stdin.write(encodeScoreRequest(2, decodeLayout(response), inputs));
+              python.stdin.end();
+            } else {
+              scores = decodeScores(response);
+            }
+          } catch (error) {
+            python.kill();
+            reject(error);
+          }
+        }
+      });
+
+      python.stderr.on('data', (data) => {
+        stderr += data.toString();
+      });
+
+      // EPIPE when the script exits before reading its frames; 'close' then reports the failure
+      python.stdin.on('error', (error) => {
+        stderr += `stdin: ${error.message}\n`;
+      });
+      python.on('error', reject);
+
+      python.on('close', (code) => {
+        if (scores) {
+          resolve(scores);
+        } else {
+          reject(new Error(`Python script failed with code ${code}: ${stderr}`));
+        }
+      });
+
+      python.stdin.write(encodeLayoutRequest(1, model));
+    });
+  }
+
+  /**
+   * Score many inputs for one model in a single script run. Returns the raw emission
+   * estimate per input (no rounding, and no recommendations for the recommendation model).
+   */
+  async predictBatch(model: ModelName, inputs: any[]): Promise<number[]> {
+    const scripts: Record<ModelName, string> = {
+      carbon: 'carbon_inference.py',
+      future: 'future_inference.py',
+      recommendation: 'enhanced_recommendation_inference.py',
+    };
+    if (inputs.length === 0) {
+      return [];
+    }
+    try {
+      return await this.runPythonScriptBinary(scripts[model], model, inputs);
+    } catch (error) {
+      console.error(`Error in ${model} batch inference:`, error);
+      throw new Error(`Failed to score ${model} batch`);
+    }
+  }
+
+  private async runModel(
+    model: 'carbon' | 'future' | 'recommendation',
+    scriptName: string,
+    input: any
+  ): Promise<any> {
+    if (this.inferenceClient) {
+      try {
+        return await this.inferenceClient.score(model, input);
+      } catch (error) {
+        if (!(error instanceof InferenceConnectionError)) {
+          throw error;
+        }
+        // The shared server is unavailable; score this request in a one-off process
+        console.warn(`Inference server unavailable, spawning ${scriptName}:`, error.message);
+      }
+    }
+    return this.runPythonScript(scriptName, input);
+  }
+
   async getRecommendations(input: RecommendationInput): Promise<RecommendationOutput> {
     try {
-      const result = await this.runPythonScript('enhanced_recommendation_inference.py', input);
+      const result = await this.runModel('recommendation', 'enhanced_recommendation_inference.py', input);
       return result;
     } catch (error) {
       console.error('Error in recommendation inference:', error);
@@ -138,7 +243,7 @@ class MLService {
 
   async predictCarbonEmission(input: CarbonEmissionInput): Promise<{ emission: number }> {
     try {
-      const result = await this.runPythonScript('carbon_inference.py', input);
+      const result = await this.runModel('carbon', 'carbon_inference.py', input);
       return result;
     } catch (error) {
       console.error('Error in carbon emission prediction:', error);
@@ -148,7 +253,7 @@ class MLService {
 
   async predictFutureEmission(input: FuturePredictionInput): Promise<{ future_emission: number }> {
     try {
-      const result = await this.runPythonScript('future_inference.py', input);
+      const result = await this.runModel('future', 'future_inference.py', input);
       return result;
     } catch (error) {
       console.error('Error in future emission prediction:', error);
@@ -156,6 +261,31 @@ class MLService {
     }
   }
 
+  // Check every model version listed in registry.json against its content hash
+  private verifyRegistry(): boolean {
+    const manifestPath = path.join(this.mlModelsPath, 'registry.json');
+    if (!fs.existsSync(manifestPath)) {
+      return true;
+    }
+
+    const manifest = JSON.parse(fs.readFileSync(manifestPath, 'utf-8'));
+    for (const [name, entry] of Object.entries<any>(manifest.models || {})) {
+      for (const [kind, file] of Object.entries<any>(entry.files || {})) {
+        const filePath = path.join(this.mlModelsPath, file.path);
+        if (!fs.existsSync(filePath)) {
+          console.error(`Registry ${name} ${kind} file not found: ${filePath}`);
+          return false;
+        }
+        const digest = crypto.createHash('sha256').update(fs.readFileSync(filePath)).digest('hex');
+        if (digest !== file.sha256) {
+          console.error(`Registry ${name} ${kind} hash mismatch (version ${entry.version})`);
+          return false;
+        }
+      }
+    }
+    return true;
+  }
+
   // Health check method
   async healthCheck(): Promise<boolean> {
     try {
@@ -174,7 +304,7 @@ class MLService {
         }
       }
 
-      return true;
+      return this.verifyRegistry();
     } catch (error) {
       console.error('ML Service health check failed:', error);
       return false;
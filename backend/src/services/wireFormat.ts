@@ -0,0 +1,117 @@
+/**
+ * Node side of the binary framing in scripts/wire_format.py.
+ * Frames are a little-endian uint32 length plus a payload with a 12-byte header:
+ *   request:  uint32 id | uint8 op | uint8 model | uint16 version | uint32 count | records
+ *   response: uint32 id | uint8 status | uint8 op | uint16 version | uint32 count | body
+ * A record is one uint8 category code per categorical input and then one float32 per
+ * numeric input, in the order given by the layout the Python side derives from the meta file.
+ */
+
+export type ModelName = 'carbon' | 'future' | 'recommendation';
+
+export const PROTOCOL_VERSION = 1;
+export const OP_SCORE = 0;
+export const OP_LAYOUT = 1;
+export const STATUS_OK = 0;
+
+const HEADER_SIZE = 12;
+const MODEL_CODES: Record<ModelName, number> = { carbon: 0, future: 1, recommendation: 2 };
+
+export interface RecordLayout {
+  model: ModelName;
+  version: number;
+  record_size: number;
+  categorical: { field: string; categories: string[]; default: string | null }[];
+  numerical: { field: string; default: number | null }[];
+}
+
+export interface Frame {
+  id: number;
+  status: number;
+  op: number;
+  count: number;
+  body: Buffer;
+}
+
+function frame(id: number, op: number, model: ModelName, count: number, body: Buffer): Buffer {
+  const header = Buffer.alloc(4 + HEADER_SIZE);
+  header.writeUInt32LE(HEADER_SIZE + body.length, 0);
+  header.writeUInt32LE(id, 4);
+  header.writeUInt8(op, 8);
+  header.writeUInt8(MODEL_CODES[model], 9);
+  header.writeUInt16LE(PROTOCOL_VERSION, 10);
+  header.writeUInt32LE(count, 12);
+  return Buffer.concat([header, body]);
+}
+
+export function encodeLayoutRequest(id: number, model: ModelName): Buffer {
+  return frame(id, OP_LAYOUT, model, 0, Buffer.alloc(0));
+}
+
+export function encodeScoreRequest(id: number, layout: RecordLayout, inputs: Record<string, any>[]): Buffer {
+  const body = Buffer.alloc(inputs.length * layout.record_size);
+  const lookups = layout.categorical.map(({ categories }) => new Map(categories.map((value, i) => [value, i])));
+
+  inputs.forEach((input, row) => {
+    let offset = row * layout.record_size;
+    layout.categorical.forEach(({ field, default: fallback }, i) => {
+      // Unknown values fall back to the first category, as in the JSON path
+      body.writeUInt8(lookups[i].get(input[field] ?? fallback) ?? 0, offset);
+      offset += 1;
+    });
+    layout.numerical.forEach(({ field, default: fallback }) => {
+      const value = Number(input[field] ?? fallback ?? 0);
+      // Rejected like the JSON path does; float32 overflow would arrive as infinity
+      if (!Number.isFinite(Math.fround(value))) {
+        throw new Error(`Numeric input '${field}' must be a finite number`);
+      }
+      body.writeFloatLE(value, offset);
+      offset += 4;
+    });
+  });
+  return frame(id, OP_SCORE, layout.model, inputs.length, body);
+}
+
+/** Splits a byte stream into frames */
+export class FrameReader {
+  private buffer = Buffer.alloc(0);
+
+  push(chunk: Buffer): Frame[] {
+    this.buffer = Buffer.concat([this.buffer, chunk]);
+    const frames: Frame[] = [];
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32LE(0);
+      if (this.buffer.length < 4 + length) {
+        break;
+      }
+      const payload = this.buffer.subarray(4, 4 + length);
+      frames.push({
+        id: payload.readUInt32LE(0),
+        status: payload.readUInt8(4),
+        op: payload.readUInt8(5),
+        count: payload.readUInt32LE(8),
+        body: Buffer.from(payload.subarray(HEADER_SIZE)),
+      });
+      this.buffer = this.buffer.subarray(4 + length);
+    }
+    return frames;
+  }
+}
+
+export function decodeScores(response: Frame): number[] {
+  if (response.status !== STATUS_OK) {
+    throw new Error(response.body.toString('utf-8'));
+  }
+  const scores: number[] = [];
+  for (let i = 0; i < response.count; i++) {
+    scores.push(response.body.readFloatLE(i * 4));
+  }
+  return scores;
+}
+
+export function decodeLayout(response: Frame): RecordLayout {
+  if (response.status !== STATUS_OK) {
+    throw new Error(response.body.toString('utf-8'));
+  }
+  return JSON.parse(response.body.toString('utf-8'));
+}